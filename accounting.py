@@ -0,0 +1,44 @@
+"""Parse amounts written as accounting numbers into int64 arrays
+
+The WGI platform-api, the IRS extracts and spreadsheets exported from them
+write amounts as '1234', '1,234', '$1,234.00', '(1,234)' or '-1234' for
+negatives and '-' for zero. parse_amounts converts a whole column at once:
+
+    values, missing = parse_amounts(['1,234', '(56)', '-', '', 'n/a'])
+    # values [1234, -56, 0, 0, 0], missing [False, False, False, True, True]
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# '-' or '(-)' stands for zero
+DASH = r'^\(?\s*-+\s*\)?$'
+# signs and decoration around the digits
+DECORATION = r'[\s$,()+-]'
+NUMBER = r'^(\d+\.?\d*|\.\d+)$'
+
+
+def parse_amounts(values):
+    """int64 amounts and the mask of values that are blank or not a number (set to 0)"""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        numbers = values.to_numpy(dtype='float64', na_value=np.nan)
+    else:
+        text = pc.utf8_trim_whitespace(pa.array(values.astype('string'), type=pa.string(), from_pandas=True))
+        negative = pc.or_(pc.and_(pc.starts_with(text, '('), pc.ends_with(text, ')')),
+                          pc.or_(pc.starts_with(text, '-'), pc.ends_with(text, '-')))
+        digits = pc.replace_substring_regex(text, DECORATION, '')
+        digits = pc.if_else(pc.match_substring_regex(digits, NUMBER), digits, pa.scalar(None, pa.string()))
+        numbers = pc.cast(digits, pa.float64())
+        numbers = pc.if_else(negative, pc.negate(numbers), numbers)
+        numbers = pc.if_else(pc.match_substring_regex(text, DASH), 0.0, numbers)
+        numbers = numbers.to_numpy(zero_copy_only=False)
+    missing = np.isnan(numbers)
+    return np.where(missing, 0, np.round(numbers)).astype('int64'), missing
+
+
+def to_int64(values):
+    """parse_amounts as a nullable Int64 array, <NA> where the value is missing"""
+    return pd.arrays.IntegerArray(*parse_amounts(values))
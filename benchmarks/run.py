@@ -0,0 +1,138 @@
+"""Time and memory-profile the stages of tec.py on synthetic data served locally
+
+    python -m benchmarks.run --rows 10000 100000 --output bench.json
+
+Each scale generates a data set with benchmarks.synthetic, serves it with
+benchmarks.stub_server and runs the pipeline stages against it in a scratch
+directory. `--snapshot record` also saves the responses of the stand-in in a
+bundle per scale (see snapshot.py), `--snapshot replay` then runs the same
+stages from the bundles without starting it. Peak RSS is reset before each
+stage on Linux; stages that use worker processes also report the largest
+child peak.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import argparse
+import importlib.util
+import tempfile
+import contextlib
+from pathlib import Path
+
+import tec
+from config import Config
+from writers import FORMATS
+from profiling import reset_peak_rss, peak_rss
+from benchmarks.synthetic import generate
+from benchmarks.stub_server import StubServer
+
+
+# port of the stand-in while a snapshot is recorded, the URLs replayed from the bundle name it
+SNAPSHOT_PORT = 8800
+
+
+def measure(results, stage, rows, func, *args, **kwargs):
+    reset_peak_rss()
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = func(*args, **kwargs)
+    results.append({
+        'stage': stage,
+        'rows': rows,
+        'wall_s': round(time.perf_counter() - wall, 3),
+        'cpu_s': round(time.process_time() - cpu, 3),
+        'peak_rss_mb': round(peak_rss() / 2**20, 1),
+        'children_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 2**10, 1),
+    })
+    print(f'{stage:<28} {results[-1]["wall_s"]:>8.2f}s wall {results[-1]["cpu_s"]:>8.2f}s cpu '
+          f'{results[-1]["peak_rss_mb"]:>8.1f}MB peak', file=sys.__stdout__)
+    return result
+
+
+def snapshot_url(path=''):
+    return f'http://127.0.0.1:{SNAPSHOT_PORT}{path}'
+
+
+def point_tec_at(url, work_dir, snapshot=None, snapshot_dir=None):
+    """Redirect the URLs and folders of tec to the stand-in at `url(path)` and a scratch directory"""
+    run_config = tec.configure(Config(
+        root=work_dir,
+        irs_src_url=url('/irs/soi'),
+        irs_org_list=url('/irs/eo-bmf'),
+        wgi_url=url('/wgi/'),
+        wgi_api_base=url('/wgi/platform-api/'),
+        snapshot=snapshot,
+        snapshot_dir=snapshot_dir,
+    ))
+    for folder in [run_config.input_folder / 'WGI', run_config.output_folder]:
+        os.makedirs(folder, exist_ok=True)
+    return run_config
+
+
+def run_scale(rows, year, data_root, quiet=True, snapshot=None, snapshot_dir=None):
+    results = []
+    data_dir = data_root / f'data_{rows}'
+    if not data_dir.exists():
+        print(f'Generating {rows} rows in {data_dir}', file=sys.__stdout__)
+        generate(data_dir, rows=rows, year=year)
+    work_dir = data_root / f'work_{rows}'
+    shutil.rmtree(work_dir, ignore_errors=True)
+    output = open(os.devnull, 'w') if quiet else None
+    if snapshot == 'replay':
+        server = contextlib.nullcontext()
+    else:
+        server = StubServer(data_dir, year, port=SNAPSHOT_PORT if snapshot else 0)
+    with server, contextlib.redirect_stdout(output or sys.stdout), contextlib.redirect_stderr(output or sys.stderr):
+        run_config = point_tec_at(snapshot_url if snapshot else server.url, work_dir, snapshot,
+                                  snapshot_dir / f'rows_{rows}' if snapshot else None)
+        scratch = work_dir / 'scratch.xlsx'
+        shutil.copy(data_dir / f'Form 990 Extract XLSX ({year}).xlsx', scratch)
+        measure(results, 'xlsx_to_csv', rows, tec.xlsx_to_csv, scratch)
+        soi_data = measure(results, 'download_raw_data (cold)', rows, tec.download_raw_data, year)
+        measure(results, 'download_raw_data (warm)', rows, tec.download_raw_data, year)
+        tec.configure(wgi_file=measure(results, 'get_latest_wgi', rows, tec.get_latest_wgi))
+        measure(results, 'get_gba_orgs (cold)', rows, tec.get_gba_orgs)
+        measure(results, 'get_gba_orgs (EIN cache)', rows, tec.get_gba_orgs, force=True)
+        measure(results, 'get_gba_orgs (cached)', rows, tec.get_gba_orgs)
+        ma_orgs_file = measure(results, 'get_ma_orgs_list', rows, tec.get_ma_orgs_list)
+        gb_orgs_file = run_config.output_folder / 'greater_boston_orgs.csv'
+        for label in ['generate_report', 'generate_report (cached)']:
+            measure(results, label, rows, tec.generate_report, year, soi_data, ma_orgs_file, gb_orgs_file)
+        for report_format in FORMATS.values():
+            if report_format.name == 'csv.zst' and importlib.util.find_spec('zstandard') is None:
+                continue
+            tec.configure(report_format=report_format.name)
+            measure(results, f'generate_report ({report_format.name})', rows, tec.generate_report,
+                    year, soi_data, ma_orgs_file, gb_orgs_file, force=True)
+            ma_report = run_config.output_folder / f'{year}' / f'MA_orgs_report{year}{report_format.suffix}'
+            results[-1]['ma_report_mb'] = round(os.path.getsize(ma_report) / 2**20, 2)
+        tec.configure(report_format='csv')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000],
+                        help='Form 990 extract sizes to benchmark, 10000 to 1000000')
+    parser.add_argument('--year', type=int, default=2021)
+    parser.add_argument('--data-dir', type=Path, help='keep generated data here between runs')
+    parser.add_argument('--output', type=Path, help='write the results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='show the output of the pipeline')
+    parser.add_argument('--snapshot', choices=['record', 'replay'],
+                        help='record the responses of the stand-in, or replay them without starting it')
+    parser.add_argument('--snapshot-dir', type=Path, default=Path('snapshots/benchmarks'),
+                        help='directory of the bundles, one per scale')
+    args = parser.parse_args()
+
+    data_root = args.data_dir or Path(tempfile.mkdtemp(prefix='wgi_bench_'))
+    results = []
+    for rows in args.rows:
+        results += run_scale(rows, args.year, data_root, quiet=not args.verbose,
+                             snapshot=args.snapshot, snapshot_dir=args.snapshot_dir)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if not args.data_dir:
+        shutil.rmtree(data_root, ignore_errors=True)
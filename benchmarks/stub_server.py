@@ -0,0 +1,181 @@
+"""Local stand-in for the IRS pages and the WGI site / platform-api
+
+Serves the files written by benchmarks.synthetic:
+
+    /irs/soi                                  SOI annual extract page
+    /irs/eo-bmf                               EO BMF page
+    /files/<name>                             downloads (ETag, Last-Modified and Range support)
+    /wgi/                                     WGI home page with 'Download The List'
+    /wgi/platform-api/search/base-search      paginated organizations
+    /wgi/platform-api/organization/<id>       organization details
+
+    python -m benchmarks.stub_server bench_data --port 8800
+"""
+import os
+import json
+import argparse
+import threading
+from pathlib import Path
+from email.utils import formatdate
+from urllib.parse import urlparse, parse_qs, quote, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # set by StubServer
+    data_dir = None
+    year = None
+    orgs = None
+    orgs_by_id = None
+    # base-search behaviour, see StubServer
+    page_cap = None
+    send_total = True
+    ignore_page = False
+    # path -> statuses answered, one per request, before the path is served
+    failures = None
+    # paths of the requests received, in order
+    requests = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def url(self, path):
+        return f'http://{self.headers["Host"]}{path}'
+
+    def send_body(self, body, content_type='text/html', status=200, headers=None):
+        body = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if self.failures.get(url.path):
+            self.send_body('{}', 'application/json', self.failures[url.path].pop(0), {'Retry-After': '0'})
+            return
+        if url.path == '/irs/soi':
+            links = ''.join(f'<a href="{self.url("/files/" + quote(f.name))}">{f.stem.rsplit(" (", 1)[0]}</a>'
+                            for f in sorted(self.data_dir.glob(f'Form *({self.year}).xlsx')))
+            self.send_body(f'<h2>Exempt Organization Returns Filed in Calendar Year {self.year}</h2>'
+                           f'<table><tr><td>{links}</td></tr></table>')
+        elif url.path == '/irs/eo-bmf':
+            self.send_body(f'<a href="{self.url("/files/eo_ma.csv")}">Massachusetts</a>')
+        elif url.path == '/wgi/':
+            self.send_body(f'<a href="{self.url("/files/WGI_List.xlsx")}">Download The List</a>')
+        elif url.path.startswith('/files/'):
+            self.send_file(self.data_dir / unquote(url.path[len('/files/'):]))
+        elif url.path == '/wgi/platform-api/search/base-search':
+            page, per_page = int(query['page'][0]), int(query['perPage'][0])
+            page = 1 if self.ignore_page else page
+            per_page = min(per_page, self.page_cap or per_page)
+            body = {'data': self.orgs[(page - 1) * per_page:page * per_page]}
+            if self.send_total:
+                body['total'] = len(self.orgs)
+            self.send_body(json.dumps(body), 'application/json')
+        elif url.path.startswith('/wgi/platform-api/organization/'):
+            org = self.orgs_by_id.get(url.path.rsplit('/', 1)[1])
+            if org is None:
+                self.send_body('{}', 'application/json', status=404)
+            else:
+                self.send_body(json.dumps(org), 'application/json')
+        else:
+            self.send_body('not found', 'text/plain', status=404)
+
+    def send_file(self, path):
+        if not path.is_file():
+            self.send_body('not found', 'text/plain', status=404)
+            return
+        stat = os.stat(path)
+        headers = {
+            'ETag': f'"{stat.st_size:x}-{int(stat.st_mtime):x}"',
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+            'Accept-Ranges': 'bytes',
+        }
+        if self.headers.get('If-None-Match') == headers['ETag']:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            for name in ('ETag', 'Last-Modified'):
+                self.send_header(name, headers[name])
+            self.end_headers()
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        status = 200
+        ranges = self.headers.get('Range')
+        if ranges and ranges.startswith('bytes=') and self.headers.get('If-Range') in (None, headers['ETag']):
+            start = int(ranges[len('bytes='):].split('-')[0])
+            if start >= len(body):
+                headers['Content-Range'] = f'bytes */{len(body)}'
+                self.send_body(b'', 'application/octet-stream', 416, headers)
+                return
+            headers['Content-Range'] = f'bytes {start}-{len(body) - 1}/{len(body)}'
+            body, status = body[start:], 206
+        self.send_body(body, 'application/octet-stream', status, headers)
+
+
+class StubServer:
+    """Serve `data_dir` on localhost in a background thread
+
+        with StubServer('bench_data') as server:
+            tec.configure(irs_src_url=server.url('/irs/soi'))
+
+    The base-search endpoint can stand in for servers that return at most
+    `page_cap` organizations per page, omit the total (`send_total=False`)
+    or always send the first page (`ignore_page=True`). `failures` maps a
+    path to the error statuses of its first requests, {path: [429, 503]}
+    answers 429 then 503 before serving it. The paths of the requests
+    received are kept in `requests`.
+    """
+
+    def __init__(self, data_dir, year=2021, port=0, page_cap=None, send_total=True, ignore_page=False,
+                 failures=None):
+        data_dir = Path(data_dir)
+        with open(data_dir / 'wgi_orgs.json') as f:
+            orgs = json.load(f)
+        self.requests = []
+        handler = type('Handler', (StubHandler,), {
+            'data_dir': data_dir,
+            'year': year,
+            'orgs': orgs,
+            'orgs_by_id': {str(org['organizationId']): org for org in orgs},
+            'page_cap': page_cap,
+            'send_total': send_total,
+            'ignore_page': ignore_page,
+            'failures': {path: list(statuses) for path, statuses in (failures or {}).items()},
+            'requests': self.requests,
+        })
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path=''):
+        return f'http://127.0.0.1:{self.httpd.server_port}{path}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', type=Path)
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--year', type=int, default=2021)
+    args = parser.parse_args()
+    with StubServer(args.directory, args.year, args.port) as server:
+        print(f'Serving {args.directory} on {server.url()}')
+        server.thread.join()
@@ -0,0 +1,202 @@
+"""Synthetic inputs shaped like the IRS SOI extracts, the MA EO BMF and the WGI list
+
+    python -m benchmarks.synthetic bench_data --rows 100000
+"""
+import os
+import zipfile
+import itertools
+import argparse
+from pathlib import Path
+from xml.sax.saxutils import escape
+import numpy as np
+import pandas as pd
+from zipcodes import greater_boston_zipcodes
+
+
+WORDS = ['WOMENS', 'GIRLS', 'FUND', 'BOSTON', 'ASSOCIATION', 'FOUNDATION', 'CENTER', 'SOCIETY',
+         'COMMUNITY', 'ALLIANCE', 'HEALTH', 'ARTS', 'YOUTH', 'CLUB', 'NETWORK', 'INC', 'TRUST',
+         'LEAGUE', 'PROJECT', 'COUNCIL']
+CITIES = ['BOSTON', 'CAMBRIDGE', 'SOMERVILLE', 'WORCESTER', 'SPRINGFIELD', 'LOWELL', 'QUINCY',
+          'NEWTON', 'LYNN', 'BROCKTON', 'SALEM', 'PITTSFIELD']
+# the SOI extracts have a few hundred columns, only a handful are read
+FILLER_COLUMNS = 40
+
+
+def random_names(rng, n, words=3):
+    parts = rng.choice(WORDS, size=(n, words))
+    return pd.Series([' '.join(p) for p in parts])
+
+
+def random_zips(rng, n, gb_share=0.5):
+    """MA ZIP5s, `gb_share` of them in the Greater Boston Area"""
+    gb = np.array(sorted(greater_boston_zipcodes))
+    other = np.arange(1001, 2792)
+    return np.where(rng.random(n) < gb_share, rng.choice(gb, n), rng.choice(other, n))
+
+
+def amounts(rng, n, zero_share=0.3):
+    values = rng.lognormal(mean=11, sigma=2.5, size=n).astype('int64')
+    return np.where(rng.random(n) < zero_share, 0, values)
+
+
+def make_eins(rng, n):
+    """Distinct EINs (9 digits, uint32)"""
+    eins = np.unique(rng.integers(10_000_000, 999_999_999, size=int(n * 1.1) + 100))
+    return rng.permutation(eins)[:n]
+
+
+def soi_extract(rng, eins, contributions_column, ein_column='ein', filler=FILLER_COLUMNS, duplicate_share=0.02):
+    """Form 990 / 990-EZ extract, a few EINs have a second (older) return"""
+    n = len(eins)
+    duplicates = rng.choice(eins, size=int(n * duplicate_share), replace=False)
+    all_eins = np.concatenate([eins, duplicates])
+    tax_pd = np.concatenate([np.full(n, 202112), np.full(len(duplicates), 202012)])
+    df = pd.DataFrame({ein_column: all_eins, 'tax_pd': tax_pd,
+                       contributions_column: amounts(rng, len(all_eins))})
+    for i in range(filler):
+        df[f'col{i:03d}'] = rng.integers(0, 1_000_000, size=len(df))
+    return df.sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+def bmf(rng, eins):
+    """eo_ma.csv as published on the IRS EO BMF page"""
+    n = len(eins)
+    zips = random_zips(rng, n)
+    plus4 = rng.integers(0, 9999, size=n)
+    return pd.DataFrame({
+        'EIN': [f'{e:09d}' for e in eins],
+        'NAME': random_names(rng, n),
+        'ICO': '',
+        'STREET': [f'{s} MAIN ST' for s in rng.integers(1, 999, size=n)],
+        'CITY': rng.choice(CITIES, n),
+        'STATE': 'MA',
+        'ZIP': [f'{z:05d}-{p:04d}' for z, p in zip(zips, plus4)],
+        'NTEE_CD': rng.choice(['A20', 'B82', 'E20', 'P20', 'R24', 'T30', 'W30'], n),
+    })
+
+
+def wgi_orgs(rng, bmf_orgs, missing_ein_share=0.05):
+    """Organizations of the BMF as returned by the WGI base-search endpoint, some without an EIN"""
+    n = len(bmf_orgs)
+    eins = bmf_orgs['EIN'].astype('int64').to_numpy()
+    revenue = amounts(rng, n).astype(object)
+    # the API returns some revenues as accounting strings
+    styles = rng.integers(0, 4, size=n)
+    revenue[styles == 1] = [f'({v})' for v in revenue[styles == 1]]
+    revenue[styles == 2] = '-'
+    return pd.DataFrame({
+        'organizationId': np.arange(1_000_000, 1_000_000 + n),
+        'organizationName': bmf_orgs['NAME'].str.title().to_numpy(),
+        'ein': np.where(rng.random(n) < missing_ein_share, '', [f'{e // 10**7:02d}-{e % 10**7:07d}' for e in eins]),
+        'zip': bmf_orgs['ZIP'].str[:5].to_numpy(),
+        'revenue': revenue,
+        'distance': 0, 'icon': '', 'programId': 0, 'programName': '', 'redirectUrl': '', 'relevance': 0,
+    })
+
+
+def wgi_sheet(bmf_orgs):
+    return pd.DataFrame({'EIN': bmf_orgs['EIN'], 'Name': bmf_orgs['NAME']})
+
+
+def column_letter(i):
+    letters = ''
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        letters = chr(65 + r) + letters
+    return letters
+
+
+def write_xlsx(df, path):
+    """Write `df` as a single-sheet xlsx with shared strings, without a spreadsheet library"""
+    strings = {}
+    letters = [column_letter(i) for i in range(len(df.columns))]
+
+    def cell(ref, value):
+        if isinstance(value, (int, np.integer, float, np.floating)):
+            return f'<c r="{ref}"><v>{value}</v></c>'
+        index = strings.setdefault(str(value), len(strings))
+        return f'<c r="{ref}" t="s"><v>{index}</v></c>'
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        with z.open('xl/worksheets/sheet1.xml', 'w') as f:
+            f.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            rows = itertools.chain([df.columns.tolist()], df.itertuples(index=False, name=None))
+            for r, values in enumerate(rows, 1):
+                f.write((f'<row r="{r}">' + ''.join(cell(f'{letters[c]}{r}', v) for c, v in enumerate(values))
+                         + '</row>').encode())
+            f.write(b'</sheetData></worksheet>')
+        z.writestr('xl/sharedStrings.xml',
+                   '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                   '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                   + ''.join(f'<si><t>{escape(s)}</t></si>' for s in strings) + '</sst>')
+        z.writestr('[Content_Types].xml', CONTENT_TYPES)
+        z.writestr('_rels/.rels', ROOT_RELS)
+        z.writestr('xl/workbook.xml', WORKBOOK)
+        z.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+    return path
+
+
+CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>
+</Types>'''
+ROOT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>
+</Relationships>'''
+
+
+def generate(directory, rows=10_000, year=2021, seed=0):
+    """Write a synthetic data set for `year` into `directory`
+
+    `rows` is the size of the Form 990 extract; the 990-EZ extract, the BMF
+    and the WGI organizations are scaled from it.
+
+    Returns:
+        dict: name -> path of the generated files
+    """
+    rng = np.random.default_rng(seed)
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+    eins = make_eins(rng, rows * 2)
+    eins_990, eins_ez = eins[:rows], eins[rows:rows + rows // 2]
+    bmf_orgs = bmf(rng, rng.choice(eins, size=max(rows // 5, 10), replace=False))
+    wgi_bmf_orgs = bmf_orgs.sample(max(len(bmf_orgs) // 10, 10), random_state=seed)
+    orgs = wgi_orgs(rng, wgi_bmf_orgs)
+    files = {
+        'form_990': write_xlsx(soi_extract(rng, eins_990, 'totcntrbgfts'),
+                               directory / f'Form 990 Extract XLSX ({year}).xlsx'),
+        'form_990_ez': write_xlsx(soi_extract(rng, eins_ez, 'totcntrbs', ein_column='EIN'),
+                                  directory / f'Form 990-EZ Extract XLSX ({year}).xlsx'),
+        'bmf': directory / 'eo_ma.csv',
+        'wgi_orgs': directory / 'wgi_orgs.json',
+        'wgi_sheet': write_xlsx(wgi_sheet(wgi_bmf_orgs), directory / 'WGI_List.xlsx'),
+    }
+    bmf_orgs.to_csv(files['bmf'], index=False)
+    orgs.to_json(files['wgi_orgs'], orient='records')
+    return files
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', type=Path)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--year', type=int, default=2021)
+    args = parser.parse_args()
+    for name, path in generate(args.directory, args.rows, args.year).items():
+        print(f'{name}: {path}')
@@ -0,0 +1,75 @@
+"""Streaming reader of the IRS EO Business Master File extracts (eo_ma.csv, eo_ri.csv, ...)
+
+The state files share one layout. read_bmf parses a file in blocks with
+pyarrow and computes the integer ZIP5 of each row while reading. Rows outside
+of a ZIP mask are dropped before they are converted to pandas, so a county
+only run never holds the whole state file in memory:
+
+    mask = load_geography().zip_mask(county='Suffolk')
+    orgs = pd.concat(read_bmf('input_files/eo_ma.csv', zip_mask=mask))
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+from schemas import resolve
+
+
+BMF_COLUMNS = ['EIN', 'NAME', 'STREET', 'CITY', 'STATE', 'ZIP', 'NTEE_CD']
+# pandas types of the columns, ZIP is replaced by ZIP5 and ZIP4
+BMF_DTYPES = {'EIN': 'uint32', 'NAME': 'string', 'STREET': 'string',
+              'CITY': 'category', 'STATE': 'category', 'NTEE_CD': 'string'}
+# csv read per block, about 100k rows of a BMF file
+BLOCK_SIZE = 16 * 2**20
+# '02134-1234', '02134' or '2134'
+ZIP_PATTERN = r'^\s*(?P<zip5>\d{1,5})(?:-(?P<zip4>\d{1,4}))?'
+
+
+def zip_codes(zips):
+    """int64 ZIP5 and ZIP4 of a pyarrow string array, -1 when missing"""
+    parts = pc.extract_regex(zips, ZIP_PATTERN)
+    codes = []
+    for i in range(2):
+        part = pc.struct_field(parts, [i])
+        # an optional group that did not match, the ZIP4 of '02134', is extracted as ''
+        part = pc.if_else(pc.equal(part, ''), pa.scalar(None, pa.string()), part)
+        codes.append(pc.cast(part, pa.int64()).fill_null(-1).to_numpy(zero_copy_only=False))
+    return codes
+
+
+def nullable(codes, dtype):
+    return pd.arrays.IntegerArray(np.clip(codes, 0, None).astype(dtype.lower()), codes < 0).astype(dtype)
+
+
+def read_bmf(file_name, zip_mask=None, columns=BMF_COLUMNS, block_size=BLOCK_SIZE):
+    """Yield the rows of a BMF file one block at a time, as DataFrames with ZIP5 and ZIP4 instead of ZIP
+
+    Args:
+        file_name (Path): BMF extract of a state as published by the IRS
+        zip_mask (np.ndarray): boolean array indexed by ZIP5 (see geography.Geography.zip_mask),
+            rows whose ZIP is outside of it are skipped, None keeps every row
+        columns (list(str)): canonical columns to read (see schemas.py), ZIP is always read
+        block_size (int): bytes of csv parsed at a time
+    """
+    skiprows, names = resolve('BMF', file_name, list(dict.fromkeys([*columns, 'ZIP'])))
+    reader = pv.open_csv(
+        file_name,
+        read_options=pv.ReadOptions(block_size=block_size, skip_rows=skiprows),
+        convert_options=pv.ConvertOptions(
+            include_columns=list(names),
+            column_types={name: pa.uint32() if c == 'EIN' else pa.string() for name, c in names.items()}),
+    )
+    for batch in reader:
+        batch = batch.rename_columns([names[name] for name in batch.schema.names])
+        zip5, zip4 = zip_codes(batch.column('ZIP'))
+        if zip_mask is not None:
+            keep = np.zeros(len(zip5), dtype=bool)
+            known = (zip5 >= 0) & (zip5 < len(zip_mask))
+            keep[known] = zip_mask[zip5[known]]
+            batch, zip5, zip4 = batch.filter(pa.array(keep)), zip5[keep], zip4[keep]
+        df = batch.drop_columns(['ZIP']).to_pandas()
+        df = df.astype({c: t for c, t in BMF_DTYPES.items() if c in df.columns})
+        df['ZIP5'] = nullable(zip5, 'UInt32')
+        df['ZIP4'] = nullable(zip4, 'UInt16')
+        yield df
@@ -0,0 +1,84 @@
+"""Locations and endpoints of a tec.py run
+
+Paths are resolved when a Config is created, not when tec is imported, so
+the pipeline can run against another directory or a local stand-in:
+
+    import tec
+    from config import Config
+    tec.configure(Config(root='/data/wgi', irs_src_url='http://localhost:8800/irs/soi'))
+"""
+import multiprocessing
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+@dataclass
+class Config:
+    """Settings shared by the stages of tec.py, passed to worker processes as is
+
+    Args:
+        root (Path): directory holding input_files/, output_files/, cache/ and logs/, defaults to the working directory
+        wgi_file (Path): WGI list (csv or xlsx) compared with the Greater Boston report,
+            defaults to input_files/WGI/WGI_MA_Only_11_6_23.csv
+        report_format (str): format of the reports set by --format, a name of writers.FORMATS
+        max_memory (int): memory budget in bytes set by --max-memory, readers parse in chunks when it is set
+        cpus (int): CPUs the run may keep busy, defaults to os.cpu_count(). A pool hands each of
+            its workers a Config with a share of cpus and max_memory (see tec.worker_config)
+        profile_dir (Path): where hot stages write cProfile output (--profile), None to disable
+        snapshot (str): 'record' or 'replay' the HTTP responses of the run (--snapshot, see snapshot.py),
+            None for live requests only
+        snapshot_dir (Path): the snapshot bundle, defaults to snapshots/latest
+    """
+    root: Path = field(default_factory=Path.cwd)
+    state: str = 'MA'
+    wgi_url: str = 'https://wgi.communityplatform.us/'
+    wgi_api_base: str = 'https://wgi.communityplatform.us/platform-api/'
+    irs_src_url: str = 'https://www.irs.gov/statistics/soi-tax-stats-annual-extract-of-tax-exempt-organization-financial-data'
+    irs_org_list: str = 'https://www.irs.gov/charities-non-profits/exempt-organizations-business-master-file-extract-eo-bmf'
+    wgi_file: Path = None
+    report_format: str = 'csv'
+    max_memory: int = None
+    cpus: int = None
+    profile_dir: Path = None
+    snapshot: str = None
+    snapshot_dir: Path = None
+
+    def __post_init__(self):
+        self.root = Path(self.root)
+        if self.wgi_file is None:
+            self.wgi_file = self.input_folder / 'WGI' / 'WGI_MA_Only_11_6_23.csv'
+        if self.snapshot_dir is None:
+            self.snapshot_dir = self.root / 'snapshots' / 'latest'
+
+    @property
+    def input_folder(self):
+        return self.root / 'input_files'
+
+    @property
+    def output_folder(self):
+        return self.root / 'output_files'
+
+    @property
+    def cache_folder(self):
+        """Outputs of the pipeline stages, keyed by a fingerprint of their inputs"""
+        return self.root / 'cache'
+
+    @property
+    def logs(self):
+        return self.root / 'logs'
+
+    @property
+    def wgi_ein_cache(self):
+        return self.input_folder / 'WGI' / 'org_eins.sqlite'
+
+
+def pool_context():
+    """multiprocessing context of the worker pools
+
+    Pools are started while other threads run (the downloads of
+    tec.download_raw_data, the request threads of engine.py). A forked worker
+    would inherit the locks those threads hold, so workers start from the
+    forkserver, or by spawn where there is none.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
@@ -0,0 +1,105 @@
+"""Aggregate cube of the index by year, region, county and NTEE category
+
+One row per (year, REGION, COUNTY, NTEE) with:
+
+    orgs            organizations of the MA report (BMF list)
+    contributions   their Form 990 and 990-EZ contributions
+    wg_orgs         W&G organizations of the WGI list
+    wg_revenue      their revenue as reported by the WGI platform
+    share           wg_revenue as a percent of contributions
+
+The cube is written once per run by tec.build_index_series. Breakdowns are
+then sums over its rows, share is not additive and is recomputed by rollup:
+
+    cube = read_report('output_files/wg_cube.csv')
+    rollup(cube, ['year', 'REGION'])
+    rollup(cube, ['NTEE'], year=2021, county='Suffolk')
+"""
+import numpy as np
+import pandas as pd
+from accounting import parse_amounts
+from ein_index import EinIndex
+
+
+DIMENSIONS = ['year', 'REGION', 'COUNTY', 'NTEE']
+MEASURES = ['orgs', 'contributions', 'wg_orgs', 'wg_revenue']
+# NTEE major group of organizations without a code, Z is 'Unknown' in the NTEE
+UNKNOWN_NTEE = 'Z'
+
+
+def ntee_group(codes):
+    """NTEE major group letter ('A' for 'A20') of each code, UNKNOWN_NTEE when missing"""
+    groups = pd.Series(codes, dtype='string').str.strip().str[:1].str.upper()
+    return groups.where(groups.str.fullmatch('[A-Z]'), UNKNOWN_NTEE).fillna(UNKNOWN_NTEE)
+
+
+def area_columns(df):
+    """REGION and COUNTY of `df` as strings, 'Unknown' outside of Massachusetts"""
+    return {column: df[column].astype('string').fillna('Unknown') for column in ['REGION', 'COUNTY']}
+
+
+def org_cells(year, report):
+    """orgs and contributions per cell of one year's MA report"""
+    contributions = (report['totcntrbgfts'].fillna(0).astype('int64')
+                     + report['totcntrbs'].fillna(0).astype('int64'))
+    cells = pd.DataFrame({**area_columns(report), 'NTEE': ntee_group(report['NTEE_CD']),
+                          'contributions': contributions})
+    cells = cells.groupby(['REGION', 'COUNTY', 'NTEE'], observed=True).agg(
+        orgs=('contributions', 'size'), contributions=('contributions', 'sum'))
+    return cells.assign(year=year).reset_index()
+
+
+def wg_cells(wgi_orgs, bmf):
+    """wg_orgs and wg_revenue per cell, the WGI list has no year
+
+    `wgi_orgs` needs REGION and COUNTY (see geography.Geography.annotate),
+    the NTEE category comes from the BMF entry of its EIN.
+    """
+    ntee = EinIndex.from_frame(bmf, columns=['NTEE_CD']).join(wgi_orgs.rename(columns={'ein': 'EIN'}))['NTEE_CD']
+    cells = pd.DataFrame({**area_columns(wgi_orgs), 'NTEE': ntee_group(ntee),
+                          'revenue': parse_amounts(wgi_orgs['revenue'])[0]})
+    return cells.groupby(['REGION', 'COUNTY', 'NTEE'], observed=True).agg(
+        wg_orgs=('revenue', 'size'), wg_revenue=('revenue', 'sum')).reset_index()
+
+
+def add_share(cube):
+    contributions = cube['contributions'].to_numpy(dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(contributions > 0, cube['wg_revenue'] / contributions * 100, np.nan)
+    return cube.assign(share=np.round(share, 2))
+
+
+def build_cube(reports, wgi_orgs):
+    """Cube of the index from the MA report of each year and the annotated WGI organizations
+
+    Args:
+        reports (dict): MA report (EIN, NTEE_CD, contributions, REGION and COUNTY) per year
+        wgi_orgs (pd.DataFrame): ein, revenue, REGION and COUNTY of the W&G organizations
+
+    Returns:
+        pd.DataFrame: DIMENSIONS, MEASURES and share, cells without organizations are left out
+    """
+    orgs = pd.concat([org_cells(year, report) for year, report in reports.items()], ignore_index=True)
+    wg = wg_cells(wgi_orgs, next(reversed(reports.values())))
+    # every year gets the W&G cells, also those without an organization in the MA report
+    wg = pd.concat([wg.assign(year=year) for year in reports], ignore_index=True)
+    cube = orgs.merge(wg, on=DIMENSIONS, how='outer')
+    cube[MEASURES] = cube[MEASURES].fillna(0).astype('int64')
+    return add_share(cube[DIMENSIONS + MEASURES].sort_values(DIMENSIONS, ignore_index=True))
+
+
+def rollup(cube, by, year=None, region=None, county=None, ntee=None):
+    """Sum the cube over the dimensions not in `by`, after selecting a year, region, county or NTEE group
+
+    Each selection is a value or a list of values.
+    """
+    mask = np.ones(len(cube), dtype=bool)
+    for column, values in [('year', year), ('REGION', region), ('COUNTY', county), ('NTEE', ntee)]:
+        if values is not None:
+            mask &= cube[column].isin([values] if np.isscalar(values) else list(values)).to_numpy()
+    cells = cube[mask]
+    if by:
+        cells = cells.groupby(list(by), observed=True)[MEASURES].sum().reset_index()
+    else:
+        cells = cells[MEASURES].sum().to_frame().T
+    return add_share(cells)
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+import requests
+from tqdm import tqdm
+import snapshot
+from profiling import stage
+
+
+# One manifest per download directory, keyed by URL
+MANIFEST_NAME = '.download_manifest.json'
+# 10MB chunk size
+CHUNK_SIZE = 10_000_000
+# sizes are compared with Content-Length, so ask for the bytes as stored
+IDENTITY = {'Accept-Encoding': 'identity'}
+# downloads may run on a thread pool, manifest updates are serialized
+manifest_lock = threading.Lock()
+
+
+def sha256sum(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(directory):
+    try:
+        with open(Path(directory) / MANIFEST_NAME) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(directory, manifest):
+    manifest_file = Path(directory) / MANIFEST_NAME
+    tmp_file = manifest_file.with_suffix('.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+
+def update_manifest(directory, key, value):
+    """Set (or remove when `value` is None) one manifest entry"""
+    with manifest_lock:
+        manifest = load_manifest(directory)
+        if value is None:
+            manifest.pop(key, None)
+        else:
+            manifest[key] = value
+        save_manifest(directory, manifest)
+
+
+def validators(response):
+    """ETag / Last-Modified / size advertised by the server"""
+    size = response.headers.get('Content-Length')
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'size': int(size) if size is not None else None,
+    }
+
+
+def is_intact(filepath, entry):
+    """True if `filepath` is the complete file recorded in the manifest entry"""
+    if not entry or not os.path.exists(filepath) or entry.get('name') != Path(filepath).name:
+        return False
+    stat = os.stat(filepath)
+    if stat.st_size != entry.get('size'):
+        return False
+    # only rehash when the file was touched since it was recorded
+    if stat.st_mtime != entry.get('mtime'):
+        return sha256sum(filepath) == entry.get('sha256')
+    return True
+
+
+def is_unchanged(remote, entry):
+    """True if the server validators match the manifest entry"""
+    if remote['etag'] and entry.get('etag'):
+        return remote['etag'] == entry['etag']
+    if remote['last_modified'] and entry.get('last_modified'):
+        return remote['last_modified'] == entry['last_modified']
+    return remote['size'] is not None and remote['size'] == entry.get('size')
+
+
+def record(filepath, remote):
+    stat = os.stat(filepath)
+    return {
+        'name': filepath.name,
+        'etag': remote['etag'],
+        'last_modified': remote['last_modified'],
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sha256': sha256sum(filepath),
+        'checked': time.time(),
+    }
+
+
+def revalidated(entry, response):
+    """Manifest entry after a 304: the validators sent with it and the time of the check"""
+    remote = validators(response)
+    return {**entry, 'checked': time.time(),
+            **{key: remote[key] for key in ('etag', 'last_modified') if remote[key]}}
+
+
+def download_file(link, filepath, force=False):
+    """Download `link` to `filepath`, skipping the transfer when the local copy is current
+
+    Every completed download is recorded (ETag, Last-Modified, size and SHA-256)
+    in a manifest next to the file. On later runs a single HEAD request decides
+    whether the recorded copy is still current. Transfers go to a `.part` file
+    and an interrupted one is resumed with a Range request when the server
+    still serves the same version; the file is only moved into place once its
+    size matches and its checksum is recorded, so a half-written file is never
+    mistaken for a complete one. While a snapshot is recorded the file is
+    added to the bundle, even when no transfer was needed (see snapshot.py).
+
+    Args:
+        link (str): URL to download
+        filepath (Path): destination
+        force (bool): ignore the manifest and download the file again in full
+
+    Returns:
+        Path: filepath
+    """
+    filepath = Path(filepath)
+    with stage('download', file=filepath.name, bytes_written=0) as counts:
+        transfer(link, filepath, force, counts)
+    if snapshot.mode == 'record':
+        # a copy found current without a GET still goes into the bundle
+        snapshot.capture_file(link, filepath, load_manifest(filepath.parent).get(link, {}))
+    return filepath
+
+
+def transfer(link, filepath, force, counts):
+    """Body of download_file, counts the bytes written into the `counts` stage record"""
+    directory = filepath.parent
+    manifest = load_manifest(directory)
+    entry = manifest.get(link, {})
+    intact = not force and is_intact(filepath, entry)
+
+    try:
+        head = requests.head(link, allow_redirects=True, headers=IDENTITY)
+        head.raise_for_status()
+        remote = validators(head)
+    except requests.RequestException as e:
+        if intact:
+            print(f'Could not check {link} ({e}), using {filepath.name}')
+            return filepath
+        raise
+
+    if intact and is_unchanged(remote, entry):
+        return filepath
+    if not force and not entry and os.path.exists(filepath) and remote['size'] == os.path.getsize(filepath):
+        # downloaded before the manifest existed, adopt it
+        print(f'Recording existing {filepath.name} in the download manifest')
+        update_manifest(directory, link, record(filepath, remote))
+        return filepath
+
+    part_file = filepath.with_name(filepath.name + '.part')
+    partial = manifest.get(link + '#partial', {})
+    headers = dict(IDENTITY)
+    offset = 0
+    if (not force and os.path.exists(part_file) and is_unchanged(remote, partial)
+            and head.headers.get('Accept-Ranges') == 'bytes'):
+        offset = os.path.getsize(part_file)
+        if offset == remote['size']:
+            # interrupted after the last byte, before the file was moved into place
+            return finish(link, filepath, part_file, remote)
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = remote['etag'] or remote['last_modified']
+    elif intact:
+        # conditional request in case HEAD validators differ from GET ones
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    update_manifest(directory, link + '#partial', remote)
+    response = requests.get(link, stream=True, headers=headers)
+    if response.status_code == 304:
+        update_manifest(directory, link, revalidated(entry, response))
+        update_manifest(directory, link + '#partial', None)
+        return filepath
+    if response.status_code == 416:
+        # the .part does not end inside the file the server has, start over
+        print(f'Could not resume {filepath.name} from byte {offset}, downloading it again')
+        response.close()
+        os.remove(part_file)
+        update_manifest(directory, link + '#partial', None)
+        return transfer(link, filepath, force, counts)
+    response.raise_for_status()
+    mode = 'ab' if response.status_code == 206 else 'wb'
+    with open(part_file, mode) as f:
+        for chunk in tqdm(response.iter_content(chunk_size=CHUNK_SIZE),
+                          desc=f'Downloading {filepath.name}'):
+            if chunk:
+                f.write(chunk)
+                counts['bytes_written'] += len(chunk)
+
+    remote = validators(response) if mode == 'wb' else remote
+    return finish(link, filepath, part_file, remote)
+
+
+def finish(link, filepath, part_file, remote):
+    """Move a complete `.part` file into place and record it in the manifest"""
+    size = os.path.getsize(part_file)
+    if remote['size'] is not None and size != remote['size']:
+        raise RuntimeError(f'Incomplete download of {link}: {size} of {remote["size"]} bytes, rerun to resume')
+    os.replace(part_file, filepath)
+    update_manifest(filepath.parent, link, record(filepath, remote))
+    update_manifest(filepath.parent, link + '#partial', None)
+    return filepath
@@ -0,0 +1,80 @@
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+# key used for EINs that are missing or not numeric, never present in an index
+MISSING_EIN = -1
+
+
+def ein_keys(eins):
+    """int64 EINs of a column that may hold ints, floats or strings such as '04-2103580'"""
+    eins = pd.Series(eins)
+    if not pd.api.types.is_numeric_dtype(eins):
+        eins = pd.to_numeric(eins.astype('string').str.replace('-', '', regex=False).str.strip(),
+                             errors='coerce')
+    return eins.fillna(MISSING_EIN).to_numpy(dtype='int64')
+
+
+class EinIndex:
+    """Sorted int64 EINs with columns aligned to them
+
+    Joins against the index are `np.searchsorted` lookups instead of hash
+    merges. When an EIN appears more than once the first row is used, so a
+    join never adds rows.
+    """
+
+    def __init__(self, ein, columns):
+        self.ein = ein
+        self.columns = columns
+
+    @classmethod
+    def from_frame(cls, df, columns=None, key='EIN'):
+        """Index `columns` of `df` (all but `key` by default) by EIN"""
+        if columns is None:
+            columns = [c for c in df.columns if c != key]
+        ein = ein_keys(df[key])
+        order = np.argsort(ein, kind='stable')
+        return cls(ein[order], {c: df[c].to_numpy()[order] for c in columns})
+
+    def save(self, directory):
+        """Write one .npy file per array so the index can be memory-mapped by load"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(Path(directory) / 'EIN.npy', self.ein)
+        for name, values in self.columns.items():
+            np.save(Path(directory) / f'{name}.npy', values, allow_pickle=False)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        directory = Path(directory)
+        ein = np.load(directory / 'EIN.npy', mmap_mode=mmap_mode)
+        columns = {f.stem: np.load(f, mmap_mode=mmap_mode)
+                   for f in sorted(directory.glob('*.npy')) if f.stem != 'EIN'}
+        return cls(ein, columns)
+
+    def __len__(self):
+        return len(self.ein)
+
+    def lookup(self, eins):
+        """Positions of `eins` in the index and a mask of the ones that were found"""
+        keys = ein_keys(eins)
+        if not len(self.ein):
+            return np.zeros(len(keys), dtype='int64'), np.zeros(len(keys), dtype=bool)
+        pos = np.searchsorted(self.ein, keys).clip(max=len(self.ein) - 1)
+        found = (self.ein[pos] == keys) & (keys != MISSING_EIN)
+        return pos, found
+
+    def contains(self, eins):
+        return self.lookup(eins)[1]
+
+    def join(self, df, on='EIN'):
+        """Left join of `df` with the index columns, missing values are <NA>"""
+        pos, found = self.lookup(df[on])
+        joined = {}
+        for name, values in self.columns.items():
+            values = np.asarray(values[pos])
+            if np.issubdtype(values.dtype, np.integer):
+                values = pd.arrays.IntegerArray(values.astype('int64'), ~found)
+            joined[name] = pd.Series(values, index=df.index).where(found)
+        return df.assign(**joined)
@@ -0,0 +1,228 @@
+"""Long-lived index engine: the data of tec.py kept in memory for interactive queries
+
+    from engine import IndexEngine
+    engine = IndexEngine()
+    engine.share(2021, county='Suffolk')        # W&G share in percent
+    engine.total(2021, region='Metro West')     # contributions reported to the IRS
+    engine.top(2021, n=5, county='Suffolk')     # largest organizations by contributions
+
+or over HTTP, for the dashboard and wgi.ipynb:
+
+    python engine.py 2019-2023 --port 8765
+    curl 'http://127.0.0.1:8765/share?year=2021&county=Suffolk'
+
+Areas are given as in Geography.zip_mask: region, county and zips, each a
+name or a list of names. No area means the index of tec.py: the W&G revenue
+of the Greater Boston Area (zipcodes.greater_boston_zipcodes, not the
+'Greater Boston' region) over the contributions of the IRS extracts, so
+engine.share(2021) is the percent_contribution of index_series.csv. Totals
+and top organizations without an area cover all of Massachusetts. The first
+query of a year loads it (downloads and conversions as in tec.py), later
+queries only filter the arrays kept in memory.
+"""
+import json
+import argparse
+import threading
+import traceback
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pandas as pd
+import tec
+from accounting import to_int64
+from geography import load_geography, zip5
+from zipcodes import greater_boston_zipcodes
+
+
+AREA_KEYS = ['region', 'county', 'zips']
+# area of the W&G revenue of tec.py, used by share and wg_revenue when no area is given
+INDEX_AREA = {'zips': sorted(greater_boston_zipcodes)}
+
+
+class UnknownYear(ValueError):
+    """A year the IRS has no extracts for"""
+
+
+def has_area(area):
+    return any(area.get(key) is not None for key in AREA_KEYS)
+
+
+class IndexEngine:
+    """W&G share, totals and top organizations per year and area, answered from memory
+
+    Args:
+        config (config.Config): settings of the run, defaults to tec.get_config()
+    """
+
+    def __init__(self, config=None):
+        if config is not None:
+            tec.configure(config)
+        self.geography = load_geography()
+        self.years = {}
+        self.lock = threading.RLock()
+        self.download_links = None
+        self.ma_orgs = None
+        self.wgi_orgs = None
+
+    def load_shared(self):
+        """BMF organizations and W&G organizations of Massachusetts, the same for every year"""
+        with self.lock:
+            if self.ma_orgs is None:
+                self.load_shared_data()
+
+    def load_shared_data(self):
+        self.download_links = tec.fetch_download_links()
+        ma_orgs = tec.update_ma_orgs_file(tec.get_ma_orgs_list())
+        self.ma_orgs = self.geography.annotate(ma_orgs)
+        state_mask = self.geography.codes['COUNTY'] >= 0
+        wgi_orgs = pd.read_csv(tec.wgi_orgs_file(state_mask, name='ma_wgi_orgs'))
+        wgi_orgs['ZIP5'] = zip5(wgi_orgs['zip'])
+        wgi_orgs['revenue'] = to_int64(wgi_orgs['revenue'])
+        self.wgi_orgs = self.geography.annotate(wgi_orgs)
+
+    def load(self, year):
+        """Organizations of `year` with their contributions, loaded on first use
+
+        Raises UnknownYear if the IRS has no extracts for `year`.
+        """
+        with self.lock:
+            if year not in self.years:
+                self.load_shared()
+                if year not in self.download_links:
+                    raise UnknownYear(f'Year {year} is unavailable, the IRS has extracts for '
+                                      + ', '.join(map(str, sorted(self.download_links))))
+                soi_data = tec.download_raw_data(year, download_links=self.download_links)
+                orgs = soi_data.join(self.ma_orgs)
+                orgs['contributions'] = (orgs['totcntrbgfts'].fillna(0).astype('int64')
+                                         + orgs['totcntrbs'].fillna(0).astype('int64'))
+                self.years[year] = {
+                    'orgs': orgs,
+                    'zip5': zip5(orgs['ZIP5']),
+                    'irs_total': soi_data.total_contributions,
+                }
+            return self.years[year]
+
+    def area_mask(self, keys, **area):
+        """True for the ZIP5 codes `keys` (as returned by zip5) inside `area`, all True when no area is given"""
+        if not has_area(area):
+            return np.ones(len(keys), dtype=bool)
+        if isinstance(area.get('zips'), str):
+            area['zips'] = [area['zips']]
+        mask = self.geography.zip_mask(**area)
+        return np.where(keys >= 0, mask[keys], False)
+
+    def orgs(self, year, **area):
+        data = self.load(year)
+        return data['orgs'][self.area_mask(data['zip5'], **area)]
+
+    def wg_revenue(self, **area):
+        """Revenue of the W&G organizations in `area`, of the Greater Boston Area of tec.py when no area is given
+
+        The WGI list has no year.
+        """
+        self.load_shared()
+        area = area if has_area(area) else INDEX_AREA
+        zips = self.wgi_orgs['ZIP5'].to_numpy()
+        return int(self.wgi_orgs['revenue'][self.area_mask(zips, **area)].sum())
+
+    def total(self, year, **area):
+        """Contributions reported by the organizations of `area` in `year`
+
+        Without an area this is the total of the IRS extracts, the denominator of tec.py.
+        """
+        if not has_area(area):
+            return int(self.load(year)['irs_total'])
+        return int(self.orgs(year, **area)['contributions'].sum())
+
+    def share(self, year, **area):
+        """W&G revenue of `area` as a percent of its contributions in `year`
+
+        Without an area this is the index of tec.py: Greater Boston Area W&G
+        revenue over the IRS total.
+        """
+        total = self.total(year, **area)
+        return round(self.wg_revenue(**area) / total * 100, 2) if total else None
+
+    def top(self, year, n=10, **area):
+        """The `n` organizations of `area` with the largest contributions in `year`"""
+        columns = ['EIN', 'NAME', 'CITY', 'ZIP5', 'COUNTY', 'REGION', 'contributions']
+        return self.orgs(year, **area).nlargest(n, 'contributions')[columns]
+
+    def query(self, name, year, n=10, **area):
+        """Answer a query by name with JSON-serializable values, used by the HTTP endpoint"""
+        if name == 'share':
+            return {'year': year, **area, 'share': self.share(year, **area),
+                    'wg_revenue': self.wg_revenue(**area), 'total': self.total(year, **area)}
+        if name == 'total':
+            return {'year': year, **area, 'total': self.total(year, **area)}
+        if name == 'top':
+            top = self.top(year, n, **area).astype(object).where(lambda df: df.notna(), None)
+            return {'year': year, **area, 'top': top.to_dict(orient='records')}
+        raise KeyError(name)
+
+
+# queries answered by IndexEngine.query, the paths of the HTTP endpoint
+QUERIES = ('share', 'total', 'top')
+
+
+class EngineHandler(BaseHTTPRequestHandler):
+    # set by serve
+    engine = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body, status=200):
+        body = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """404 for an unknown query or year, 400 for a missing or invalid parameter, 500 if the query itself fails"""
+        url = urlparse(self.path)
+        name = url.path.strip('/')
+        if name not in QUERIES:
+            return self.send_json({'error': f'unknown query {name}, use one of {", ".join(QUERIES)}'}, 404)
+        query = parse_qs(url.query)
+        area = {key: values if len(values) > 1 else values[0]
+                for key, values in query.items() if key in AREA_KEYS}
+        try:
+            year = int(query['year'][0])
+            n = int(query.get('n', [10])[0])
+            # unknown regions and counties raise ValueError
+            self.engine.geography.zip_mask(**area)
+        except KeyError as e:
+            return self.send_json({'error': f'missing parameter {e}'}, 400)
+        except ValueError as e:
+            return self.send_json({'error': str(e)}, 400)
+        try:
+            body = self.engine.query(name, year, n, **area)
+        except UnknownYear as e:
+            return self.send_json({'error': str(e)}, 404)
+        except Exception as e:
+            traceback.print_exc()
+            return self.send_json({'error': f'{type(e).__name__}: {e}'}, 500)
+        self.send_json(body)
+
+
+def serve(engine, host='127.0.0.1', port=8765):
+    """Answer /share, /total and /top queries of `engine` on http://host:port until interrupted"""
+    handler = type('Handler', (EngineHandler,), {'engine': engine})
+    with ThreadingHTTPServer((host, port), handler) as httpd:
+        print(f'Index engine listening on http://{host}:{httpd.server_port}')
+        httpd.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve W&G index queries from memory')
+    parser.add_argument('years', nargs='?', type=tec.parse_years, help='years to load before serving, 2021 or 2019-2023')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    engine = IndexEngine()
+    for year in args.years or []:
+        engine.load(year)
+    serve(engine, args.host, args.port)
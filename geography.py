@@ -0,0 +1,145 @@
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+DATA_DIR = Path(__file__).parent
+ZIP_CODES_FILE = DATA_DIR / 'MA Zip Codes.csv'
+TOWNS_FILE = DATA_DIR / 'geography.csv'
+# villages and post office names of the ZIP list, with the county and town they are in
+VILLAGES_FILE = DATA_DIR / 'villages.csv'
+REGIONS = ['Southeast, Cape & Islands', 'Central MA', 'Greater Boston', 'Metro West', 'Northeast', 'Western']
+# size of the ZIP5 -> code lookup arrays
+ZIP_SPACE = 100_000
+
+
+def zip5(zips):
+    """int ZIP5 of ZIP codes given as ints, '02134' or '02134-1234', -1 when missing"""
+    zips = pd.Series(zips)
+    if not pd.api.types.is_numeric_dtype(zips):
+        zips = pd.to_numeric(zips.astype('string').str.strip().str[:5], errors='coerce')
+    zips = zips.fillna(-1).to_numpy(dtype='int64')
+    return np.where((zips >= 0) & (zips < ZIP_SPACE), zips, -1)
+
+
+def read_zip_codes(path=ZIP_CODES_FILE):
+    """Parse `MA Zip Codes.csv`, one value per line: ZIP, type, common cities, county, area codes...
+
+    Returns:
+        pd.DataFrame: ZIP5, TYPE, CITIES and COUNTY per ZIP code
+    """
+    values = pd.read_csv(path, header=None, names=['value'], dtype=str, encoding='utf-8-sig')['value']
+    is_zip = values.str.fullmatch(r'\d{3,5}')
+    record = is_zip.cumsum()
+    offset = values.groupby(record).cumcount()
+    # offsets 0-3 of each record, the area codes that follow are not needed
+    fields = pd.DataFrame({'record': record, 'offset': offset, 'value': values})
+    fields = fields[(record > 0) & (offset < 4)]
+    table = fields.pivot(index='record', columns='offset', values='value')
+    table.columns = ['ZIP5', 'TYPE', 'CITIES', 'COUNTY']
+    table['ZIP5'] = table['ZIP5'].astype('int32')
+    table['COUNTY'] = table['COUNTY'].str.removesuffix(' County')
+    return table.reset_index(drop=True)
+
+
+def read_towns(path=TOWNS_FILE):
+    """Parse `geography.csv` (Town and Region, written by messy_geography.py) into TOWN and REGION
+
+    Raises ValueError for a region that is not one of REGIONS.
+    """
+    towns = pd.read_csv(path, usecols=['Town', 'Region'], dtype=str)
+    unknown = set(towns['Region']) - set(REGIONS)
+    if unknown:
+        raise ValueError(f'Unknown region in {Path(path).name}: {", ".join(sorted(map(str, unknown)))}')
+    return pd.DataFrame({'TOWN': towns['Town'].str.strip(), 'REGION': towns['Region']})
+
+
+def read_villages(path=VILLAGES_FILE):
+    """Parse `villages.csv` into VILLAGE, COUNTY and the TOWN the village is part of"""
+    villages = pd.read_csv(path, dtype=str)
+    return villages.rename(columns={'Village': 'VILLAGE', 'County': 'COUNTY', 'Town': 'TOWN'})
+
+
+class Geography:
+    """ZIP5 -> town / county / region lookup for Massachusetts
+
+    Each attribute is stored as an int16 code array indexed by ZIP5, so
+    membership and lookups over many ZIP codes are single array operations.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.categories = {}
+        self.codes = {}
+        for column in ['TOWN', 'COUNTY', 'REGION']:
+            values = pd.Categorical(table[column])
+            codes = np.full(ZIP_SPACE, -1, dtype='int16')
+            codes[table['ZIP5'].to_numpy()] = values.codes
+            self.categories[column] = values.categories
+            self.codes[column] = codes
+
+    @classmethod
+    def load(cls, zip_codes_file=ZIP_CODES_FILE, towns_file=TOWNS_FILE, villages_file=VILLAGES_FILE):
+        """Geography of the ZIP codes of `zip_codes_file`
+
+        Raises ValueError if a ZIP code cannot be placed in a town of `towns_file`,
+        a village missing from `villages_file` would otherwise drop out of every region.
+        """
+        zip_codes = read_zip_codes(zip_codes_file)
+        towns = read_towns(towns_file)
+        # the town of a ZIP is the first of its common cities that is a town, then the
+        # town of a known village of its county ('Florence' is in Northampton), then
+        # the first village named after a town ('South Barre' is in Barre)
+        cities = zip_codes[['ZIP5', 'COUNTY']].assign(TOWN=zip_codes['CITIES'].str.split(',')).explode('TOWN')
+        cities['TOWN'] = cities['TOWN'].str.strip()
+        aliases = cities.merge(read_villages(villages_file).rename(columns={'TOWN': 'ALIAS'}),
+                               left_on=['TOWN', 'COUNTY'], right_on=['VILLAGE', 'COUNTY'])
+        aliases = aliases.assign(TOWN=aliases['ALIAS'])[cities.columns]
+        prefixed = cities.assign(TOWN=cities['TOWN'].str.replace(r'^(North|South|East|West)\s+', '', regex=True))
+        candidates = pd.concat([cities, aliases, prefixed], ignore_index=True)
+        known = candidates[candidates['TOWN'].isin(towns['TOWN'])].drop_duplicates('ZIP5')
+        table = zip_codes.merge(known[['ZIP5', 'TOWN']], on='ZIP5', how='left').merge(towns, on='TOWN', how='left')
+        unplaced = table[table['REGION'].isna()]
+        if len(unplaced):
+            raise ValueError(f'{len(unplaced)} ZIP codes are in no town of {Path(towns_file).name}, '
+                             f'add their village to {Path(villages_file).name}: '
+                             + ', '.join(f'{z:05d} {c}' for z, c in zip(unplaced['ZIP5'], unplaced['CITIES'])))
+        return cls(table[['ZIP5', 'TYPE', 'TOWN', 'COUNTY', 'REGION']])
+
+    def lookup(self, zips, column):
+        """`column` (TOWN, COUNTY or REGION) of each ZIP code, NaN when unknown"""
+        codes = self.codes[column]
+        keys = zip5(zips)
+        return pd.Categorical.from_codes(np.where(keys >= 0, codes[keys], -1), self.categories[column])
+
+    def annotate(self, df, zip_column='ZIP5'):
+        """Add TOWN, COUNTY and REGION columns for the ZIP codes of `df`"""
+        return df.assign(**{column: self.lookup(df[zip_column], column) for column in self.codes})
+
+    def zip_mask(self, region=None, county=None, zips=None):
+        """Boolean array indexed by ZIP5, True for ZIPs in any of the given regions, counties or ZIP codes"""
+        mask = np.zeros(ZIP_SPACE, dtype=bool)
+        for column, names in [('REGION', region), ('COUNTY', county)]:
+            if names is None:
+                continue
+            names = [names] if isinstance(names, str) else list(names)
+            unknown = set(names) - set(self.categories[column])
+            if unknown:
+                raise ValueError(f'Unknown {column.lower()}: {", ".join(sorted(unknown))}')
+            mask |= np.isin(self.codes[column], self.categories[column].get_indexer(names))
+        if zips is not None:
+            keys = zip5(list(zips))
+            mask[keys[keys >= 0]] = True
+        return mask
+
+    def contains(self, zips, /, **area):
+        """True for each ZIP code inside the area given as in zip_mask, whose zips can be given too"""
+        keys = zip5(zips)
+        return np.where(keys >= 0, self.zip_mask(**area)[keys], False)
+
+
+@lru_cache(maxsize=None)
+def load_geography():
+    """Geography of the files shipped with the repository, loaded once per process"""
+    return Geography.load()
@@ -0,0 +1,85 @@
+"""Match organizations by name, city and ZIP code when their EIN is unknown
+
+Names are compared only within blocks that share a ZIP5 (or a city) and at
+least one name token, so the candidates are found with a merge instead of
+comparing every organization with every BMF entry. The similarity is the
+Jaccard index of the name tokens, computed for all candidate pairs at once:
+
+    matches = match_names(orgs, bmf)        # EIN and score per matched row of orgs
+"""
+import numpy as np
+import pandas as pd
+from geography import zip5
+
+
+# words that do not tell organizations apart
+STOPWORDS = {'A', 'AN', 'AND', 'CO', 'CORP', 'CORPORATION', 'FOR', 'IN', 'INC', 'INCORPORATED',
+             'LLC', 'LTD', 'OF', 'THE'}
+# scores are multiplied by this when both cities are known and differ
+OTHER_CITY_PENALTY = 0.8
+
+
+def normalize(values):
+    """Upper case words of names or cities without punctuation"""
+    return (pd.Series(values, dtype='string').str.upper()
+            .str.replace('&', ' AND ', regex=False)
+            .str.replace(r'[^A-Z0-9 ]+', ' ', regex=True)
+            .str.split().str.join(' '))
+
+
+def name_tokens(names):
+    """(row, token) pairs of the distinct tokens of each name, without STOPWORDS"""
+    tokens = normalize(names).reset_index(drop=True).str.split().explode().dropna()
+    tokens = tokens[~tokens.isin(STOPWORDS)]
+    return pd.DataFrame({'row': tokens.index.to_numpy(), 'token': tokens.to_numpy()}).drop_duplicates()
+
+
+def blocked_pairs(left, right, keys):
+    """Candidate (row, row_bmf) pairs sharing a token and the `keys` of a block, with their shared tokens"""
+    pairs = left.merge(right, on=['token', *keys], suffixes=('', '_bmf'))
+    return pairs.groupby(['row', 'row_bmf']).size().rename('shared').reset_index()
+
+
+def match_names(orgs, bmf, min_score=0.6):
+    """Find the BMF entry of organizations by name, within the same ZIP5 or city
+
+    Args:
+        orgs (pd.DataFrame): name and zip, optionally city, of the organizations to match
+        bmf (pd.DataFrame): EIN, NAME, CITY and ZIP5 of the BMF (see tec.update_ma_orgs_file)
+        min_score (float): lowest score accepted as a match
+
+    Returns:
+        pd.DataFrame: EIN and score (0-1) indexed by the rows of `orgs` that matched. A row whose best
+            candidates tie between several EINs is not matched.
+    """
+    orgs = orgs.reset_index(drop=True)
+    bmf = bmf.reset_index(drop=True)
+    left = name_tokens(orgs['name'])
+    right = name_tokens(bmf['NAME'])
+    left_city = normalize(orgs['city']) if 'city' in orgs else pd.Series(pd.NA, index=orgs.index, dtype='string')
+    right_city = normalize(bmf['CITY'])
+    left = left.assign(ZIP5=zip5(orgs['zip'])[left['row']], CITY=left_city.to_numpy()[left['row']])
+    right = right.assign(ZIP5=zip5(bmf['ZIP5'])[right['row']], CITY=right_city.to_numpy()[right['row']])
+
+    blocks = [blocked_pairs(left[left['ZIP5'] >= 0], right[right['ZIP5'] >= 0], ['ZIP5']),
+              blocked_pairs(left.dropna(subset='CITY'), right.dropna(subset='CITY'), ['CITY'])]
+    pairs = pd.concat(blocks).drop_duplicates(['row', 'row_bmf'])
+    if pairs.empty:
+        return pd.DataFrame({'EIN': pd.Series(dtype='uint32'), 'score': pd.Series(dtype='float64')})
+
+    left_size = left.groupby('row').size().reindex(pairs['row']).to_numpy()
+    right_size = right.groupby('row').size().reindex(pairs['row_bmf']).to_numpy()
+    score = pairs['shared'].to_numpy() / (left_size + right_size - pairs['shared'].to_numpy())
+    cities = pd.DataFrame({'left': left_city.to_numpy()[pairs['row']],
+                           'right': right_city.to_numpy()[pairs['row_bmf']]})
+    other_city = (cities['left'].notna() & cities['right'].notna() & (cities['left'] != cities['right'])).to_numpy()
+    pairs['score'] = np.where(other_city, score * OTHER_CITY_PENALTY, score)
+    pairs['EIN'] = bmf['EIN'].to_numpy()[pairs['row_bmf']]
+
+    pairs = pairs[pairs['score'] >= min_score].sort_values(['row', 'score'], ascending=[True, False])
+    best = pairs.drop_duplicates('row')
+    # ties between different EINs are left unmatched
+    tied = pairs.merge(best[['row', 'score', 'EIN']], on=['row', 'score'], suffixes=('', '_best'))
+    ambiguous = tied.loc[tied['EIN'] != tied['EIN_best'], 'row'].unique()
+    best = best[~best['row'].isin(ambiguous)]
+    return best.set_index('row')[['EIN', 'score']].rename_axis(None)
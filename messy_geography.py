@@ -1,53 +1,16 @@
+import re
 import pandas as pd
-
-df = pd.read_csv('messy_geography.csv')
-
-df['Town'] = df['Region Town'].str.extract(r'(\w+)$')
-
-df['Region'] = df['Region Town'].str.split().str[:-1].str.join(' ')
-
+from geography import REGIONS, load_geography
+
+# messy_geography.csv has a single 'Region Town' column, split it on the known
+# region names since both regions and towns can have several words
+df = pd.read_csv('messy_geography.csv', encoding='utf-8-sig')
+parts = df['Region Town'].str.extract(f'^({"|".join(map(re.escape, REGIONS))})\\s+(.*)$')
+df['Town'] = parts[1]
+df['Region'] = parts[0]
 df.drop(columns=['Region Town'], inplace=True)
-
 df.to_csv('geography.csv')
 
-
-
-zip_codes = pd.read_csv('MA Zip Codes.csv')
-
-zip_codes.str.explode('County')
-
-county_idx = []
-for i, row in zip_codes.iterrows():
-    if 'County' in row['ZIP Code']:
-        county_idx.append(i)
-
-county_idx.append(len(zip_codes))
-row_start = [idx - 3 for idx in county_idx]
-
-header = ['ZIP Code', 'Type', 'Common Cities', 'County', 'Area Codes']
-rows = []
-current_row_idx = 0
-current_row = {'Area Code':''}
-for i, row in zip_codes.iterrows():
-    if i in row_start:
-        rows.append(current_row)
-        current_row_idx += 1
-        current_row = {'Area Code':''}
-    diff = i - row_start[current_row_idx]
-    value = row['ZIP Code'] 
-    print(i, current_row_idx, differecnce)
-    if diff == 0:
-        current_row['Zip Code'] = value 
-    elif diff == 1:
-        current_row['Type'] = value 
-    elif diff == 2:
-        current_row['Common Cities'] = value 
-    elif diff == 3:
-        current_row['County'] = value 
-    elif diff >= 4:
-        current_row['Area Code'] = current_row['Area Code'] + value 
-
-
-    #     new_row = {}
-    #     new_row['Zip Code'] = value
-    # if i + 2 in county_idx:
+# ZIP -> town / county / region table built from MA Zip Codes.csv, geography.csv and villages.csv
+load_geography.cache_clear()
+load_geography().table.to_csv('ma_zip_geography.csv', index=False)
@@ -0,0 +1,154 @@
+"""Incremental pipeline: stage outputs cached under a fingerprint of their inputs
+
+A Stage writes one file from its input files, its parameters and the outputs
+of the stages it depends on. Its fingerprint hashes all of these (the
+fingerprint of an upstream stage stands for its output), and the output is
+kept in the cache directory under that fingerprint, so a run only recomputes
+the stages whose inputs changed and copies the others from the cache:
+
+    orgs = Stage('greater_boston_orgs', write_orgs, files=[wgi_list], params={'zips': zips})
+    report = Stage('greater_boston_report/2021', write_report, deps=[orgs], files=[soi_cache])
+    Pipeline('cache').run(report)   # path of the cached report
+
+Stage names may contain '/', each name gets its own directory in the cache.
+Pipeline.run_all runs independent stages on threads.
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+import profiling
+from downloads import sha256sum
+
+
+# outputs kept per stage, switching back to recent inputs reuses them
+KEEP = 3
+
+# (path, size, mtime) -> SHA-256, files are hashed once per process
+file_hashes = {}
+
+
+def file_hash(path):
+    """SHA-256 of a file, remembered while its size and mtime do not change"""
+    stat = os.stat(path)
+    key = (str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns)
+    if key not in file_hashes:
+        file_hashes[key] = sha256sum(path)
+    return file_hashes[key]
+
+
+def fingerprint(value):
+    """SHA-256 of a JSON serializable value"""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+@dataclass
+class Stage:
+    """One node of the pipeline graph
+
+    Args:
+        name (str): unique name, also the cache directory of the stage
+        func (callable): func(output_file, *dep_outputs) writes the output of the stage
+        deps (list(Stage)): stages whose outputs func reads
+        files (list(Path)): input files, hashed into the fingerprint
+        params (dict): other inputs (year, ZIP set, ...), JSON serializable
+        suffix (str): suffix of the output file
+        version (int): bump when func changes what it writes
+    """
+    name: str
+    func: callable
+    deps: list = field(default_factory=list)
+    files: list = field(default_factory=list)
+    params: dict = field(default_factory=dict)
+    suffix: str = '.csv'
+    version: int = 1
+
+
+class Pipeline:
+    """Run stages against a cache directory, see the module docstring"""
+
+    def __init__(self, cache_dir, force=False):
+        self.cache_dir = Path(cache_dir)
+        self.force = force
+        # name -> Future of (fingerprint, output) of the stages run by this pipeline
+        self.done = {}
+        self.lock = threading.Lock()
+
+    def fingerprint(self, stage):
+        dep_keys = [self.done[dep.name].result()[0] for dep in stage.deps]
+        return fingerprint({
+            'name': stage.name,
+            'version': stage.version,
+            'params': stage.params,
+            'files': [file_hash(f) for f in stage.files],
+            'deps': dep_keys,
+        })
+
+    def run(self, stage):
+        """Path of the cached output of `stage`, its dependencies run first
+
+        The stage is computed only if no output with its fingerprint is
+        cached (or the pipeline was created with force=True). A stage already
+        running on another thread is waited for instead of run twice.
+        """
+        with self.lock:
+            running = self.done.get(stage.name)
+            if running is None:
+                self.done[stage.name] = Future()
+        if running is not None:
+            return running.result()[1]
+        try:
+            output = self.compute(stage)
+        except BaseException as e:
+            self.done[stage.name].set_exception(e)
+            raise
+        return output
+
+    def compute(self, stage):
+        dep_outputs = [self.run(dep) for dep in stage.deps]
+        key = self.fingerprint(stage)
+        output = self.cache_dir / stage.name / f'{key[:16]}{stage.suffix}'
+        with profiling.stage(f'pipeline {stage.name}', fingerprint=key[:16]) as record:
+            record['cached'] = output.exists() and not self.force
+            if record['cached']:
+                # keeps recently used outputs from being pruned
+                os.utime(output)
+            else:
+                os.makedirs(output.parent, exist_ok=True)
+                part_file = output.with_name(f'{output.stem}.{os.getpid()}.part{stage.suffix}')
+                try:
+                    stage.func(part_file, *dep_outputs)
+                    os.replace(part_file, output)
+                finally:
+                    if part_file.exists():
+                        os.remove(part_file)
+                prune(output.parent)
+        self.done[stage.name].set_result((key, output))
+        return output
+
+    def run_all(self, stages, max_workers=None):
+        """run() each stage on a thread pool, returns their outputs in order"""
+        with ThreadPoolExecutor(max_workers=max_workers or len(stages)) as executor:
+            return list(executor.map(self.run, stages))
+
+
+def prune(directory, keep=KEEP):
+    """Remove all but the `keep` most recently used outputs of a stage"""
+    outputs = sorted((f for f in Path(directory).iterdir() if f.is_file() and '.part' not in f.suffixes),
+                     key=os.path.getmtime, reverse=True)
+    for f in outputs[keep:]:
+        os.remove(f)
+
+
+def publish(cached, dest):
+    """Copy a cached output to its place in the output folder"""
+    dest = Path(dest)
+    os.makedirs(dest.parent, exist_ok=True)
+    part_file = dest.with_name(dest.name + '.part')
+    shutil.copyfile(cached, part_file)
+    os.replace(part_file, dest)
+    return dest
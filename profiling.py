@@ -0,0 +1,147 @@
+"""Per-stage timing and memory instrumentation
+
+    with stage('download', url=link) as record:
+        ...
+        record['bytes_written'] = size
+
+Every stage records wall time, CPU time and peak RSS; callers add rows_in,
+rows_out, bytes_read or bytes_written when they know them. Stages nest, and
+the records of a run are written as JSON by write_run_report. Peak RSS is a
+process-wide measure, stages overlapping on other threads (downloads) share it. Stages run in
+worker processes are gathered with collect() and merged back with extend().
+
+When cProfile output is enabled (--profile), stages marked `hot` also dump
+a .prof file and a text summary of their slowest functions.
+"""
+import os
+import json
+import time
+import resource
+import threading
+import contextlib
+from datetime import datetime
+from pathlib import Path
+
+
+records = []
+profile_dir = None
+local = threading.local()
+
+
+def open_stages():
+    """Stack of the stages open on this thread"""
+    if not hasattr(local, 'stages'):
+        local.stages = []
+    return local.stages
+
+
+def enable_cprofile(directory):
+    global profile_dir
+    profile_dir = Path(directory) if directory else None
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+
+def reset_peak_rss():
+    # Linux only: resets VmHWM of the process
+    with contextlib.suppress(OSError):
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+
+
+def peak_rss():
+    """Peak resident memory of this process in bytes (since the last reset_peak_rss on Linux)"""
+    with contextlib.suppress(OSError):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+
+@contextlib.contextmanager
+def stage(name, hot=False, **info):
+    """Record one pipeline stage, yields the record so the caller can add counts"""
+    stack = open_stages()
+    record = {'stage': name, 'pid': os.getpid(), 'depth': len(stack), **info}
+    if stack:
+        # the peak of the enclosing stage so far would be lost by the reset
+        stack[-1]['_peak'] = max(stack[-1]['_peak'], peak_rss())
+    reset_peak_rss()
+    record['_peak'] = 0
+    stack.append(record)
+    profiler = None
+    if hot and profile_dir and threading.current_thread() is threading.main_thread() \
+            and not any(r.get('_profiled') for r in stack):
+        import cProfile
+        record['_profiled'] = True
+        profiler = cProfile.Profile()
+    wall, cpu = time.perf_counter(), time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+    except BaseException as e:
+        record['error'] = repr(e)
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+            dump_profile(profiler, record)
+        record['wall_s'] = round(time.perf_counter() - wall, 4)
+        record['cpu_s'] = round(time.process_time() - cpu, 4)
+        peak = max(record.pop('_peak'), peak_rss())
+        record['peak_rss_mb'] = round(peak / 2**20, 1)
+        record.pop('_profiled', None)
+        stack.pop()
+        if stack:
+            stack[-1]['_peak'] = max(stack[-1]['_peak'], peak)
+        records.append(record)
+
+
+def dump_profile(profiler, record):
+    import pstats
+    stem = f'{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}_{record["stage"]}'.replace(' ', '_').replace('/', '_')
+    prof_file = profile_dir / f'{stem}.prof'
+    profiler.dump_stats(prof_file)
+    with open(profile_dir / f'{stem}.txt', 'w') as f:
+        pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(30)
+    record['profile'] = str(prof_file)
+
+
+@contextlib.contextmanager
+def collect():
+    """Gather the records of the stages run inside the block, for returning them from a worker process"""
+    start = len(records)
+    collected = []
+    try:
+        yield collected
+    finally:
+        collected.extend(records[start:])
+        del records[start:]
+
+
+def extend(worker_records):
+    records.extend(worker_records)
+
+
+def write_run_report(path, **info):
+    """Write the stage records of this run, in the order the stages finished, as JSON"""
+    os.makedirs(Path(path).parent, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'created': datetime.now().isoformat(timespec='seconds'), **info, 'stages': records},
+                  f, indent=2, default=str)
+    return path
+
+
+def reset():
+    """Forget the stages inherited from the parent, called when a worker process starts"""
+    del records[:]
+    del open_stages()[:]
@@ -0,0 +1,121 @@
+"""Column layouts of the input files, keyed by source and year
+
+The IRS renames and re-cases columns between years ('ein' in the Form 990
+extract, 'EIN' in the 990-EZ one, 'taxpd' or 'tax_pd'), and some WGI sheets
+have a title line above the header. Each layout maps canonical column names to
+the header variants seen in the published files. resolve reads only the first
+lines of a file, once per file version, and returns what the single real read
+needs:
+
+    skiprows, usecols = resolve('Form 990 Extract', csv_file, ['EIN', 'totcntrbgfts'], year=2021)
+    df = pd.read_csv(csv_file, skiprows=skiprows, usecols=list(usecols)).rename(columns=usecols)
+
+A new layout is a new Layout entry, for the years it was published.
+"""
+import os
+import re
+import csv
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(frozen=True)
+class Layout:
+    # canonical name -> header variants, matched ignoring case and surrounding spaces
+    columns: dict
+    # years published with this layout, None for any year
+    years: range = None
+
+
+BMF_COLUMNS = ['EIN', 'NAME', 'ICO', 'STREET', 'CITY', 'STATE', 'ZIP', 'GROUP', 'SUBSECTION', 'AFFILIATION',
+               'CLASSIFICATION', 'RULING', 'DEDUCTIBILITY', 'FOUNDATION', 'ACTIVITY', 'ORGANIZATION', 'STATUS',
+               'TAX_PERIOD', 'ASSET_CD', 'INCOME_CD', 'FILING_REQ_CD', 'PF_FILING_REQ_CD', 'ACCT_PD',
+               'ASSET_AMT', 'INCOME_AMT', 'REVENUE_AMT', 'NTEE_CD', 'SORT_NAME']
+
+SCHEMAS = {
+    'Form 990 Extract': [
+        Layout({'EIN': ('ein',), 'tax_pd': ('tax_pd', 'taxpd'), 'totcntrbgfts': ('totcntrbgfts',)}),
+    ],
+    'Form 990-EZ Extract': [
+        Layout({'EIN': ('EIN',), 'tax_pd': ('taxpd', 'tax_pd'), 'totcntrbs': ('totcntrbs',)}),
+    ],
+    'BMF': [
+        Layout({column: (column,) for column in BMF_COLUMNS}),
+    ],
+    'WGI': [
+        Layout({'EIN': ('EIN',), 'Name': ('Name', 'Organization Name', 'NAME')}),
+    ],
+}
+# lines searched for the header row
+HEADER_LINES = 5
+
+# (path, mtime, size) -> first lines of the file
+headers = {}
+
+
+def file_year(path):
+    """Year in the name of an IRS file such as 'Form 990 Extract XLSX (2021).csv', None if absent"""
+    match = re.search(r'\((\d{4})\)', Path(path).name)
+    return int(match.group(1)) if match else None
+
+
+def normalize(name):
+    return str(name).strip().lower()
+
+
+def read_header(path):
+    """First HEADER_LINES rows of a csv or xlsx, or the column names of a Parquet file, read once per file version"""
+    stat = os.stat(path)
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    if key not in headers:
+        if Path(path).suffix == '.parquet':
+            import pyarrow.parquet as pq
+            headers[key] = [pq.read_schema(path).names]
+        elif Path(path).suffix == '.xlsx':
+            from xlsx_reader import read_rows
+            headers[key] = read_rows(path, HEADER_LINES)
+        else:
+            with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+                reader = csv.reader(f)
+                headers[key] = [row for _, row in zip(range(HEADER_LINES), reader)]
+    return headers[key]
+
+
+def layouts(source, year=None):
+    if source not in SCHEMAS:
+        raise ValueError(f'No schema for {source}, use one of {", ".join(SCHEMAS)}')
+    return [layout for layout in SCHEMAS[source] if layout.years is None or year is None or year in layout.years]
+
+
+def match(layout, header, columns):
+    """{header name: canonical name} of `columns` in `header`, None if one of them is missing"""
+    names = {normalize(name): name for name in header}
+    found = {}
+    for column in columns:
+        variants = [names[normalize(v)] for v in layout.columns.get(column, ()) if normalize(v) in names]
+        if not variants:
+            return None
+        found[variants[0]] = column
+    return found
+
+
+def resolve(source, path, columns=None, year=None):
+    """Header row and names of the canonical `columns` (all of the layout by default) in `path`
+
+    Only the first lines of `path` are read. `year` selects the layouts of
+    that year, it defaults to the year in the file name.
+
+    Returns:
+        tuple(int, dict): rows to skip before the header, {header name: canonical name}
+
+    Raises ValueError if no layout of `source` has all the columns.
+    """
+    year = year if year is not None else file_year(path)
+    rows = read_header(path)
+    for layout in layouts(source, year):
+        for skiprows, header in enumerate(rows):
+            found = match(layout, header, columns or list(layout.columns))
+            if found is not None:
+                return skiprows, found
+    raise ValueError(f'{Path(path).name} has none of the {source} layouts for {year or "any year"} '
+                     f'with columns {", ".join(columns or [])}, header: {", ".join(rows[0] if rows else [])}')
@@ -0,0 +1,258 @@
+"""Offline bundles of the HTTP responses of a run: record once, replay without network
+
+    python tec.py 2021 --snapshot record     # live run, every response is saved in snapshots/latest
+    python tec.py 2021 --snapshot replay     # the same run served from the bundle, no request leaves the machine
+
+A bundle is a directory that can be copied to another machine or to CI:
+
+    bundle.json          version of the bundle layout and creation time
+    entries/ab/<key>     status, headers and body digest of one request, named by the SHA-256 of method and URL
+    blobs/cd/<digest>    response bodies named by their SHA-256, a body served at several URLs is stored once
+
+The requests of tec.py, downloads.py and wgi_client.iter_orgs all go through
+requests.Session.send, which activate replaces. The aiohttp requests of
+WgiClient.get_json call record_body and replay_body themselves. Downloads that
+the manifest of downloads.py finds current are added with capture_file, so a
+bundle recorded in a working directory that already has the data still
+replays into an empty one.
+
+Entries are written one file each, so worker processes record into the same bundle.
+"""
+import io
+import os
+import json
+import uuid
+import shutil
+import hashlib
+from pathlib import Path
+from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+# layout of bundle.json, entries/ and blobs/, a bundle of another version is refused
+FORMAT_VERSION = 1
+MODES = ('record', 'replay')
+CHUNK_SIZE = 10_000_000
+# request headers dropped while recording, so every recorded body is complete
+PARTIAL_HEADERS = ('Range', 'If-Range', 'If-None-Match', 'If-Modified-Since')
+# response headers of the transfer, the stored body is already decoded
+TRANSFER_HEADERS = ('Content-Encoding', 'Transfer-Encoding')
+
+# 'record', 'replay' or None, see activate
+mode = None
+bundle = None
+live_send = requests.Session.send
+
+
+class SnapshotMiss(requests.ConnectionError):
+    """A request replayed from a bundle that does not hold it"""
+
+
+def request_key(method, url, params=None):
+    """METHOD and URL with the query parameters sorted, the same for requests and aiohttp"""
+    scheme, netloc, path, query, _ = urlsplit(url)
+    items = parse_qsl(query, keep_blank_values=True)
+    for name, value in (params or {}).items():
+        items += [(name, v) for v in value] if isinstance(value, (list, tuple)) else [(name, value)]
+    query = urlencode(sorted((str(name), str(value)) for name, value in items))
+    return f'{method.upper()} {urlunsplit((scheme, netloc, path, query, ""))}'
+
+
+def digest_name(digest):
+    return Path(digest[:2]) / digest
+
+
+class Bundle:
+    """Content-addressed store of responses in `directory`"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def create(self):
+        os.makedirs(self.directory / 'entries', exist_ok=True)
+        os.makedirs(self.directory / 'blobs', exist_ok=True)
+        manifest = self.directory / 'bundle.json'
+        if manifest.exists():
+            self.check()
+        else:
+            self.write(manifest, {'format': FORMAT_VERSION, 'created': datetime.now().isoformat(timespec='seconds')})
+
+    def check(self):
+        try:
+            with open(self.directory / 'bundle.json') as f:
+                version = json.load(f).get('format')
+        except FileNotFoundError:
+            raise FileNotFoundError(f'No snapshot bundle in {self.directory}, record one with --snapshot record')
+        if version != FORMAT_VERSION:
+            raise ValueError(f'Snapshot bundle {self.directory} has format {version}, '
+                             f'this version reads format {FORMAT_VERSION}, record it again')
+
+    def write(self, path, value):
+        """Write JSON atomically, processes recording the same entry leave one complete file"""
+        os.makedirs(path.parent, exist_ok=True)
+        tmp_file = path.with_name(f'{path.name}.{uuid.uuid4().hex}.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(value, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, path)
+
+    def entry_file(self, key):
+        return self.directory / 'entries' / digest_name(hashlib.sha256(key.encode()).hexdigest())
+
+    def blob_file(self, digest):
+        return self.directory / 'blobs' / digest_name(digest)
+
+    def put_body(self, chunks):
+        """Store a body given as an iterable of bytes, returns its digest"""
+        digest = hashlib.sha256()
+        tmp_file = self.directory / 'blobs' / f'{uuid.uuid4().hex}.tmp'
+        with open(tmp_file, 'wb') as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+        return self.keep(tmp_file, digest.hexdigest())
+
+    def put_file(self, path):
+        """Store the content of a file, linked instead of copied when it is on the same file system"""
+        from downloads import sha256sum
+        digest = sha256sum(path)
+        if not self.blob_file(digest).exists():
+            tmp_file = self.directory / 'blobs' / f'{uuid.uuid4().hex}.tmp'
+            try:
+                os.link(path, tmp_file)
+            except OSError:
+                shutil.copyfile(path, tmp_file)
+            self.keep(tmp_file, digest)
+        return digest
+
+    def keep(self, tmp_file, digest):
+        blob = self.blob_file(digest)
+        if blob.exists():
+            os.remove(tmp_file)
+        else:
+            os.makedirs(blob.parent, exist_ok=True)
+            os.replace(tmp_file, blob)
+        return digest
+
+    def put(self, key, url, status, reason, headers, digest):
+        """Save the entry of `key`, the headers describe the body as stored
+
+        A body recorded decoded is no longer the Content-Length sent with it: the
+        header is rewritten to the size stored, or dropped for a HEAD request,
+        whose decoded size is unknown.
+        """
+        encoded = any(name.title() == 'Content-Encoding' for name in headers)
+        headers = {name: value for name, value in headers.items() if name.title() not in TRANSFER_HEADERS}
+        if encoded:
+            headers = {name: value for name, value in headers.items() if name.title() != 'Content-Length'}
+            if not key.startswith('HEAD '):
+                headers['Content-Length'] = str(os.path.getsize(self.blob_file(digest)))
+        self.write(self.entry_file(key), {'key': key, 'url': url, 'status': status, 'reason': reason,
+                                          'headers': headers, 'body': digest})
+
+    def get(self, key):
+        try:
+            with open(self.entry_file(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+
+def activate(new_mode, directory):
+    """Record into or replay from the bundle in `directory`, or go back to live requests when `new_mode` is None"""
+    global mode, bundle
+    if new_mode not in (None, *MODES):
+        raise ValueError(f'Snapshot mode must be one of {", ".join(MODES)}, not {new_mode}')
+    new_bundle = Bundle(directory) if new_mode else None
+    if new_mode == 'record':
+        new_bundle.create()
+    elif new_mode == 'replay':
+        new_bundle.check()
+    mode, bundle = new_mode, new_bundle
+    requests.Session.send = send if mode else live_send
+
+
+def send(session, request, **kwargs):
+    """requests.Session.send of a recording or replaying run"""
+    if mode == 'replay':
+        return replay_request(request)
+    for header in PARTIAL_HEADERS:
+        request.headers.pop(header, None)
+    response = live_send(session, request, **kwargs)
+    record_response(request, response)
+    return response
+
+
+def record_response(request, response):
+    key = request_key(request.method, request.url)
+    if response._content_consumed or request.method == 'HEAD':
+        digest = bundle.put_body([response.content or b''])
+    else:
+        # a streamed body is saved first, then read back from the bundle by the caller
+        digest = bundle.put_body(response.iter_content(CHUNK_SIZE))
+        response.raw = open(bundle.blob_file(digest), 'rb')
+        response._content, response._content_consumed = False, False
+    bundle.put(key, response.url, response.status_code, response.reason, response.headers, digest)
+
+
+def is_not_modified(request, headers):
+    """True when a conditional request names the recorded version"""
+    etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+    return ((etag is not None and request.headers.get('If-None-Match') == etag)
+            or (last_modified is not None and request.headers.get('If-Modified-Since') == last_modified))
+
+
+def replay_request(request):
+    key = request_key(request.method, request.url)
+    entry = bundle.get(key)
+    if entry is None and request.method == 'HEAD':
+        # a download recorded with capture_file has no HEAD of its own
+        entry = bundle.get(request_key('GET', request.url))
+    if entry is None:
+        raise SnapshotMiss(f'{key} is not in the snapshot {bundle.directory}', request=request)
+    response = requests.Response()
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response.status_code, response.reason, response.url = entry['status'], entry['reason'], entry['url']
+    response.request = request
+    response.encoding = get_encoding_from_headers(response.headers)
+    if request.method == 'HEAD' or not entry['body']:
+        response.raw = io.BytesIO(b'')
+    elif response.status_code == 200 and is_not_modified(request, response.headers):
+        response.status_code, response.reason, response.raw = 304, 'Not Modified', io.BytesIO(b'')
+    else:
+        response.raw = open(bundle.blob_file(entry['body']), 'rb')
+    return response
+
+
+def record_body(method, url, params, status, headers, body):
+    """Save a response read with another client than requests (aiohttp)"""
+    key = request_key(method, url, params)
+    bundle.put(key, url, status, None, dict(headers), bundle.put_body([body]))
+
+
+def replay_body(method, url, params=None):
+    """Body of a response saved with record_body or send"""
+    key = request_key(method, url, params)
+    entry = bundle.get(key)
+    if entry is None:
+        raise SnapshotMiss(f'{key} is not in the snapshot {bundle.directory}')
+    with open(bundle.blob_file(entry['body']), 'rb') as f:
+        return f.read()
+
+
+def capture_file(url, path, validators):
+    """Add a download served from the local copy to the bundle, as the GET response of `url`
+
+    `validators` are the ETag, Last-Modified and size recorded by downloads.py.
+    """
+    key = request_key('GET', url)
+    if mode != 'record' or bundle.get(key) is not None:
+        return
+    headers = {'Content-Length': str(os.path.getsize(path))}
+    if validators.get('etag'):
+        headers['ETag'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['Last-Modified'] = validators['last_modified']
+    bundle.put(key, url, 200, 'OK', headers, bundle.put_file(path))
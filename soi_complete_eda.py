@@ -1,19 +1,31 @@
+from pathlib import Path
 import pandas as pd
+from ein_index import ein_keys
+from schemas import resolve
+from soi_dataset import build_dataset
+from tec import latest_filings
 
 
+# years of SOI extracts explored, each one adds a partition per form to the dataset
+years = [2023]
+soi_extracts = sorted(f for year in years for f in Path(f'input_files/{year}').glob('Form 990*Extract*.xlsx'))
 
-soi_990_ez_dir = 'input_files/2023/Form 990-EZ extract XLSX (2023).csv'
-soi_990_dir = 'input_files/2023/Form 990 extract XLSX (2023).csv'
 
-soi_990_df = pd.read_csv(soi_990_dir)
-soi_990_ez_df = pd.read_csv(soi_990_ez_dir)
+def read_with_schema(source, path, columns):
+    # header row and column names come from the schema registry, so 'ein' and 'EIN' both become EIN
+    skiprows, names = resolve(source, path, columns)
+    return pd.read_csv(path, skiprows=skiprows).rename(columns=names)
+
 
 WGI_dir = 'input_files/WGI/WGI_6.0_EIN_10-6-2024.csv'
-WGI_df = pd.read_csv(WGI_dir,skiprows=1)
+WGI_df = read_with_schema('WGI', WGI_dir, ['EIN'])
+WGI_df['EIN'] = ein_keys(WGI_df['EIN'])
 
-soi_990_df.rename(columns={'ein':'EIN'},inplace=True)
+# every column of the extracts, but only the rows of the WGI EINs are loaded, one partition at a time
+soi_dataset = build_dataset(soi_extracts).years(*years)
+soi_df = soi_dataset.where(eins=WGI_df['EIN']).to_pandas()
 
-soi_df = pd.concat([soi_990_df,soi_990_ez_df])
+# one row per EIN, otherwise EINs with several returns multiply the rows of the merge
+soi_df = latest_filings(soi_df, f'SOI {"-".join(map(str, years))}')
 
 expanded_df = WGI_df.merge(soi_df,how='left',on='EIN')
-
@@ -0,0 +1,218 @@
+"""Lazy, partitioned dataset of the full-width IRS SOI extracts
+
+The Form 990 and 990-EZ extracts have hundreds of columns per year. Each
+extract is written once as Parquet partitions, one file per block of rows read
+from the xlsx or csv, under <root>/year=<year>/form=<990|990-EZ>/. A SoiDataset
+then only records which years, forms, columns and EINs are wanted; the files
+are read one partition at a time, with the columns projected and the EIN filter
+applied by pyarrow before rows reach pandas. Row groups whose EIN range misses
+the filter are not read at all:
+
+    dataset = build_dataset(Path('input_files').glob('20*/Form 990*Extract*.xlsx'))
+    wgi_rows = dataset.select(['EIN', 'tax_pd', 'totrevenue']).where(eins=wgi['EIN']).to_pandas()
+
+EIN and tax_pd are named as in schemas.py whatever the year, the other columns
+keep their IRS names. Columns that a form or year does not have are <NA> for
+its rows.
+"""
+import os
+import shutil
+from dataclasses import dataclass, replace
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from profiling import stage, file_size
+
+
+DATASET_DIR = Path('input_files') / 'soi_dataset'
+# partition value of each form, see tec.SOI_CACHE_COLUMNS
+FORMS = {'Form 990 Extract': '990', 'Form 990-EZ Extract': '990-EZ'}
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16()), ('form', pa.string())]), flavor='hive')
+# rows per partition of a csv extract, an xlsx is cut in the blocks of xlsx_reader
+PARTITION_ROWS = 50_000
+# rows per Parquet row group, each partition is sorted by EIN so a row group covers a narrow EIN range
+ROW_GROUP_ROWS = 10_000
+# written last in a partition directory, records the extract it was built from and the layout version
+SOURCE_FILE = 'SOURCE'
+# version 2: partitions sorted by EIN in row groups of ROW_GROUP_ROWS, tax_pd nullable
+LAYOUT_VERSION = 2
+
+
+def partition_dir(root, year, form):
+    return Path(root) / f'year={year}' / f'form={FORMS[form]}'
+
+
+def is_current(directory, src):
+    """True when `directory` holds complete partitions of `src` written after it"""
+    source = Path(directory) / SOURCE_FILE
+    return (source.exists() and source.read_text() == f'{Path(src).name}\n{LAYOUT_VERSION}'
+            and os.path.getmtime(source) >= os.path.getmtime(src))
+
+
+def extract_chunks(src, skiprows, workers=None):
+    if Path(src).suffix == '.xlsx':
+        from tec import xlsx_blocks
+        from xlsx_reader import iter_xlsx
+        workers, chunk_bytes = xlsx_blocks(workers)
+        return iter_xlsx(src, skiprows=skiprows, workers=workers, chunk_bytes=chunk_bytes)
+    return pd.read_csv(src, skiprows=skiprows, chunksize=PARTITION_ROWS, low_memory=False)
+
+
+def write_partitions(src, root=DATASET_DIR, force=False, workers=None):
+    """Write the rows of one SOI extract as Parquet partitions of the dataset under `root`
+
+    Every column is kept. EIN becomes int64 (ein_index.MISSING_EIN when it is not
+    a number) and tax_pd a nullable Int32, <NA> when blank, so the EIN filter
+    and latest_filings work across years. Each partition is sorted by EIN and
+    written in row groups of ROW_GROUP_ROWS, whose EIN min/max statistics let
+    the EIN filter skip them. The partitions are written beside the final
+    directory and moved into place once complete.
+
+    Args:
+        src (Path): xlsx or csv extract downloaded from the IRS, its name gives form and year
+        root (Path): directory of the dataset
+        force (bool): rewrite even if the partitions of `src` are up to date
+        workers (int): processes parsing an xlsx, one per CPU by default, fewer under --max-memory
+
+    Returns:
+        Path: directory of the partitions
+    """
+    from accounting import to_int64
+    from ein_index import ein_keys
+    from schemas import file_year, resolve
+    from tec import soi_form
+    src = Path(src)
+    form, year = soi_form(src), file_year(src)
+    if form is None or year is None:
+        raise ValueError(f'{src.name} is not a Form 990 or 990-EZ extract named with its year')
+    dest = partition_dir(root, year, form)
+    if not force and is_current(dest, src):
+        return dest
+    building = dest.with_name(dest.name + '.tmp')
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    with stage('soi dataset', hot=True, file=src.name, bytes_read=file_size(src), rows_out=0) as record:
+        skiprows, names = resolve(form, src, ['EIN', 'tax_pd'], year=year)
+        for i, df in enumerate(extract_chunks(src, skiprows, workers)):
+            df = df.rename(columns=names)
+            df['EIN'] = ein_keys(df['EIN'])
+            df['tax_pd'] = to_int64(df['tax_pd']).astype('Int32')
+            df = df.sort_values('EIN', kind='stable')
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), building / f'part-{i:05d}.parquet',
+                           row_group_size=ROW_GROUP_ROWS)
+            record['rows_out'] += len(df)
+        (building / SOURCE_FILE).write_text(f'{src.name}\n{LAYOUT_VERSION}')
+        shutil.rmtree(dest, ignore_errors=True)
+        os.replace(building, dest)
+        record['bytes_written'] = sum(file_size(f) for f in dest.glob('*.parquet'))
+    print(f'Wrote {record["rows_out"]} rows of {src.name} to {dest}')
+    return dest
+
+
+def build_dataset(sources, root=DATASET_DIR, force=False, workers=None):
+    """Write the partitions of each extract in `sources` (see write_partitions) and open the dataset"""
+    for src in sources:
+        write_partitions(src, root, force=force, workers=workers)
+    return SoiDataset(root)
+
+
+def common_type(types):
+    """Type a column is read as when its partitions disagree: the number type that holds them all, else string"""
+    types = set(types) - {pa.null()}
+    if len(types) == 1:
+        return types.pop()
+    if all(pa.types.is_integer(t) for t in types):
+        return pa.int64()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        return pa.float64()
+    return pa.string() if types else pa.null()
+
+
+def unified_schema(files):
+    """Schema covering the columns of every partition, read from the Parquet footers only"""
+    types = {}
+    for f in files:
+        for field in pq.read_schema(f):
+            types.setdefault(field.name, []).append(field.type)
+    fields = [(name, common_type(column_types)) for name, column_types in types.items()]
+    return pa.schema(fields + list(PARTITIONING.schema))
+
+
+@dataclass(frozen=True)
+class SoiDataset:
+    """Selection of years, forms, columns and EINs of the SOI dataset under `root`, nothing is read until iterated
+
+    select, where, years and forms return narrower datasets. partitions() yields one
+    DataFrame per Parquet file and to_pandas() concatenates them.
+    """
+    root: Path = DATASET_DIR
+    columns: tuple = None
+    eins: np.ndarray = None
+    year_values: tuple = None
+    form_values: tuple = None
+
+    def select(self, columns):
+        """Only read `columns`, year and form are columns of the partitions"""
+        return replace(self, columns=tuple(columns))
+
+    def where(self, eins):
+        """Only read the rows of `eins` (ints or strings such as '04-2103580')"""
+        from ein_index import ein_keys
+        return replace(self, eins=np.unique(ein_keys(eins)))
+
+    def years(self, *years):
+        return replace(self, year_values=tuple(int(y) for y in years))
+
+    def forms(self, *forms):
+        """Only read the extracts of `forms`, '990' or '990-EZ'"""
+        return replace(self, form_values=tuple(forms))
+
+    def dataset(self):
+        files = sorted(Path(self.root).glob('year=*/form=*/part-*.parquet'))
+        if not files:
+            raise FileNotFoundError(f'No SOI partitions under {self.root}, see build_dataset')
+        return ds.dataset([str(f) for f in files], format='parquet', partitioning=PARTITIONING,
+                          partition_base_dir=str(self.root), schema=unified_schema(files))
+
+    def filter(self):
+        """pyarrow expression of the selection, None to read every row"""
+        conditions = []
+        if self.year_values is not None:
+            conditions.append(ds.field('year').isin(list(self.year_values)))
+        if self.form_values is not None:
+            conditions.append(ds.field('form').isin(list(self.form_values)))
+        if self.eins is not None:
+            conditions.append(ds.field('EIN').isin(pa.array(self.eins, type=pa.int64())))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def partitions(self):
+        """Yield the selected rows and columns one partition at a time"""
+        dataset = self.dataset()
+        columns = list(self.columns) if self.columns is not None else None
+        if columns is not None:
+            missing = set(columns) - set(dataset.schema.names)
+            if missing:
+                raise ValueError(f'No column {", ".join(sorted(missing))} in the SOI dataset')
+        expression = self.filter()
+        for fragment in dataset.get_fragments(filter=expression):
+            table = fragment.to_table(schema=dataset.schema, columns=columns, filter=expression)
+            if table.num_rows:
+                yield table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype(), pa.int32(): pd.Int32Dtype()}.get)
+
+    def to_pandas(self):
+        """The selected rows and columns as one DataFrame"""
+        with stage('soi scan', root=str(self.root), rows_out=0) as record:
+            chunks = list(self.partitions())
+            if chunks:
+                df = pd.concat(chunks, ignore_index=True)
+            else:
+                schema = self.dataset().schema
+                df = schema.empty_table().select(list(self.columns or schema.names)).to_pandas()
+            record['rows_out'] = len(df)
+        return df
@@ -1,70 +1,298 @@
+from __future__ import annotations
 import os
 import sys
 import re
+import traceback
+import argparse
 from pathlib import Path
 import csv
-from zipcodes import greater_boston_zipcodes
-import concurrent.futures
-import pandas as pd
-from bs4 import BeautifulSoup
-from tqdm import tqdm
-from xlsx2csv import Xlsx2csv
-import requests
+import functools
 from datetime import datetime
+from dataclasses import dataclass, replace
+import profiling
+from profiling import stage, file_size
+from config import Config, pool_context
+# pandas, numpy, pyarrow, requests, BeautifulSoup and the modules
+# built on them are imported in the functions that use them, so --help and
+# --check start without loading them
 #import logging
 
 
-WGI_URL = 'https://wgi.communityplatform.us/'
-WGI_API_BASE = 'https://wgi.communityplatform.us/platform-api/'
-STATE = 'MA'
-ORG_LIST_URL = f'{WGI_API_BASE}search/base-search?page=1&perPage=10000&orderBy=revenue&keywordType=all&resultType=all&states[]={STATE}'
-# https://wgi.communityplatform.us/platform-api/search/base-search?page=1&perPage=10000&orderBy=revenue&keywordType=all&resultType=all&states[]=MA
-IRS_SRC_URL = 'https://www.irs.gov/statistics/soi-tax-stats-annual-extract-of-tax-exempt-organization-financial-data'
+# organizations requested per page of the WGI base-search endpoint
+ORG_LIST_PAGE_SIZE = 1000
 DEV_EMAIL = 'dhee.panwar@dell.com'
 #script_dir = Path(os.path.dirname(os.path.abspath(sys.argv[0])))
 API = 'https://wgi.communityplatform.us/platform-api/search/base-search?page=1&perPage=40&orderBy=revenue&keywordType=all&resultType=all&states%5B%5D=MA&onlyFilers=true&searchView=map'
 
-IRS_ORG_LIST = 'https://www.irs.gov/charities-non-profits/exempt-organizations-business-master-file-extract-eo-bmf'
+# Columns kept in the typed SOI cache, keyed by the form named in the IRS file name
+SOI_CACHE_COLUMNS = {
+    'Form 990-EZ Extract': ['EIN', 'tax_pd', 'totcntrbs'],
+    'Form 990 Extract': ['EIN', 'tax_pd', 'totcntrbgfts'],
+}
+# EINs have 9 digits and fit in uint32, amounts can exceed it, tax periods are YYYYMM, <NA> when blank
+SOI_DTYPES = {'EIN': 'uint32', 'tax_pd': 'Int32', 'totcntrbgfts': 'int64', 'totcntrbs': 'int64'}
+# written into the metadata of the SOI caches, older caches are rebuilt. 2: nullable tax_pd
+SOI_CACHE_VERSION = b'2'
+# SOI cache columns that are not joined onto the reports
+SOI_KEY_COLUMNS = ['EIN', 'tax_pd']
+# rough in-memory cost of one parsed row, used to size chunks under --max-memory
+SOI_ROW_BYTES = 2_000
+BMF_ROW_BYTES = 500
+# size of one row of a BMF csv, sets the blocks of bmf.read_bmf under --max-memory
+BMF_CSV_ROW_BYTES = 120
+# memory held per byte of xlsx block in flight: its XML and the columns parsed from it
+XLSX_BLOCK_COST = 3
+# smallest xlsx block under --max-memory, smaller ones only add per-block overhead
+MIN_XLSX_CHUNK_BYTES = 2**20
 
-current_directory = os.getcwd()
-output_folder_path = Path(os.path.join(current_directory, 'output_files'))
-input_folder_path = Path(os.path.join(current_directory, 'input_files'))
-logs = Path(os.path.join(current_directory, 'logs'))
-WGI_file = input_folder_path/'WGI'/'WGI_MA_Only_11_6_23.csv'
+# settings of the run, see get_config and configure
+config = None
 
 
-def download_file(link, filepath, force=False):
-    if not os.path.exists(filepath) or force:
-        response = requests.get(link, stream=True)
-        print(response)
-        with open(filepath, 'wb') as f:
-            # 10MB chunk size
-            for chunk in tqdm(response.iter_content(chunk_size=10_000_000),
-                              desc=f'Downloading {filepath.name}'):
-                if chunk:
-                    f.write(chunk)
+def parse_size(size_str):
+    """Parse a size such as `512M` or `2G` into bytes"""
+    units = {'K': 2**10, 'M': 2**20, 'G': 2**30}
+    size_str = size_str.strip().upper().rstrip('B')
+    if size_str[-1:] in units:
+        return int(float(size_str[:-1]) * units[size_str[-1]])
+    return int(size_str)
+
+
+def get_config():
+    """Config of this run, created from the working directory on first use"""
+    global config
+    if config is None:
+        config = Config()
+    return config
+
+
+def configure(new_config=None, **changes):
+    """Set the Config of this run, or change some of its fields: configure(max_memory=2**30)
+
+    The snapshot mode of the Config is applied to every HTTP request of the process (see snapshot.py).
+    """
+    global config
+    config = replace(new_config or get_config(), **changes)
+    # snapshot imports requests, only load it when a snapshot is or was in use
+    if config.snapshot or 'snapshot' in sys.modules:
+        import snapshot
+        snapshot.activate(config.snapshot, config.snapshot_dir)
+    return config
+
+
+def init_worker(run_config):
+    """Initializer of the worker processes: the Config and --profile output of the parent"""
+    configure(run_config)
+    profiling.reset()
+    profiling.enable_cprofile(run_config.profile_dir)
+
+
+def cpu_budget():
+    """CPUs this process may keep busy: its share of the run, or all of them"""
+    return get_config().cpus or os.cpu_count() or 1
+
+
+def worker_config(workers):
+    """Config of each of `workers` processes running side by side, with its share of the CPUs and memory
+
+    Pools nest (years, then the conversions of a year, then the blocks of an
+    xlsx). Each level splits the budget of its own process, so the run as a
+    whole stays within --max-memory and the CPU count.
+    """
+    run_config = get_config()
+    max_memory = run_config.max_memory
+    return replace(run_config, cpus=max(1, cpu_budget() // workers),
+                   max_memory=None if max_memory is None else max_memory // workers)
+
+
+def chunk_rows(row_bytes):
+    """Rows per chunk that fit the memory budget, None when there is no budget"""
+    max_memory = get_config().max_memory
+    if max_memory is None:
+        return None
+    # leave room for the previous chunk and the frames being built from it
+    return max(10_000, max_memory // (4 * row_bytes))
+
+
+def xlsx_blocks(workers=None):
+    """Worker processes and decompressed XML per block of xlsx_reader.iter_xlsx that fit the memory budget
+
+    map_blocks keeps up to PENDING_PER_WORKER blocks per worker in flight,
+    plus the block being cut. Without a budget this is `workers` (the CPUs
+    of cpu_budget by default) and xlsx_reader.CHUNK_BYTES. With one, blocks shrink
+    down to MIN_XLSX_CHUNK_BYTES, then workers are dropped.
+
+    Returns:
+        tuple(int, int): workers and chunk_bytes
+    """
+    from xlsx_reader import CHUNK_BYTES, PENDING_PER_WORKER
+    workers = workers or cpu_budget()
+    max_memory = get_config().max_memory
+    if max_memory is None:
+        return workers, CHUNK_BYTES
+    # blocks held at once by workers and the one being cut
+    blocks = max_memory // (XLSX_BLOCK_COST * MIN_XLSX_CHUNK_BYTES)
+    workers = max(1, min(workers, (blocks - 1) // PENDING_PER_WORKER))
+    chunk_bytes = max_memory // (XLSX_BLOCK_COST * (PENDING_PER_WORKER * workers + 1))
+    return workers, max(MIN_XLSX_CHUNK_BYTES, min(chunk_bytes, CHUNK_BYTES))
+
+
+def read_csv_chunks(file_name, row_bytes, **kwargs):
+    """pd.read_csv as a list of one frame, or a chunk iterator under a memory budget"""
+    import pandas as pd
+    rows = chunk_rows(row_bytes)
+    if rows is None:
+        return [pd.read_csv(file_name, **kwargs)]
+    return pd.read_csv(file_name, chunksize=rows, **kwargs)
+
+
+def concat_chunks(chunks):
+    """pd.concat that keeps categorical columns categorical when chunk categories differ"""
+    import pandas as pd
+    chunks = list(chunks)
+    if len(chunks) == 1:
+        return chunks[0]
+    columns = {}
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            columns[column] = pd.api.types.union_categoricals([c[column] for c in chunks])
+        else:
+            columns[column] = pd.concat([c[column] for c in chunks], ignore_index=True)
+    return pd.DataFrame(columns)
 
 
 def xlsx_to_csv(src, dest=None, force=False):
+    """Write the first sheet of `src` as a csv with Xlsx2csv, for the files that are kept as csv
+
+    Xlsx2csv applies the number format of each cell (2018, 0.49%). The SOI
+    extracts are not converted, build_soi_cache reads them with xlsx_reader.
+    """
     stem = src.stem
     if dest is None:
         dest = src.with_suffix('.csv')
     if not os.path.exists(dest) or force:
         print(f'Converting {stem}.xslx to {stem}.csv...')
-        print(f'This process can take upto 5-10 minutes. Please Wait!')
-        Xlsx2csv(str(src), outputencoding='utf-8').convert(str(dest))
+        from xlsx2csv import Xlsx2csv
+        with stage('xlsx_to_csv', hot=True, file=src.name, bytes_read=file_size(src)) as record:
+            Xlsx2csv(str(src), outputencoding='utf-8').convert(str(dest))
+            record['bytes_written'] = file_size(dest)
     #print("Dest\n")
     #print(dest)
     return dest
 
 
+def soi_form(src):
+    """Form of an IRS SOI extract (a key of SOI_CACHE_COLUMNS), or None if the file is not used by the index"""
+    for form in SOI_CACHE_COLUMNS:
+        if form.lower() in src.name.lower():
+            return form
+    return None
+
+
+def ein_index_dir(cache_file):
+    """Directory of the memory-mappable EIN index saved next to a SOI cache"""
+    return cache_file.with_suffix('.ein')
+
+
+def soi_amounts(df):
+    """Contribution columns of a SOI extract, the ones joined onto the reports"""
+    return [c for c in df.columns if c not in SOI_KEY_COLUMNS]
+
+
+def latest_filings(df, name=''):
+    """Keep one return per EIN, the one with the latest tax period (tax_pd)
+
+    The extracts can hold amended or multi-period returns of an EIN, which
+    would count its contributions more than once. A return without a tax
+    period (<NA>) is only kept when the EIN has no other.
+    """
+    with stage('dedupe', file=name, rows_in=len(df)) as record:
+        df = (df.sort_values(['EIN', 'tax_pd'], kind='stable', na_position='first')
+              .drop_duplicates('EIN', keep='last'))
+        record['rows_out'] = len(df)
+        record['collapsed'] = record['rows_in'] - len(df)
+    if record['collapsed']:
+        print(f'{name}: kept the latest return of each EIN, {record["collapsed"]} older returns dropped')
+    return df
+
+
+def build_soi_cache(src, columns, dest=None, force=False, workers=None):
+    """Write a typed, column-projected Parquet cache of an IRS SOI extract
+
+    Only `columns` are parsed, straight from the xlsx (see xlsx_reader.py) or
+    from a csv, and they are stored with the types of SOI_DTYPES. Later stages read the cache
+    instead of the full-width extract, so a rerun for the same year does not reparse it.
+    EINs with several returns keep only the latest one (see `latest_filings`).
+    The EIN index of the cache is saved alongside it (see `ein_index_dir`).
+
+    Args:
+        src (Path): xlsx or csv extract downloaded from the IRS
+        columns (list(str)): canonical columns to keep, found in the header with schemas.resolve
+        dest (Path): cache file, defaults to `src` with a .parquet suffix
+        force (bool): rebuild even if an up to date cache exists
+        workers (int): processes parsing an xlsx, the CPUs of cpu_budget by default, fewer under --max-memory
+            (see xlsx_blocks)
+
+    Returns:
+        Path: location of the cache
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from accounting import parse_amounts, to_int64
+    from ein_index import EinIndex
+    from schemas import file_year, resolve
+    from xlsx_reader import iter_xlsx
+    if dest is None:
+        dest = src.with_suffix('.parquet')
+    # the pandas metadata of the schema reads tax_pd back as a nullable Int32
+    schema = pa.Schema.from_pandas(pd.DataFrame({c: pd.Series(dtype=SOI_DTYPES[c]) for c in columns}),
+                                   preserve_index=False)
+    schema = schema.with_metadata({**schema.metadata, b'soi_cache': SOI_CACHE_VERSION})
+    # caches of older versions, such as blank tax periods written as 0, are rebuilt
+    if (os.path.exists(dest) and not force
+            and os.path.getmtime(dest) >= os.path.getmtime(src)
+            and pq.read_schema(dest).equals(schema)
+            and pq.read_schema(dest).metadata.get(b'soi_cache') == SOI_CACHE_VERSION):
+        return dest
+    with stage('conversion', hot=True, file=dest.name, bytes_read=file_size(src), rows_out=0) as record:
+        skiprows, usecols = resolve(soi_form(src), src, columns, year=file_year(src))
+        if src.suffix == '.xlsx':
+            workers, chunk_bytes = xlsx_blocks(workers)
+            chunks = iter_xlsx(src, list(usecols), skiprows=skiprows, workers=workers, chunk_bytes=chunk_bytes)
+        else:
+            chunks = read_csv_chunks(src, SOI_ROW_BYTES, skiprows=skiprows, usecols=list(usecols))
+        with pq.ParquetWriter(dest, schema) as writer:
+            for df in chunks:
+                df = df.rename(columns=usecols)[columns]
+                for column in columns:
+                    # a blank tax period stays missing, latest_filings ranks it below every period
+                    values = to_int64(df[column]) if column == 'tax_pd' else parse_amounts(df[column])[0]
+                    df[column] = values.astype(SOI_DTYPES[column])
+                writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+                record['rows_out'] += len(df)
+        df = latest_filings(pd.read_parquet(dest), dest.name)
+        if len(df) < record['rows_out']:
+            pq.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False), dest)
+            record['rows_out'] = len(df)
+        EinIndex.from_frame(df, columns=soi_amounts(df)).save(ein_index_dir(dest))
+        record['bytes_written'] = file_size(dest)
+    print(f'Cached {", ".join(columns)} of {src.name} in {dest.name}')
+    return dest
+
+
 def get_download_links():
     """Parse download links for excel forms from IRS website
 
     Returns:
         dict(int:list(dict{filename, link})): list of excel download links for each year
     """
-    r = requests.get(IRS_SRC_URL)
+    import requests
+    from bs4 import BeautifulSoup
+    irs_src_url = get_config().irs_src_url
+    with stage('link scraping', url=irs_src_url) as record:
+        r = requests.get(irs_src_url)
+        record['bytes_read'] = len(r.content)
     soup = BeautifulSoup(r.text, 'html.parser')
     # get all <h2> that appear before tables
     #pint(soup)
@@ -85,7 +313,105 @@ def get_download_links():
     return download_links
 
 
-def download_raw_data(year: int, force=False):
+def fetch_download_links():
+    """get_download_links, raising RuntimeError if the IRS website could not be used"""
+    import requests
+    try:
+        download_links = get_download_links()
+    except requests.RequestException:
+        raise RuntimeError(f'Could not access IRS website ({get_config().irs_src_url})')
+    if not download_links:
+        raise RuntimeError('Could not parse IRS website to fetch links')
+    return download_links
+
+
+@dataclass
+class SoiData:
+    """IRS SOI extracts for one year, parsed once and shared by the index total and the reports"""
+    year: int
+    extract_990: pd.DataFrame
+    extract_990_ez: pd.DataFrame
+    index_990: EinIndex = None
+    index_990_ez: EinIndex = None
+    cache_files: tuple = ()
+
+    def __post_init__(self):
+        from ein_index import EinIndex
+        if self.index_990 is None:
+            self.index_990 = EinIndex.from_frame(self.extract_990, columns=soi_amounts(self.extract_990))
+        if self.index_990_ez is None:
+            self.index_990_ez = EinIndex.from_frame(self.extract_990_ez, columns=soi_amounts(self.extract_990_ez))
+
+    def fingerprint(self):
+        """Identifies the extracts in pipeline fingerprints: hashes of the cache files, or of the data"""
+        import pandas as pd
+        from pipeline import file_hash
+        if self.cache_files:
+            return [file_hash(f) for f in self.cache_files]
+        return [int(pd.util.hash_pandas_object(df, index=False).sum())
+                for df in (self.extract_990, self.extract_990_ez)]
+
+    @property
+    def total_contributions(self):
+        with stage('aggregation', year=self.year,
+                   rows_in=len(self.extract_990) + len(self.extract_990_ez)):
+            return int(self.extract_990['totcntrbgfts'].sum()) + int(self.extract_990_ez['totcntrbs'].sum())
+
+    def join(self, df, name='merge'):
+        """Add the Form 990 and 990-EZ contributions of each EIN in `df`"""
+        with stage(f'{name} 990', year=self.year, rows_in=len(df)) as record:
+            df = self.index_990.join(df)
+            record['rows_out'] = len(df)
+        with stage(f'{name} 990-EZ', year=self.year, rows_in=len(df)) as record:
+            df = self.index_990_ez.join(df)
+            record['rows_out'] = len(df)
+        return df
+
+
+def load_ein_index(cache_file):
+    """Memory-map the EIN index of a SOI cache, None if it is missing or older than the cache"""
+    index_dir = ein_index_dir(cache_file)
+    ein_file = index_dir / 'EIN.npy'
+    if not os.path.exists(ein_file) or os.path.getmtime(ein_file) < os.path.getmtime(cache_file):
+        return None
+    from ein_index import EinIndex
+    return EinIndex.load(index_dir)
+
+
+def load_soi_data(year, irs_990_extract_file, irs_990_ez_file):
+    """Load the cached Form 990 and 990-EZ extracts of a year into a SoiData"""
+    with stage('load soi cache', year=year,
+               bytes_read=file_size(irs_990_extract_file) + file_size(irs_990_ez_file)) as record:
+        soi_data = SoiData(year,
+                           process_irs_990_extract_file(irs_990_extract_file),
+                           process_irs_990_ez_file(irs_990_ez_file),
+                           load_ein_index(irs_990_extract_file),
+                           load_ein_index(irs_990_ez_file),
+                           (irs_990_extract_file, irs_990_ez_file))
+        record['rows_out'] = len(soi_data.extract_990) + len(soi_data.extract_990_ez)
+    return soi_data
+
+
+def convert_extract(xlsx_file, force=False, workers=None):
+    """Convert one downloaded IRS file, runs in a worker process of download_raw_data
+
+    `workers` processes parse the xlsx, by default the CPUs the worker was
+    given (see worker_config and build_soi_cache).
+
+    Returns:
+        tuple(str, Path, list): form of the extract, its cache and the profiling records of the worker,
+            form is None for files the index does not use
+    """
+    form = soi_form(xlsx_file)
+    with profiling.collect() as records:
+        if form is None:
+            cache_file = xlsx_to_csv(xlsx_file, force=force)
+        else:
+            cache_file = build_soi_cache(xlsx_file, SOI_CACHE_COLUMNS[form], force=force, workers=workers)
+    return form, cache_file, records
+
+
+def download_raw_data(year: int, force=False, download_workers=4, convert_workers=None, download_links=None):
     """Download excel files from the IRS website corresponding to the year and convert to CSV
     Example of exported file: `input_files/2021/Form 990 Extract (2021).csv`
 
@@ -94,97 +420,95 @@ def download_raw_data(year: int, force=False):
 
     Args:
         year (int): year for which files to download
+        force (bool): download and convert again even if local copies exist
+        download_workers (int): concurrent downloads
+        convert_workers (int): conversion processes, defaults to one per file up to cpu_budget().
+            Each gets an equal share of the CPUs and of --max-memory
+        download_links (dict): result of get_download_links, fetched when not given
+
+    Returns:
+        SoiData: the Form 990 and 990-EZ extracts of the year, loaded from the cache
     """
     # https://pythonprogramming.net/introduction-scraping-parsing-beautiful-soup-tutorial/
     # https://www.crummy.com/software/BeautifulSoup/bs4/doc/
-    try:
-        download_links = get_download_links()
-    except requests.RequestException:
-        raise RuntimeError(f'Could not access IRS website ({IRS_SRC_URL})')
-    if not download_links:
-        raise RuntimeError('Could not parse IRS website to fetch links')
+    import concurrent.futures
+    from downloads import download_file
+    if download_links is None:
+        download_links = fetch_download_links()
     if year not in download_links:
         raise ValueError(f'Year {year} is unavailable')
 
     # download files into directory
 
-    download_folder = input_folder_path / f'{year}'
+    download_folder = get_config().input_folder / f'{year}'
     os.makedirs(download_folder, exist_ok=True)
-    total_contrib = 0
-    for file in download_links[year]:
-    
-        name = download_folder / file['name']
-        xlsx_file = name.with_suffix('.xlsx')
-        download_file(file['link'], xlsx_file, force=force)
-        csv_file = str(xlsx_to_csv(xlsx_file, force=force))
-        if '990-EZ' in csv_file:
-            with open(csv_file) as f:
-                total_contrib += sum(int(r['totcntrbs']) for r in csv.DictReader(f))
-        elif 'Form 990 Extract' in csv_file:
-            with open(csv_file) as f:
-                total_contrib += sum(int(r['totcntrbgfts']) for r in csv.DictReader(f))
-        #comment below
-       ## print(f'{name.stem} headers: ', end='')
-       # with open(csv_file) as f:
-       #      csv_reader = csv.reader(f, delimiter = ',')
-       #      for row in csv_reader:
-       #          print(', '.join(row))
-       #          break
-    #comment above 
+    cache_files = {}
+    convert_workers = convert_workers or min(len(download_links[year]), cpu_budget())
+    # downloads run on an I/O thread pool, each finished file is handed to a
+    # process pool for conversion while the remaining downloads continue
+    with concurrent.futures.ThreadPoolExecutor(max_workers=download_workers) as io_pool, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=convert_workers, mp_context=pool_context(),
+                                                   initializer=init_worker,
+                                                   initargs=(worker_config(convert_workers),)) as cpu_pool:
+        downloads = [io_pool.submit(download_file, file['link'],
+                                    (download_folder / file['name']).with_suffix('.xlsx'), force)
+                     for file in download_links[year]]
+        conversions = [cpu_pool.submit(convert_extract, future.result(), force)
+                       for future in concurrent.futures.as_completed(downloads)]
+        for future in concurrent.futures.as_completed(conversions):
+            form, cache_file, records = future.result()
+            profiling.extend(records)
+            if form is not None:
+                cache_files[form] = cache_file
     print('Completed required download and CSV conversions')
-    print('Total Contribution:', total_contrib)
-    return total_contrib
+    if set(cache_files) != set(SOI_CACHE_COLUMNS):
+        raise RuntimeError(f'Form 990 and 990-EZ extracts not found for year {year}')
+    soi_data = load_soi_data(year, cache_files['Form 990 Extract'], cache_files['Form 990-EZ Extract'])
+    print('Total Contribution:', soi_data.total_contributions)
+    return soi_data
 
 
 def get_latest_wgi(force=False):
-    r = requests.get(WGI_URL)
+    import requests
+    from bs4 import BeautifulSoup
+    from downloads import download_file
+    r = requests.get(get_config().wgi_url)
     soup = BeautifulSoup(r.text, 'html.parser')
     a_tag = soup.find('a', string='Download The List')
     if not a_tag:
         raise RuntimeError('Could not download WGI list from ')
     dl_link = a_tag['href']
-    wgi_dir = input_folder_path / 'WGI'
+    wgi_dir = get_config().input_folder / 'WGI'
     os.makedirs(wgi_dir, exist_ok=True)
     xlsx_file = wgi_dir / Path(dl_link).name
     download_file(dl_link, xlsx_file, force=force)
     #print("Get latest Wgi done!")
-    return xlsx_to_csv(xlsx_file)
-
-
-def get_org(org_id):
-
-    # https://wgi.communityplatform.us/platform-api/organization/1776515
-    url = f'{WGI_API_BASE}organization/{org_id}'
-    r = requests.get(url)
-    return r.json()
+    # read as is by generate_wgi_in_gb_report, without a csv copy
+    return xlsx_file
 
 
-def get_gba_orgs():
-    """
-    using data from Indiana Women and Girls Index API
-    Get orgs from the Greater Boston Area 
-    If a file is found use that to determine revenue
-    otherwise call api, clean data and save it as a csv
-
-    negative revenue values are counted as 0
-    return int wg_revenue
+def write_gba_orgs(output_file, zip_mask, bmf_file=None):
+    """Fetch the W&G organizations inside `zip_mask` from the WGI API, clean them and save them as a csv
 
+    Organizations whose EIN the API does not give are matched by name and ZIP
+    code against the BMF list `bmf_file` (see matching.py), match_score is the
+    confidence of those matches and empty for EINs given by the API.
     """
-    # greater_boston_zipcodes
-    orgs = requests.get(ORG_LIST_URL).json()['data']
+    from accounting import parse_amounts
+    from wgi_client import iter_orgs, resolve_eins
+    run_config = get_config()
+    # pages are only requested when the organizations are iterated below
+    orgs = iter_orgs(run_config.state, per_page=ORG_LIST_PAGE_SIZE, api_base=run_config.wgi_api_base)
     org_in_state = {}
-    wg_revenue = 0
-    
-    output_file = output_folder_path/'greater_boston_orgs.csv'
-    
-    try:
-        with open(output_file) as f:
-            wg_revenue = sum(int(r['revenue']) for r in csv.DictReader(f))
-    except (FileNotFoundError, ValueError):
-        # https://wgi.communityplatform.us/platform-api/organization/1776515
+    # https://wgi.communityplatform.us/platform-api/organization/1776515
+    with stage('wgi organizations', rows_in=0) as record:
         for org in orgs:
-            org_zip = int(org['zip'])
-            if org_zip in greater_boston_zipcodes:
+            record['rows_in'] += 1
+            try:
+                org_zip = int(str(org['zip']).strip()[:5])
+            except ValueError:
+                continue
+            if 0 <= org_zip < len(zip_mask) and zip_mask[org_zip]:
                 # clean data
                 org.pop('distance')
                 org.pop('icon')
@@ -193,34 +517,99 @@ def get_gba_orgs():
                 org.pop('redirectUrl')
                 org.pop('relevance')
                 org['ein'] = ''
+                org['match_score'] = ''
                 org_in_state[org['organizationId']] = org
-                revenue = org['revenue']
-                #print("Printing Revenue \n")
-                if isinstance(revenue, str):
-                    revenue = revenue.strip()
-                    if revenue[0] == '(' and revenue[-1] == ')':
-                        revenue = f'-{revenue[1:-1]}'
-                    if revenue == '-':
-                        revenue = 0
-                    revenue = int(revenue)
-                org['revenue'] = revenue
-                wg_revenue += revenue
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-            future_to_org = {executor.submit(get_org, org_id): org_id for org_id in org_in_state}
-            # Order is not guaranteed even if you use a list. Use the value part above as an index
-            for future in tqdm(concurrent.futures.as_completed(future_to_org), total=len(future_to_org), desc='Downloading organization data'):
-                try:
-                    org_id = future_to_org[future]
-                    res = future.result()
-                    org_in_state[org_id]['ein'] = res['ein']
-                except ValueError as e:
-                    print(e)
+        # revenues such as '(123)' or '-' are parsed in one pass, unknown revenues are left empty
+        revenues, missing = parse_amounts([org['revenue'] for org in org_in_state.values()])
+        for org, revenue, is_missing in zip(org_in_state.values(), revenues.tolist(), missing.tolist()):
+            org['revenue'] = '' if is_missing else revenue
+        record['rows_out'] = len(org_in_state)
+
+    os.makedirs(run_config.wgi_ein_cache.parent, exist_ok=True)
+    with stage('resolve eins', rows_in=len(org_in_state)) as record:
+        eins = resolve_eins(org_in_state, run_config.wgi_ein_cache, api_base=run_config.wgi_api_base)
+        record['rows_out'] = sum(1 for ein in eins.values() if ein)
+    for org_id, ein in eins.items():
+        org_in_state[org_id]['ein'] = ein
+    missing = [org for org in org_in_state.values() if not org['ein']]
+    if missing and bmf_file is not None:
+        match_eins(missing, update_ma_orgs_file(bmf_file, zip_mask))
 
+    with stage('to_csv', file=output_file.name, rows_out=len(org_in_state)) as record:
         with open(output_file, 'w') as csv_file:
             writer = csv.DictWriter(csv_file, fieldnames=list(next(iter(org_in_state.values())).keys()))
             writer.writeheader()
             writer.writerows(org_in_state.values())
+        record['bytes_written'] = file_size(output_file)
+
+
+def match_eins(orgs, bmf):
+    """Fill the ein and match_score of WGI organizations from their best name match in `bmf`"""
+    import pandas as pd
+    from matching import match_names
+    names = pd.DataFrame({'name': [org['organizationName'] for org in orgs],
+                          'zip': [str(org['zip']) for org in orgs]})
+    if any('city' in org for org in orgs):
+        names['city'] = [org.get('city') for org in orgs]
+    with stage('match names', rows_in=len(orgs), bmf_rows=len(bmf)) as record:
+        matches = match_names(names, bmf)
+        record['rows_out'] = len(matches)
+    for row, ein, score in zip(matches.index, matches['EIN'], matches['score']):
+        orgs[row]['ein'] = f'{ein // 10**7:02d}-{ein % 10**7:07d}'
+        orgs[row]['match_score'] = round(score, 2)
+    print(f'EINs of {len(matches)} of {len(orgs)} organizations without one found by name')
+
+
+def wgi_orgs_stage(zip_mask, name='greater_boston_orgs'):
+    """Pipeline stage of the csv of the W&G organizations inside `zip_mask` (see write_gba_orgs)
+
+    The organizations are fetched again only when the latest WGI list or the
+    area changed since the last run (see pipeline.py). `name` is the pipeline
+    stage, areas used side by side need their own name.
+    """
+    import numpy as np
+    from pipeline import Stage
+    bmf_file = get_ma_orgs_list()
+    # version 2: EINs matched by name when the API has none
+    return Stage(name, functools.partial(write_gba_orgs, zip_mask=zip_mask, bmf_file=bmf_file),
+                 files=[get_latest_wgi(), bmf_file],
+                 params={'state': get_config().state, 'zips': np.flatnonzero(zip_mask).tolist()},
+                 version=2)
+
+
+def wgi_orgs_file(zip_mask, name='greater_boston_orgs', force=False):
+    """Cached csv of the W&G organizations inside `zip_mask`, see wgi_orgs_stage"""
+    from pipeline import Pipeline
+    return Pipeline(get_config().cache_folder, force=force).run(wgi_orgs_stage(zip_mask, name))
+
+
+def get_gba_orgs(zip_mask=None, force=False):
+    """
+    using data from Indiana Women and Girls Index API
+    Get orgs from the Greater Boston Area 
+    The organizations are cached by wgi_orgs_file, copied to
+    output_files/greater_boston_orgs.csv and used to determine revenue
+
+    revenue is parsed with accounting.parse_amounts: negative amounts such as
+    '(1,234)' or '1234-' reduce the total, blank or unreadable ones count as 0
+    return int wg_revenue
+
+    zip_mask is a boolean array indexed by ZIP5 selecting the area, such as
+    load_geography().zip_mask(region='Metro West', county='Suffolk').
+    Defaults to greater_boston_zipcodes
+
+    force fetches the organizations even if they are cached
+    """
+    import pandas as pd
+    from accounting import parse_amounts
+    from geography import load_geography
+    from pipeline import publish
+    from zipcodes import greater_boston_zipcodes
+    if zip_mask is None:
+        zip_mask = load_geography().zip_mask(zips=greater_boston_zipcodes)
+    output_file = publish(wgi_orgs_file(zip_mask, force=force),
+                          get_config().output_folder/'greater_boston_orgs.csv')
+    wg_revenue = int(parse_amounts(pd.read_csv(output_file, usecols=['revenue'])['revenue'])[0].sum())
     print('Organization data for Greater Boston Area found in:', output_file)
     print('Revenue W&G organizations:', wg_revenue)
     return wg_revenue
@@ -228,8 +617,12 @@ def get_gba_orgs():
 
 def get_ma_orgs_list(force=False):
     #Download Massachusetts Orgnaization Data from IRS
+    import requests
+    from bs4 import BeautifulSoup
+    from downloads import download_file
+    irs_org_list = get_config().irs_org_list
     try:
-        r = requests.get(IRS_ORG_LIST)
+        r = requests.get(irs_org_list)
     except: 
         print("Unable to access IRS website check this URL {IRS_ORG_LIST}")
         print(r)
@@ -238,7 +631,7 @@ def get_ma_orgs_list(force=False):
     if not a_tag:
         raise RuntimeError('Could not download Massachusetts Org list from ')       
     dl_link = a_tag['href']
-    wgi_dir = input_folder_path 
+    wgi_dir = get_config().input_folder 
     os.makedirs(wgi_dir, exist_ok=True)
     csv_file = wgi_dir / Path(dl_link).name
     download_file(dl_link, csv_file, force=force)
@@ -257,50 +650,43 @@ def update_ein_header(data_frame):
 #Generate a CSV file with this info
 
 
-def update_ma_orgs_file(file_name=None):
+def update_ma_orgs_file(file_name=None, zip_mask=None):
+    """Organizations of a BMF file with ZIP5 and ZIP4, only those inside `zip_mask` when given
+
+    The file is streamed in blocks by bmf.read_bmf, rows outside of the area are
+    dropped while reading.
+    """
+    from bmf import BLOCK_SIZE, read_bmf
     print(file_name)
-    columns_to_capture = ['EIN','NAME','STREET', 'CITY', 'STATE', 'ZIP']
-    df = pd.read_csv(file_name, usecols=columns_to_capture)
-    df[['ZIP_PART_1', 'ZIP_PART_2']] = df['ZIP'].str.split('-', expand=True)
-    df = df.drop('ZIP', axis=1)
+    rows = chunk_rows(BMF_ROW_BYTES)
+    block_size = BLOCK_SIZE if rows is None else min(BLOCK_SIZE, rows * BMF_CSV_ROW_BYTES)
+    with stage('read bmf', file=Path(file_name).name, bytes_read=file_size(file_name)) as record:
+        df = concat_chunks(read_bmf(file_name, zip_mask=zip_mask, block_size=block_size))
+        record['rows_out'] = len(df)
     return df
 
 
+def write_report(df, output_file, report_format=None):
+    """Write `df` without its index in a writers.FORMATS format, the --format of the run by default"""
+    from writers import get_format
+    report_format = get_format(report_format or get_config().report_format)
+    with stage('write', file=Path(output_file).name, format=report_format.name, rows_out=len(df)) as record:
+        report_format.write(df, output_file)
+        record['bytes_written'] = file_size(output_file)
+    return output_file
+
+
 def process_irs_990_extract_file(file_name):
-    #print("Processing IRS 990 Extract File")
-    try:
-        #print("trying one method!")
-        columns_to_capture = ['ein','totcntrbgfts'] # add function to update this file
-        df = pd.read_csv(file_name, usecols=columns_to_capture)
-        df.rename(columns={'ein':'EIN'},inplace=True)
-    except: 
-        #print("trying 2nd method!")
-        columns_to_capture = ['EIN','totcntrbgfts'] # add function to update this file
-        df = pd.read_csv(file_name, usecols=columns_to_capture)
-    #print("Processing IRS 990 Extract file done!")
-    return df
+    # file_name is the Parquet cache written by build_soi_cache
+    import pandas as pd
+    return pd.read_parquet(file_name, columns=SOI_CACHE_COLUMNS['Form 990 Extract'])
 
 
 def process_irs_990_ez_file(file_name):
-    #print("Processing IRS 990 EX file")
-    try:
-        #print("trying one method!")
-        columns_to_capture = ['ein','totcntrbs'] # add function to update this file
-        df = pd.read_csv(file_name, usecols=columns_to_capture)
-        df.rename(columns={'ein':'EIN'},inplace=True)
-    except: 
-        #print("trying 2nd method!")
-        columns_to_capture = ['EIN','totcntrbs'] # add function to update this file
-        df = pd.read_csv(file_name, usecols=columns_to_capture)
-        #df.head()
-        
-    #print("Processing IRS 990 EX file done!")
-    return df
+    # file_name is the Parquet cache written by build_soi_cache
+    import pandas as pd
+    return pd.read_parquet(file_name, columns=SOI_CACHE_COLUMNS['Form 990-EZ Extract'])
 
-    
-def merge_df(first_df, second_df):
-    merged_df = pd.merge(first_df, second_df, on='EIN', how='left')
-    return merged_df    
 
 
 ###########This is for Greater Boston Area####################
@@ -311,23 +697,11 @@ def merge_df(first_df, second_df):
 # Create a CSV file  with the filtered info
 
 
-def generate_gb_report(year, gb_dataframe, irs_990_extract_dataframe, irs_990_ez_dataframe):
-    try:
-        gb_dataframe.rename(columns={'ein':'EIN'},inplace=True)
-    except:
-        pass
-    gb_dataframe = merge_df(gb_dataframe, irs_990_extract_dataframe)
-    gb_dataframe = merge_df(gb_dataframe, irs_990_ez_dataframe)
+def generate_gb_report(year, gb_dataframe, soi_data, output_file):
+    gb_dataframe = gb_dataframe.rename(columns={'ein':'EIN'})
+    gb_dataframe = soi_data.join(gb_dataframe, name='merge greater boston')
     print("Genrating list of organizations in Greater Boston Area...\n")
-    output_folder_path = Path(os.path.join(current_directory, f'output_files/{year}/'))
-    if not output_folder_path.exists():
-        try: 
-            os.makedirs(output_folder_path, exist_ok=True)
-        except:
-            print("File name already exists!")
-    output_file = os.path.join(output_folder_path, f'greater_boston_report{year}.csv')
-    gb_dataframe.to_csv(output_file)
-    print(f"Greater Boston file generated!! File location {output_file} ")
+    write_report(gb_dataframe, output_file)
     return gb_dataframe
 
 ###########This is for Womens only in GB  ####################
@@ -336,19 +710,125 @@ def generate_gb_report(year, gb_dataframe, irs_990_extract_dataframe, irs_990_ez
 # Update the List with filtered info
 # Create a CSV file  with the filtered info
 
-def generate_wgi_in_gb_report(year, gb_dataframe, wgi_file):
+def generate_wgi_in_gb_report(year, gb_dataframe, wgi_file, output_file):
     columns_to_capture_in_gb=['organizationName','id', 'name', 'description', 'address', 'categories','revenue','EIN', 'totcntrbgfts', 'totcntrbs']
     columns_to_capture_in_wgi=['EIN','Name']
-    wgi_df= pd.read_csv(wgi_file, usecols = columns_to_capture_in_wgi)
-    output_folder_path = Path(os.path.join(current_directory, f'output_files/{year}'))
-    wgi_in_gb_df = merge_df(gb_dataframe, wgi_df)
-    wgi_in_gb_df['w&g_organization'] = 'No'
-    wgi_in_gb_df.loc[wgi_in_gb_df['Name'].notnull(), 'w&g_organization'] = 'Yes'
-    wgi_in_gb_df = wgi_in_gb_df.drop(['Name'], axis=1)
-    output_folder_path = Path(os.path.join(current_directory, f'output_files/{year}/'))
-    output_file = os.path.join(output_folder_path, f'wgi_greater_boston_report{year}.csv')
-    wgi_in_gb_df.to_csv(output_file)
-    print(f"W&G file generated!! File location {output_file} ")
+    import numpy as np
+    import pandas as pd
+    from ein_index import EinIndex
+    from schemas import resolve
+    from xlsx_reader import read_xlsx
+    skiprows, usecols = resolve('WGI', wgi_file, columns_to_capture_in_wgi)
+    if Path(wgi_file).suffix == '.xlsx':
+        wgi_df = read_xlsx(wgi_file, list(usecols), skiprows=skiprows)
+    else:
+        wgi_df = pd.read_csv(wgi_file, skiprows=skiprows, usecols=list(usecols))
+    wgi_df = wgi_df.rename(columns=usecols)
+    wgi_index = EinIndex.from_frame(wgi_df, columns=[])
+    with stage('merge wgi', rows_in=len(gb_dataframe)) as record:
+        wgi_in_gb_df = gb_dataframe.copy()
+        wgi_in_gb_df['w&g_organization'] = np.where(wgi_index.contains(gb_dataframe['EIN']), 'Yes', 'No')
+        record['rows_out'] = len(wgi_in_gb_df)
+    write_report(wgi_in_gb_df, output_file)
+
+
+def generate_ma_report(year, soi_data, ma_orgs_file, output_file):
+    from geography import load_geography
+    ma_orgs_data = update_ma_orgs_file(ma_orgs_file)
+    ma_orgs_dataframe = load_geography().annotate(soi_data.join(ma_orgs_data, name='merge ma'))
+    write_report(zip_parts(ma_orgs_dataframe), output_file)
+
+
+def zip_parts(df):
+    """Replace the integer ZIP5 and ZIP4 by the ZIP_PART_1 and ZIP_PART_2 strings of the reports
+
+    ZIP_PART_1 is '02134' and ZIP_PART_2 '1234', zero-padded so they survive a
+    round trip through CSV and Excel; ZIP_PART_2 is empty when the BMF has no ZIP+4.
+    """
+    parts = {'ZIP_PART_1': df['ZIP5'].astype('string').str.zfill(5),
+             'ZIP_PART_2': df['ZIP4'].astype('string').str.zfill(4)}
+    df = df.drop(columns=['ZIP5', 'ZIP4'])
+    position = list(df.columns).index('STATE') + 1 if 'STATE' in df.columns else len(df.columns)
+    for offset, (name, values) in enumerate(parts.items()):
+        df.insert(position + offset, name, values)
+    return df
+
+
+def read_report(file_name, report_format=None, columns=None):
+    """Read back a report written by write_report, contributions stay integers"""
+    from writers import get_format
+    return get_format(report_format or get_config().report_format).read(file_name, columns)
+
+
+def report_stages(year, soi_data, ma_orgs_file, greater_boston_orgs_file, wgi_file, report_format):
+    """Pipeline stages of the reports of a year, keyed by report name
+
+    MA_orgs_report depends on the BMF list, the geography files and the SOI
+    extracts; greater_boston_report on the Greater Boston organizations and
+    the SOI extracts; wgi_greater_boston_report on greater_boston_report and
+    the WGI list. `report_format` is a writers.ReportFormat.
+    """
+    import pandas as pd
+    from geography import ZIP_CODES_FILE, TOWNS_FILE
+    from pipeline import Stage
+    soi = {'year': year, 'soi': soi_data.fingerprint(), 'format': report_format.name}
+    # version 2: reports are written without the pandas index, 3: MA report with NTEE_CD,
+    # 4: MA report with the zero-padded ZIP_PART_1 and ZIP_PART_2 strings
+    ma_report = Stage(f'MA_orgs_report/{year}',
+                      lambda output: generate_ma_report(year, soi_data, ma_orgs_file, output),
+                      files=[ma_orgs_file, ZIP_CODES_FILE, TOWNS_FILE], params=soi,
+                      suffix=report_format.suffix, version=4)
+    gb_report = Stage(f'greater_boston_report/{year}',
+                      lambda output: generate_gb_report(year, pd.read_csv(greater_boston_orgs_file), soi_data, output),
+                      files=[greater_boston_orgs_file], params=soi,
+                      suffix=report_format.suffix, version=2)
+    wgi_report = Stage(f'wgi_greater_boston_report/{year}',
+                       lambda output, gb_report_file: generate_wgi_in_gb_report(
+                           year, read_report(gb_report_file, report_format.name), wgi_file, output),
+                       deps=[gb_report], files=[wgi_file], params={'year': year, 'format': report_format.name},
+                       suffix=report_format.suffix, version=2)
+    return {'MA_orgs_report': ma_report, 'greater_boston_report': gb_report,
+            'wgi_greater_boston_report': wgi_report}
+
+
+def report_file(year, report, report_format=None):
+    """Path of a report of `year` in output_files/<year>/, such as MA_orgs_report2021.csv"""
+    from writers import get_format
+    report_format = get_format(report_format or get_config().report_format)
+    return get_config().output_folder / f'{year}' / f'{report}{year}{report_format.suffix}'
+
+
+def write_cube(output_file, years, wgi_orgs_file):
+    """Write the cube of cube.py from the MA reports of `years` and the W&G organizations of the state"""
+    import pandas as pd
+    from cube import build_cube
+    from geography import load_geography, zip5
+    columns = ['EIN', 'NTEE_CD', 'totcntrbgfts', 'totcntrbs', 'COUNTY', 'REGION']
+    with stage('cube', years=years) as record:
+        reports = {year: read_report(report_file(year, 'MA_orgs_report'), columns=columns) for year in years}
+        wgi_orgs = pd.read_csv(wgi_orgs_file, usecols=['ein', 'zip', 'revenue'], dtype={'ein': str, 'zip': str})
+        wgi_orgs = load_geography().annotate(wgi_orgs.assign(ZIP5=zip5(wgi_orgs['zip'])))
+        cube = build_cube(reports, wgi_orgs)
+        record['rows_in'] = sum(len(report) for report in reports.values()) + len(wgi_orgs)
+        record['rows_out'] = len(cube)
+    write_report(cube, output_file)
+
+
+def cube_stage(years):
+    """Pipeline stage of the cube of `years`, run after their reports were published
+
+    The W&G organizations of the state are a dependency of the stage, they
+    are only fetched when the pipeline finds no cached copy of them.
+    """
+    from geography import load_geography
+    from pipeline import Stage
+    from writers import get_format
+    report_format = get_format(get_config().report_format)
+    state_orgs = wgi_orgs_stage(load_geography().codes['COUNTY'] >= 0, name='ma_wgi_orgs')
+    return Stage('wg_cube', lambda output, state_orgs_file: write_cube(output, years, state_orgs_file),
+                 deps=[state_orgs], files=[report_file(year, 'MA_orgs_report') for year in years],
+                 params={'years': years, 'format': report_format.name}, suffix=report_format.suffix)
+
 
 def is_valid_year(year_str):
     current_year = datetime.now().year
@@ -366,72 +846,202 @@ def get_valid_year():
         else:
             print("Invalid year. Please enter a valid year.")
             
-def generate_report(year, irs_990_extract_file, irs_990_ez_file, ma_orgs_file, greater_boston_orgs_file):
-    try: 
-        ma_orgs_data = update_ma_orgs_file(ma_orgs_file)
-        irs_990_extract_dataframe = process_irs_990_extract_file(irs_990_extract_file)
-        irs_990_ez_dataframe = process_irs_990_ez_file(irs_990_ez_file)
-        ma_orgs_dataframe = merge_df(ma_orgs_data, irs_990_extract_dataframe)
-        ma_orgs_dataframe = merge_df(ma_orgs_dataframe, irs_990_ez_dataframe)
-        output_folder_path = Path(os.path.join(current_directory, f'output_files/{year}/'))
-        if not output_folder_path.exists():
-            try: 
-                os.makedirs(output_folder_path, exist_ok=True)
-            except:
-                print(f"File name already exists!")
-        output_file = os.path.join(output_folder_path, f'MA_orgs_report{year}.csv')
-        ma_orgs_dataframe.to_csv(output_file)
-        print(f"MA organizations report generated Location {output_file}")
-        #ma_orgs_dataframe.head()
-        gb_dataframe = pd.read_csv(greater_boston_orgs_file)
-        #print(gb_dataframe)
-        gb_report_dataframe = generate_gb_report(year, gb_dataframe, irs_990_extract_dataframe, irs_990_ez_dataframe) 
-        generate_wgi_in_gb_report(year, gb_report_dataframe, WGI_file)
-    except: 
-        print(f"Unable to generate report contact {DEV_EMAIL}")
-        
-                
-    
+def generate_report(year, soi_data, ma_orgs_file, greater_boston_orgs_file, force=False):
+    """Generate the reports of a year into output_files/<year>/ in the --format of the run
+
+    The reports are computed and written concurrently. Reports whose inputs
+    did not change since a previous run are copied from the pipeline cache
+    instead of being recomputed, unless `force` is set.
+    """
+    with stage('generate_report', year=year):
+        try:
+            from pipeline import Pipeline, publish
+            from writers import get_format
+            run_config = get_config()
+            report_format = get_format(run_config.report_format)
+            pipeline = Pipeline(run_config.cache_folder, force=force)
+            stages = report_stages(year, soi_data, ma_orgs_file, greater_boston_orgs_file, run_config.wgi_file,
+                                   report_format)
+            cached_files = pipeline.run_all(list(stages.values()))
+            for report, cached_file in zip(stages, cached_files):
+                output_file = publish(cached_file, report_file(year, report))
+                print(f"{report} generated!! File location {output_file}")
+        except Exception:
+            # the error is recorded in the run report, print it and let the run fail
+            traceback.print_exc()
+            print(f"Unable to generate report for {year} contact {DEV_EMAIL}")
+            raise
+
+
+def parse_years(years_str):
+    """Parse a year (`2021`) or an inclusive range of years (`2019-2023`)
+
+    Raises ValueError if a year is outside the range accepted by is_valid_year
+    """
+    first, _, last = years_str.partition('-')
+    last = last or first
+    if not (is_valid_year(first) and is_valid_year(last)) or int(first) > int(last):
+        raise ValueError(f'Invalid year or range of years: {years_str}')
+    return list(range(int(first), int(last) + 1))
+
+
+def run_year(year, wg_revenue, ma_orgs_file, greater_boston_orgs_file, download_links=None, rebuild=False):
+    """Compute the index of one year and generate its reports, runs in a worker process of build_index_series
+
+    `wg_revenue` is the revenue of the W&G organizations as the WGI platform
+    reports it today, the same for every year (see build_index_series).
+
+    Returns:
+        tuple(dict, list): row of the index series and the profiling records of the worker
+    """
+    with profiling.collect() as records:
+        soi_data = download_raw_data(year, download_links=download_links)
+        total_revenue = soi_data.total_contributions
+        print(f'Processing data to generate MA Orgs, Great Boston Orgs and W&G Orgs in Great Boston for year {year}')
+        generate_report(year, soi_data, ma_orgs_file, greater_boston_orgs_file, force=rebuild)
+    return {
+        'year': year,
+        'current_wg_revenue': wg_revenue,
+        'total_contributions': total_revenue,
+        'percent_contribution': round(wg_revenue / total_revenue * 100, 2),
+    }, records
+
+
+def build_index_series(years, max_workers=None, rebuild=False):
+    """Compute the index for several years in one run
+
+    The year-independent inputs (W&G organizations of the Greater Boston Area,
+    latest WGI list, Massachusetts BMF list and IRS download links) are fetched
+    once, then the years are processed in parallel worker processes.
+    The combined table is written to `output_files/index_series.csv` and the
+    breakdown by region, county and NTEE category (cube.py) to
+    `output_files/wg_cube.<format>`. Organizations, reports and the cube whose
+    inputs did not change are reused from the pipeline cache (`cache/`).
+
+    The WGI platform only gives the latest revenue of each organization, not
+    its revenue by year, so the series has a fixed numerator: every year
+    compares the same current W&G revenue (`current_wg_revenue`, fetched when
+    the organizations were last cached) with the contributions of that year.
+    Changes along the series come from the IRS contributions alone.
+
+    Args:
+        years (list(int)): years to compute
+        max_workers (int): worker processes, defaults to one per year up to cpu_budget().
+            Each gets an equal share of the CPUs and of --max-memory for its conversions
+        rebuild (bool): recompute the organizations and reports even if they are cached
+
+    Returns:
+        pd.DataFrame: year, current_wg_revenue, total_contributions and percent_contribution per year
+    """
+    import concurrent.futures
+    import pandas as pd
+    from pipeline import Pipeline, publish
+    run_config = get_config()
+    wg_revenue = get_gba_orgs(force=rebuild)
+    print("Downloading latest revenue data")
+    get_latest_wgi()
+    ma_orgs_file = get_ma_orgs_list()
+    download_links = fetch_download_links()
+    greater_boston_orgs_file = run_config.output_folder / 'greater_boston_orgs.csv'
+    max_workers = max_workers or min(len(years), cpu_budget())
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=pool_context(),
+                                                initializer=init_worker,
+                                                initargs=(worker_config(max_workers),)) as executor:
+        futures = [executor.submit(run_year, year, wg_revenue, ma_orgs_file,
+                                   greater_boston_orgs_file, download_links, rebuild)
+                   for year in years]
+        rows = []
+        for future in futures:
+            row, records = future.result()
+            profiling.extend(records)
+            rows.append(row)
+    series = pd.DataFrame(rows)
+    output_file = run_config.output_folder / 'index_series.csv'
+    write_report(series, output_file, 'csv')
+    print(f'Index series generated!! File location {output_file}')
+    cube = cube_stage(years)
+    cube_file = publish(Pipeline(run_config.cache_folder, force=rebuild).run(cube),
+                        run_config.output_folder / f'wg_cube{cube.suffix}')
+    print(f'Breakdown by region, county and NTEE generated!! File location {cube_file}')
+    return series
+
+
+def check_years(years):
+    """Validate years without network access and list the inputs and reports already on disk"""
+    run_config = get_config()
+    for year in years:
+        soi_caches = sorted(p.name for p in (run_config.input_folder / f'{year}').glob('*.parquet'))
+        reports = sorted(p.name for p in (run_config.output_folder / f'{year}').glob('*.csv'))
+        print(f'{year}: valid year')
+        print(f'  SOI caches: {", ".join(soi_caches) or "none, downloaded on the next run"}')
+        print(f'  reports: {", ".join(reports) or "none"}')
+
+
+def parse_args(argv=None):
+    from writers import FORMATS, get_format
+    parser = argparse.ArgumentParser(description='Generate the Women and Girls Philanthropy Index of Massachusetts')
+    parser.add_argument('years', nargs='?', type=parse_years,
+                        help='year (2021) or range of years (2019-2023), prompted for when omitted')
+    parser.add_argument('--check', type=parse_years, metavar='YEARS',
+                        help='only validate the year or range of years and show what is already on disk')
+    parser.add_argument('--format', dest='report_format', choices=list(FORMATS), default='csv',
+                        help='format of the reports in output_files/<year>/, parquet is the smallest and fastest')
+    parser.add_argument('--max-memory', type=parse_size,
+                        help='memory budget such as 512M or 2G, large files are then read in chunks')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='recompute the Greater Boston organizations and the reports even if they are cached')
+    parser.add_argument('--profile', action='store_true',
+                        help='also write cProfile output of the hot stages to logs/profile')
+    parser.add_argument('--snapshot', choices=['record', 'replay'],
+                        help='record every HTTP response and download of the run into a bundle, or replay them '
+                             'from it without network access. Recording recomputes the cached stages like --rebuild')
+    parser.add_argument('--snapshot-dir', type=Path,
+                        help='directory of the snapshot bundle, defaults to snapshots/latest')
+    parser.add_argument('--run-report', type=Path,
+                        help='JSON file of the per-stage timings, defaults to logs/run_report_<time>.json')
+    args = parser.parse_args(argv)
+    try:
+        get_format(args.report_format)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
 if __name__ == '__main__':
+    args = parse_args()
+    if args.check:
+        check_years(args.check)
+        sys.exit(0)
+    run_config = get_config()
+    run_config = configure(max_memory=args.max_memory, report_format=args.report_format,
+                           profile_dir=run_config.logs / 'profile' if args.profile else None,
+                           snapshot=args.snapshot, snapshot_dir=args.snapshot_dir or run_config.snapshot_dir)
+    profiling.enable_cprofile(run_config.profile_dir)
+    run_report = args.run_report or run_config.logs / f'run_report_{datetime.now():%Y%m%d_%H%M%S}.json'
     try:
-        if not os.path.exists(output_folder_path):    
-            os.makedirs('output_files', exist_ok=True)
-        if not os.path.exists(input_folder_path):  
-            os.makedirs('input_files', exist_ok=True)
-        if not os.path.exists('logs'):  
-            os.makedirs('logs', exist_ok=True)   
+        if not os.path.exists(run_config.output_folder):    
+            os.makedirs(run_config.output_folder, exist_ok=True)
+        if not os.path.exists(run_config.input_folder):  
+            os.makedirs(run_config.input_folder, exist_ok=True)
+        if not os.path.exists(run_config.logs):  
+            os.makedirs(run_config.logs, exist_ok=True)   
        # logging.basicConfig(filename='logs/script.log', encoding='utf-8', level=logging.DEBUG)
-        xlsx_key_list = input_folder_path/'V2_April_22_WSO_GSO_MA.xlsx'
+        xlsx_key_list = run_config.input_folder/'V2_April_22_WSO_GSO_MA.xlsx'
         #xlsx_key_list = script_dir / 'keys' / 'V2 April 22_WSO_GSO_MA.xlsx'
         while not os.path.exists(xlsx_key_list):
             print(f'Warning file not found: {xlsx_key_list}')
             xlsx_key_list = Path(input('Enter keys source file: '))
-        csv_key_list = xlsx_key_list.with_suffix('.csv')
-        if not os.path.exists(csv_key_list):
-            print('Converting', xlsx_key_list.name, 'to csv')
-            Xlsx2csv(str(xlsx_key_list),
-                    outputencoding='utf-8').convert(str(csv_key_list))
-        year=get_valid_year()
-        wg_revenue = get_gba_orgs()
-        print("Downloading latest revenue data")
-        wgi_latest = get_latest_wgi()
-        total_revenue = download_raw_data(year)
-        print('Percent contribution:', round(wg_revenue / total_revenue * 100, 2), '%')
-        print(f'Processing data to generate MA Orgs, Great Boston Orgs and W&G Orgs in Great Boston for year {year}')
-       
-        ma_orgs_file=get_ma_orgs_list()
-        file_990_extract_name = f'Form 990 Extract XLSX ({year}).csv'
-        file_990_ez_name = f'Form 990-EZ Extract XLSX ({year}).csv'
-        irs_990_extract_file = input_folder_path / str(year) /file_990_extract_name
-        irs_990_ez_file = input_folder_path / str(year) /file_990_ez_name
-        greater_boston_orgs_file = Path(os.path.join(current_directory, 'output_files/greater_boston_orgs.csv')) 
-        try:
-            generate_report(year, irs_990_extract_file, irs_990_ez_file, ma_orgs_file, greater_boston_orgs_file)
-        except:
-            print("Unable to generate the report! Please contact Dhee Panwar <{DEV_EMAIL}>")
+        xlsx_to_csv(xlsx_key_list)
+        years = args.years or [get_valid_year()]
+        with stage('run', years=years):
+            # cached stages make no requests, a recording recomputes them so the bundle is complete
+            series = build_index_series(years, rebuild=args.rebuild or args.snapshot == 'record')
+        for row in series.itertuples():
+            print(f'Percent contribution {row.year}:', row.percent_contribution, '%')
     
     except Exception as e:
         exc_type, exc_tb = sys.exc_info()[0], sys.exc_info()[2]
         print(e.__repr__())
         print(f'\nThe error above was encountered on line {exc_tb.tb_lineno}. Please contact Dhee Panwar <{DEV_EMAIL}>')
-
+    finally:
+        print('Run report:', profiling.write_run_report(run_report, argv=sys.argv[1:]))
@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+from accounting import parse_amounts, to_int64
+
+
+def test_parse_amounts_accounting_notation():
+    values, missing = parse_amounts(['1234-', '(12)', 'n/a', '$1,234.50', '-', '', '1,234', ' 56 '])
+    assert values.tolist() == [-1234, -12, 0, 1234, 0, 0, 1234, 56]
+    assert missing.tolist() == [False, False, True, False, False, True, False, False]
+
+
+def test_parse_amounts_numeric_column():
+    values, missing = parse_amounts(pd.Series([1.0, np.nan, -3.6]))
+    assert values.tolist() == [1, 0, -4]
+    assert missing.tolist() == [False, True, False]
+
+
+def test_to_int64_keeps_missing_values():
+    amounts = to_int64(['(1,000)', 'n/a', '250'])
+    assert str(amounts.dtype) == 'Int64'
+    assert amounts[0] == -1000 and amounts[2] == 250
+    assert pd.isna(amounts[1])
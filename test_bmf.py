@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+from bmf import read_bmf
+
+BMF = """EIN,NAME,ICO,STREET,CITY,STATE,ZIP,NTEE_CD
+042103580,BOSTON FOUNDATION,,75 ARLINGTON ST,BOSTON,MA,02116-3936,T31
+043000001,SPRINGFIELD CLUB,,1 MAIN ST,SPRINGFIELD,MA,01103,N20
+043000002,NO ZIP FUND,,,LENOX,MA,,
+043000003,WORCESTER ARTS,,2 ELM ST,WORCESTER,MA,01608-1234,A20
+"""
+
+
+def write_bmf(tmp_path):
+    path = tmp_path / 'eo_ma.csv'
+    path.write_text(BMF)
+    return path
+
+
+def test_read_bmf_zip_codes(tmp_path):
+    df = pd.concat(read_bmf(write_bmf(tmp_path)), ignore_index=True)
+    assert df['EIN'].tolist() == [42103580, 43000001, 43000002, 43000003]
+    assert 'ZIP' not in df.columns
+    assert str(df['ZIP5'].dtype) == 'UInt32' and str(df['ZIP4'].dtype) == 'UInt16'
+    assert df['ZIP5'].tolist() == [2116, 1103, pd.NA, 1608]
+    assert df['ZIP4'].tolist() == [3936, pd.NA, pd.NA, 1234]
+    assert df['NTEE_CD'].tolist()[:2] == ['T31', 'N20']
+
+
+def test_read_bmf_zip_mask_and_blocks(tmp_path):
+    mask = np.zeros(100_000, dtype=bool)
+    mask[[2116, 1608]] = True
+    blocks = list(read_bmf(write_bmf(tmp_path), zip_mask=mask, block_size=64))
+    assert len(blocks) > 1
+    df = pd.concat(blocks, ignore_index=True)
+    assert df['NAME'].tolist() == ['BOSTON FOUNDATION', 'WORCESTER ARTS']
+
+
+def test_read_bmf_columns(tmp_path):
+    df = next(read_bmf(write_bmf(tmp_path), columns=['EIN', 'NAME']))
+    assert list(df.columns) == ['EIN', 'NAME', 'ZIP5', 'ZIP4']
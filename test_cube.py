@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+import tec
+from config import Config
+from cube import MEASURES, build_cube, rollup
+
+
+def report(contributions):
+    return pd.DataFrame({
+        'EIN': range(1, 6),
+        'NTEE_CD': ['A20', 'B11', None, 'a90', 'B20'],
+        'totcntrbgfts': contributions,
+        'totcntrbs': [None, 5, None, 7, None],
+        'REGION': ['Greater Boston', 'Greater Boston', 'Metro West', 'Western', None],
+        'COUNTY': ['Suffolk', 'Norfolk', 'Middlesex', 'Hampden', None],
+    })
+
+
+@pytest.fixture
+def cube():
+    reports = {2020: report([100, 200, 300, 400, 500]), 2021: report([10, 20, 30, 40, 50])}
+    wgi_orgs = pd.DataFrame({'ein': ['00-0000001', '00-0000004', None], 'revenue': ['1,000', '(50)', '70'],
+                             'REGION': ['Greater Boston', 'Western', 'Metro West'],
+                             'COUNTY': ['Suffolk', 'Hampden', 'Middlesex']})
+    return build_cube(reports, wgi_orgs)
+
+
+def test_totals_of_every_breakdown_equal_the_state_total(cube):
+    state = rollup(cube, ['year'])
+    assert state['contributions'].tolist() == [1512, 162]
+    assert state['orgs'].tolist() == [5, 5]
+    assert state['wg_revenue'].tolist() == [1020, 1020]
+    for by in ['REGION', 'COUNTY', 'NTEE']:
+        totals = rollup(cube, ['year', by]).groupby('year')[MEASURES].sum().reset_index()
+        pd.testing.assert_frame_equal(totals, state[['year'] + MEASURES], check_dtype=False)
+
+
+def test_rollup_selections(cube):
+    suffolk = rollup(cube, ['NTEE'], year=2021, county='Suffolk')
+    assert suffolk[['NTEE', 'contributions', 'wg_revenue']].values.tolist() == [['A', 10, 1000]]
+    assert suffolk['share'].tolist() == [10000.0]
+    assert rollup(cube, [], year=2020, ntee='Z')['contributions'].tolist() == [300]
+    # organizations outside of Massachusetts are kept as Unknown
+    assert rollup(cube, ['REGION'], year=2020).set_index('REGION').loc['Unknown', 'contributions'] == 500
+
+
+def test_cube_stage_depends_on_the_state_organizations(monkeypatch, tmp_path):
+    for name in ['wgi.csv', 'bmf.csv']:
+        (tmp_path / name).write_text('x')
+    monkeypatch.setattr(tec, 'config', Config(root=tmp_path))
+    monkeypatch.setattr(tec, 'get_latest_wgi', lambda: tmp_path / 'wgi.csv')
+    monkeypatch.setattr(tec, 'get_ma_orgs_list', lambda: tmp_path / 'bmf.csv')
+    # building the stage fetches nothing, the pipeline runs the dependency when it is not cached
+    monkeypatch.setattr(tec, 'write_gba_orgs', lambda *args, **kwargs: pytest.fail('organizations fetched'))
+    stage = tec.cube_stage([2021])
+    assert [dep.name for dep in stage.deps] == ['ma_wgi_orgs']
+    assert stage.files == [tec.report_file(2021, 'MA_orgs_report')]
@@ -0,0 +1,110 @@
+import json
+import requests
+import pytest
+import downloads
+from benchmarks.stub_server import StubServer
+from downloads import MANIFEST_NAME, download_file, load_manifest, sha256sum
+
+BODY = b'EIN,NAME\n' + b''.join(b'%09d,ORG %d\n' % (i, i) for i in range(20_000))
+
+
+@pytest.fixture
+def server(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    (data / 'wgi_orgs.json').write_text(json.dumps([]))
+    (data / 'eo_ma.csv').write_bytes(BODY)
+    with StubServer(data) as server:
+        yield server
+
+
+@pytest.fixture
+def gets(monkeypatch):
+    """Status codes of the GET requests of the test"""
+    statuses = []
+    get = requests.get
+
+    def counting_get(*args, **kwargs):
+        response = get(*args, **kwargs)
+        statuses.append(response.status_code)
+        return response
+
+    monkeypatch.setattr(requests, 'get', counting_get)
+    return statuses
+
+
+def interrupt(url, directory, part):
+    """State left by a download interrupted after writing `part` into the .part file"""
+    downloads.update_manifest(directory, url + '#partial', downloads.validators(requests.head(url)))
+    (directory / 'eo_ma.csv.part').write_bytes(part)
+
+
+def test_download_is_recorded_and_skipped_when_current(server, tmp_path, gets):
+    url, dest = server.url('/files/eo_ma.csv'), tmp_path / 'out' / 'eo_ma.csv'
+    dest.parent.mkdir()
+    download_file(url, dest)
+    entry = load_manifest(dest.parent)[url]
+    assert dest.read_bytes() == BODY
+    assert entry['size'] == len(BODY) and entry['sha256'] == sha256sum(dest) and entry['etag']
+    download_file(url, dest)
+    assert gets == [200]
+    # a corrupted copy is downloaded again
+    dest.write_bytes(b'x' * len(BODY))
+    download_file(url, dest)
+    assert gets == [200, 200] and dest.read_bytes() == BODY
+
+
+def test_interrupted_download_is_resumed(server, tmp_path, gets):
+    url, dest = server.url('/files/eo_ma.csv'), tmp_path / 'eo_ma.csv'
+    interrupt(url, tmp_path, BODY[:1000])
+    download_file(url, dest)
+    assert gets == [206]
+    assert dest.read_bytes() == BODY
+    assert not (tmp_path / 'eo_ma.csv.part').exists()
+    assert set(load_manifest(tmp_path)) == {url}
+
+
+def test_not_modified_refreshes_the_manifest_entry(server, tmp_path, gets, monkeypatch):
+    url, dest = server.url('/files/eo_ma.csv'), tmp_path / 'eo_ma.csv'
+    download_file(url, dest)
+    manifest = load_manifest(tmp_path)
+    manifest[url]['last_modified'] = 'Thu, 01 Jan 1970 00:00:00 GMT'
+    manifest[url]['checked'] = 0
+    (tmp_path / MANIFEST_NAME).write_text(json.dumps(manifest))
+    # a HEAD without validators makes the copy uncertain, the conditional GET answers 304
+    head = requests.head
+
+    def head_without_validators(*args, **kwargs):
+        response = head(*args, **kwargs)
+        for name in ('ETag', 'Last-Modified', 'Content-Length'):
+            del response.headers[name]
+        return response
+
+    monkeypatch.setattr(requests, 'head', head_without_validators)
+    download_file(url, dest)
+    assert gets == [200, 304]
+    entry = load_manifest(tmp_path)[url]
+    assert entry['checked'] > 0
+    assert entry['last_modified'] != 'Thu, 01 Jan 1970 00:00:00 GMT'
+    assert set(load_manifest(tmp_path)) == {url}
+
+
+
+def test_complete_part_file_is_finished_without_a_request(server, tmp_path, gets):
+    url, dest = server.url('/files/eo_ma.csv'), tmp_path / 'eo_ma.csv'
+    interrupt(url, tmp_path, BODY)
+    download_file(url, dest)
+    assert gets == []
+    assert dest.read_bytes() == BODY
+    assert load_manifest(tmp_path)[url]['sha256'] == sha256sum(dest)
+    assert set(load_manifest(tmp_path)) == {url}
+
+
+def test_unsatisfiable_range_downloads_again(server, tmp_path, gets):
+    url, dest = server.url('/files/eo_ma.csv'), tmp_path / 'eo_ma.csv'
+    interrupt(url, tmp_path, BODY + b'stale tail')
+    download_file(url, dest)
+    assert gets == [416, 200]
+    assert dest.read_bytes() == BODY
+    assert not (tmp_path / 'eo_ma.csv.part').exists()
+    assert set(load_manifest(tmp_path)) == {url}
@@ -0,0 +1,34 @@
+import pandas as pd
+from ein_index import EinIndex, MISSING_EIN, ein_keys
+
+
+def test_ein_keys():
+    assert ein_keys(['04-2103580', ' 42103581', 'n/a', None]).tolist() == [42103580, 42103581, MISSING_EIN, MISSING_EIN]
+    assert ein_keys(pd.Series([42103580.0, None])).tolist() == [42103580, MISSING_EIN]
+
+
+def test_lookup():
+    index = EinIndex.from_frame(pd.DataFrame({'EIN': [30, 10, 20], 'name': ['c', 'a', 'b']}))
+    pos, found = index.lookup(['20', '00-0000010', 40, 'n/a'])
+    assert found.tolist() == [True, True, False, False]
+    assert index.columns['name'][pos[found]].tolist() == ['b', 'a']
+    assert not EinIndex.from_frame(pd.DataFrame({'EIN': []}), columns=[]).contains([1]).any()
+
+
+def test_join_is_a_left_join_without_duplicates():
+    index = EinIndex.from_frame(pd.DataFrame({'EIN': [10, 20, 20], 'amount': [1, 2, 3], 'name': ['a', 'b', 'c']}))
+    df = pd.DataFrame({'EIN': [20, 30, 10]}, index=[5, 6, 7])
+    joined = index.join(df)
+    assert joined.index.tolist() == [5, 6, 7]
+    # the first row of a duplicated EIN is used
+    assert joined['amount'].tolist() == [2, pd.NA, 1]
+    assert str(joined['amount'].dtype) == 'Int64'
+    assert joined['name'].tolist()[::2] == ['b', 'a'] and pd.isna(joined['name'][6])
+
+
+def test_save_and_load(tmp_path):
+    index = EinIndex.from_frame(pd.DataFrame({'EIN': [20, 10], 'amount': [2, 1]}))
+    index.save(tmp_path / 'index')
+    loaded = EinIndex.load(tmp_path / 'index')
+    assert loaded.ein.tolist() == [10, 20]
+    assert loaded.join(pd.DataFrame({'EIN': [20]}))['amount'].tolist() == [2]
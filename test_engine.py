@@ -0,0 +1,86 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer
+import pandas as pd
+import pytest
+import requests
+from engine import EngineHandler, IndexEngine, UnknownYear
+from geography import zip5
+
+
+@pytest.fixture
+def engine():
+    """Engine holding one year, loaded without downloads"""
+    engine = IndexEngine()
+    geography = engine.geography
+    engine.download_links = {2020: [], 2021: []}
+    engine.ma_orgs = pd.DataFrame()
+    # Boston is in the Greater Boston Area, Springfield is not
+    engine.wgi_orgs = geography.annotate(pd.DataFrame({
+        'ZIP5': zip5(['02108', '01103']), 'revenue': [300, 500]}))
+    orgs = geography.annotate(pd.DataFrame({
+        'EIN': [1, 2, 3], 'NAME': ['A', 'B', 'C'], 'CITY': ['BOSTON', 'BOSTON', 'SPRINGFIELD'],
+        'ZIP5': ['02108', '02108-1234', '01103'], 'contributions': [1000, 3000, 2000]}))
+    engine.years[2021] = {'orgs': orgs, 'zip5': zip5(orgs['ZIP5']), 'irs_total': 60_000}
+    return engine
+
+
+@pytest.fixture
+def server(engine):
+    handler = type('Handler', (EngineHandler,), {'engine': engine})
+    with ThreadingHTTPServer(('127.0.0.1', 0), handler) as httpd:
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        yield f'http://127.0.0.1:{httpd.server_port}'
+        httpd.shutdown()
+
+
+def test_share_without_area_is_the_index_of_tec(engine):
+    # Greater Boston Area W&G revenue over the IRS total
+    assert engine.wg_revenue() == 300
+    assert engine.total(2021) == 60_000
+    assert engine.share(2021) == 0.5
+
+
+def test_queries_of_an_area(engine):
+    assert engine.wg_revenue(county='Hampden') == 500
+    assert engine.total(2021, county='Suffolk') == 4000
+    assert engine.share(2021, county=['Suffolk', 'Hampden']) == round(800 / 6000 * 100, 2)
+    assert engine.top(2021, n=2)['EIN'].tolist() == [2, 3]
+    assert engine.top(2021, zips='01103')['EIN'].tolist() == [3]
+    body = engine.query('share', 2021, region='Greater Boston')
+    assert body == {'year': 2021, 'region': 'Greater Boston', 'share': 7.5, 'wg_revenue': 300, 'total': 4000}
+    with pytest.raises(UnknownYear):
+        engine.load(2019)
+
+
+def test_http_queries(server):
+    r = requests.get(f'{server}/share', params={'year': 2021})
+    assert r.status_code == 200 and r.json()['share'] == 0.5
+    r = requests.get(f'{server}/top', params={'year': 2021, 'n': 1, 'county': 'Suffolk'})
+    assert [org['EIN'] for org in r.json()['top']] == [2]
+
+
+@pytest.mark.parametrize('path, params, status', [
+    ('/median', {'year': 2021}, 404),
+    ('/share', {'year': 2019}, 404),
+    ('/share', {}, 400),
+    ('/share', {'year': 'last'}, 400),
+    ('/top', {'year': 2021, 'n': 'all'}, 400),
+    ('/share', {'year': 2021, 'county': 'Atlantis'}, 400),
+])
+def test_http_errors(server, path, params, status):
+    r = requests.get(server + path, params=params)
+    assert r.status_code == status
+    assert 'error' in r.json()
+
+
+def test_http_error_of_the_query(server, engine, monkeypatch, capsys):
+    def fail(*args, **kwargs):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(engine, 'total', fail)
+    r = requests.get(f'{server}/total', params={'year': 2021})
+    assert r.status_code == 500
+    assert json.loads(r.text) == {'error': 'RuntimeError: disk full'}
+    assert 'disk full' in capsys.readouterr().err
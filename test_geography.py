@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+from geography import load_geography, zip5
+from zipcodes import greater_boston_zipcodes
+
+
+@pytest.fixture(scope='module')
+def geography():
+    return load_geography()
+
+
+def test_zip5_of_every_spelling():
+    zips = [2108, '02108', ' 02108 ', '02108-1234', '021081234', '2108', '10001', None, '', 'N/A']
+    assert zip5(zips).tolist() == [2108, 2108, 2108, 2108, 2108, 2108, 10001, -1, -1, -1]
+    assert zip5(pd.Series([2108.0, np.nan, 123456])).tolist() == [2108, -1, -1]
+
+
+def test_lookup_of_ma_and_other_zips(geography):
+    counties = geography.lookup(['02108', '02108-1234', '01103', '10001', None], 'COUNTY')
+    assert list(counties[:3]) == ['Suffolk', 'Suffolk', 'Hampden']
+    assert counties.isna().tolist() == [False, False, False, True, True]
+    assert geography.lookup(['02108'], 'REGION')[0] == 'Greater Boston'
+
+
+def test_greater_boston_mask_matches_the_zip_set(geography):
+    mask = geography.zip_mask(zips=greater_boston_zipcodes)
+    assert len(greater_boston_zipcodes) == 378
+    assert np.flatnonzero(mask).tolist() == sorted(greater_boston_zipcodes)
+    # the mask gives the same answer as `int(zip) in greater_boston_zipcodes` did
+    zips = ['02108', '02108-1234', '01810', '01103', '10001', '05501', None]
+    assert geography.contains(zips, zips=greater_boston_zipcodes).tolist() == [
+        True, True, True, False, False, True, False]
+
+
+def test_zip_mask_of_regions_and_counties(geography):
+    suffolk = geography.zip_mask(county='Suffolk')
+    assert suffolk[2108] and not suffolk[1103]
+    both = geography.zip_mask(county=['Suffolk', 'Hampden'], zips=['10001'])
+    assert both[2108] and both[1103] and both[10001]
+    assert geography.contains(['02108', '01103'], region='Western').tolist() == [False, True]
+    with pytest.raises(ValueError, match='Unknown county: Atlantis'):
+        geography.zip_mask(county='Atlantis')
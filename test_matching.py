@@ -0,0 +1,38 @@
+import pandas as pd
+from matching import match_names, normalize
+
+BMF = pd.DataFrame({
+    'EIN': [101, 102, 103, 104, 105],
+    'NAME': ['GIRLS INC OF BOSTON', 'BOSTON WOMENS FUND INC', 'WOMENS LUNCH PLACE',
+             'WOMENS LUNCH PLACE', 'SPRINGFIELD GIRLS CLUB'],
+    'CITY': ['BOSTON', 'BOSTON', 'BOSTON', 'BOSTON', 'SPRINGFIELD'],
+    'ZIP5': pd.array([2116, 2116, 2108, 2108, 1103], dtype='UInt32'),
+})
+
+
+def test_normalize():
+    assert normalize(['Girls, Inc. & Co', None]).tolist() == ['GIRLS INC AND CO', pd.NA]
+
+
+def test_match_names_within_the_zip_block():
+    orgs = pd.DataFrame({'name': ['Girls Inc. of Boston', "Boston Women's Fund", 'Springfield Girls Club'],
+                         'zip': ['02116', '02116-1234', '02134']},
+                        index=[10, 11, 12])
+    matches = match_names(orgs, BMF)
+    # rows are positions in orgs, the Springfield club is in another ZIP and has no city to compare
+    assert matches['EIN'].to_dict() == {0: 101}
+    assert matches.loc[0, 'score'] == 1.0
+
+
+def test_match_names_by_city_and_ties():
+    orgs = pd.DataFrame({'name': ['Springfield Girls Club', 'Womens Lunch Place'],
+                         'zip': ['', '02108'], 'city': ['Springfield', 'Boston']})
+    matches = match_names(orgs, BMF)
+    # two BMF entries with the same name and ZIP are ambiguous
+    assert matches['EIN'].to_dict() == {0: 105}
+
+
+def test_match_names_min_score():
+    orgs = pd.DataFrame({'name': ['Girls of Boston Alliance'], 'zip': ['02116']})
+    assert match_names(orgs, BMF, min_score=0.9).empty
+    assert match_names(orgs, BMF, min_score=0.5)['EIN'].tolist() == [101]
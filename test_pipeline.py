@@ -0,0 +1,57 @@
+from pipeline import Pipeline, Stage, publish
+
+
+def counting_stage(name, calls, text, **options):
+    def write(output, *deps):
+        calls.append(name)
+        output.write_text(text + ''.join(dep.read_text() for dep in deps))
+    return Stage(name, write, **options)
+
+
+def test_cached_stage_is_not_recomputed(tmp_path):
+    source = tmp_path / 'input.csv'
+    source.write_text('a')
+    calls = []
+    stage = counting_stage('orgs', calls, 'x', files=[source], params={'year': 2021})
+    first = Pipeline(tmp_path / 'cache').run(stage)
+    second = Pipeline(tmp_path / 'cache').run(stage)
+    assert first == second and calls == ['orgs']
+    assert first.read_text() == 'x'
+
+
+def test_fingerprint_follows_files_params_version_and_deps(tmp_path):
+    source = tmp_path / 'input.csv'
+    source.write_text('a')
+    calls = []
+
+    def stages(year=2021, version=1):
+        orgs = counting_stage('orgs', calls, 'x', files=[source])
+        report = counting_stage('report', calls, 'y', deps=[orgs], params={'year': year}, version=version)
+        return report
+
+    def run(**options):
+        calls.clear()
+        output = Pipeline(tmp_path / 'cache').run(stages(**options))
+        return output, list(calls)
+
+    output, computed = run()
+    assert computed == ['orgs', 'report'] and output.read_text() == 'yx'
+    assert run()[1] == []
+    source.write_text('b')
+    assert run()[1] == ['orgs', 'report']
+    # switching back to earlier inputs reuses their cached outputs
+    source.write_text('a')
+    assert run()[1] == []
+    assert run(year=2022)[1] == ['report']
+    assert run(version=2)[1] == ['report']
+
+
+def test_force_and_publish(tmp_path):
+    calls = []
+    stage = counting_stage('orgs', calls, 'x')
+    Pipeline(tmp_path / 'cache').run(stage)
+    cached = Pipeline(tmp_path / 'cache', force=True).run(stage)
+    assert calls == ['orgs', 'orgs']
+    dest = publish(cached, tmp_path / 'output' / 'orgs.csv')
+    assert dest.read_text() == 'x'
+    assert not list(cached.parent.glob('*.part*'))
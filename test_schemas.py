@@ -0,0 +1,39 @@
+import pytest
+from schemas import file_year, resolve
+
+
+def write(path, text):
+    path.write_text(text)
+    return path
+
+
+def test_file_year(tmp_path):
+    assert file_year('Form 990 Extract XLSX (2021).csv') == 2021
+    assert file_year(tmp_path / 'eo_ma.csv') is None
+
+
+def test_resolve_maps_header_variants(tmp_path):
+    path = write(tmp_path / 'Form 990 Extract (2021).csv', 'EIN,TAXPD,totcntrbgfts,other\n1,202012,5,x\n')
+    skiprows, names = resolve('Form 990 Extract', path, ['EIN', 'tax_pd'])
+    assert skiprows == 0
+    assert names == {'EIN': 'EIN', 'TAXPD': 'tax_pd'}
+
+
+def test_resolve_finds_the_header_below_a_title(tmp_path):
+    path = write(tmp_path / 'WGI_List.csv', 'Women and Girls Index\n\nOrganization Name,EIN\nA,1\n')
+    skiprows, names = resolve('WGI', path, ['EIN', 'Name'])
+    assert skiprows == 2
+    assert names == {'EIN': 'EIN', 'Organization Name': 'Name'}
+
+
+def test_resolve_all_columns_of_a_layout(tmp_path):
+    path = write(tmp_path / 'Form 990-EZ Extract (2021).csv', 'EIN,taxpd,totcntrbs\n1,202012,5\n')
+    assert resolve('Form 990-EZ Extract', path)[1] == {'EIN': 'EIN', 'taxpd': 'tax_pd', 'totcntrbs': 'totcntrbs'}
+
+
+def test_resolve_errors(tmp_path):
+    path = write(tmp_path / 'Form 990 Extract (2021).csv', 'ein,tax_pd\n1,202012\n')
+    with pytest.raises(ValueError, match='totcntrbgfts'):
+        resolve('Form 990 Extract', path, ['EIN', 'totcntrbgfts'])
+    with pytest.raises(ValueError, match='No schema'):
+        resolve('Form 1040', path, ['EIN'])
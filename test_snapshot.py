@@ -0,0 +1,90 @@
+import json
+import pytest
+import requests
+import snapshot
+from benchmarks.stub_server import StubServer
+from downloads import download_file, load_manifest
+from snapshot import Bundle, SnapshotMiss, request_key
+
+ORGS = [{'organizationId': 1, 'name': 'GIRLS INC'}, {'organizationId': 2, 'name': 'WOMENS FUND'}]
+
+
+@pytest.fixture
+def data(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    (data / 'wgi_orgs.json').write_text(json.dumps(ORGS))
+    (data / 'eo_ma.csv').write_text('EIN,NAME\n1,GIRLS INC\n')
+    return data
+
+
+@pytest.fixture
+def bundle_dir(tmp_path):
+    yield tmp_path / 'bundle'
+    snapshot.activate(None, tmp_path / 'bundle')
+
+
+def test_request_key_sorts_parameters():
+    assert (request_key('get', 'http://host/search?b=2&a=1', {'states[]': ['MA', 'RI']})
+            == 'GET http://host/search?a=1&b=2&states%5B%5D=MA&states%5B%5D=RI')
+
+
+def test_record_then_replay_without_server(data, bundle_dir, tmp_path):
+    (tmp_path / 'recorded').mkdir()
+    (tmp_path / 'replayed').mkdir()
+    with StubServer(data) as server:
+        snapshot.activate('record', bundle_dir)
+        search = server.url('/wgi/platform-api/search/base-search')
+        recorded = requests.get(search, params={'page': 1, 'perPage': 10}).json()
+        url = server.url('/files/eo_ma.csv')
+        download_file(url, tmp_path / 'recorded' / 'eo_ma.csv')
+    assert recorded['data'] == ORGS
+
+    snapshot.activate('replay', bundle_dir)
+    assert requests.get(search, params={'perPage': 10, 'page': 1}).json() == recorded
+    replayed = download_file(url, tmp_path / 'replayed' / 'eo_ma.csv')
+    assert replayed.read_text() == 'EIN,NAME\n1,GIRLS INC\n'
+    assert load_manifest(replayed.parent)[url]['size'] == replayed.stat().st_size
+    with pytest.raises(SnapshotMiss):
+        requests.get(server.url('/irs/soi'))
+
+
+def test_replay_answers_conditional_requests(data, bundle_dir):
+    with StubServer(data) as server:
+        snapshot.activate('record', bundle_dir)
+        url = server.url('/files/eo_ma.csv')
+        etag = requests.get(url).headers['ETag']
+    snapshot.activate('replay', bundle_dir)
+    assert requests.get(url, headers={'If-None-Match': etag}).status_code == 304
+    assert requests.get(url, headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_bodies_recorded_by_another_client(bundle_dir):
+    snapshot.activate('record', bundle_dir)
+    snapshot.record_body('GET', 'http://host/organization/1', {'full': 'true'}, 200,
+                         {'Content-Type': 'application/json'}, b'{"ein": "042103580"}')
+    snapshot.activate('replay', bundle_dir)
+    assert snapshot.replay_body('GET', 'http://host/organization/1?full=true') == b'{"ein": "042103580"}'
+    with pytest.raises(SnapshotMiss):
+        snapshot.replay_body('GET', 'http://host/organization/2')
+
+
+def test_decoded_bodies_keep_a_matching_content_length(tmp_path):
+    bundle = Bundle(tmp_path)
+    bundle.create()
+    body = bundle.put_body([b'x' * 100])
+    bundle.put('GET http://host/a', 'http://host/a', 200, 'OK',
+               {'Content-Encoding': 'gzip', 'Content-Length': '20', 'ETag': '"1"'}, body)
+    bundle.put('HEAD http://host/a', 'http://host/a', 200, 'OK',
+               {'Content-Encoding': 'gzip', 'Content-Length': '20'}, bundle.put_body([b'']))
+    assert bundle.get('GET http://host/a')['headers'] == {'Content-Length': '100', 'ETag': '"1"'}
+    assert bundle.get('HEAD http://host/a')['headers'] == {}
+
+
+def test_bundle_of_another_format_is_refused(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        snapshot.activate('replay', tmp_path)
+    (tmp_path / 'bundle.json').write_text(json.dumps({'format': snapshot.FORMAT_VERSION + 1}))
+    with pytest.raises(ValueError, match='format'):
+        snapshot.activate('replay', tmp_path)
+    assert snapshot.mode is None
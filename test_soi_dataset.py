@@ -0,0 +1,56 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from soi_dataset import SoiDataset, build_dataset, write_partitions
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    extracts = tmp_path / 'extracts'
+    extracts.mkdir()
+    pd.DataFrame({'ein': ['04-2000003', '042000001', '042000002'], 'tax_pd': ['202012', '', '202106'],
+                  'totcntrbgfts': [300, 100, 200], 'totrevenue': [3, 1, 2]}
+                 ).to_csv(extracts / 'Form 990 Extract (2021).csv', index=False)
+    pd.DataFrame({'EIN': [42000001, 42000004], 'taxpd': [202112, 202112], 'totcntrbs': [10, 40]}
+                 ).to_csv(extracts / 'Form 990-EZ Extract (2022).csv', index=False)
+    return build_dataset(sorted(extracts.glob('*.csv')), root=tmp_path / 'dataset')
+
+
+def test_partitions_are_sorted_by_ein(dataset):
+    for part in sorted(dataset.root.glob('year=*/form=*/part-*.parquet')):
+        eins = pq.read_table(part, columns=['EIN'])['EIN'].to_pylist()
+        assert eins == sorted(eins)
+    assert sorted(p.relative_to(dataset.root).parent.as_posix()
+                  for p in dataset.root.glob('*/*/part-*.parquet')) == ['year=2021/form=990', 'year=2022/form=990-EZ']
+
+
+def test_columns_of_every_form(dataset):
+    df = dataset.to_pandas().sort_values(['year', 'EIN'], ignore_index=True)
+    assert df['EIN'].tolist() == [42000001, 42000002, 42000003, 42000001, 42000004]
+    # a blank tax period stays missing, columns of the other form are <NA>
+    assert str(df['tax_pd'].dtype) == 'Int32' and pd.isna(df['tax_pd'][0]) and df['tax_pd'][1] == 202106
+    assert df['totcntrbs'].isna().tolist() == [True, True, True, False, False]
+    assert df['form'].tolist() == ['990', '990', '990', '990-EZ', '990-EZ']
+
+
+def test_filters(dataset):
+    df = dataset.select(['EIN', 'totcntrbgfts', 'year']).where(eins=['04-2000002', '042000001']).to_pandas()
+    assert list(df.columns) == ['EIN', 'totcntrbgfts', 'year']
+    assert sorted(zip(df['EIN'], df['year'])) == [(42000001, 2021), (42000001, 2022), (42000002, 2021)]
+    assert dataset.years(2022).to_pandas()['EIN'].tolist() == [42000001, 42000004]
+    assert dataset.forms('990').where(eins=[42000004]).to_pandas().empty
+    assert len(dataset.years(2021).forms('990').to_pandas()) == 3
+    with pytest.raises(ValueError, match='No column'):
+        dataset.select(['revenue']).to_pandas()
+    with pytest.raises(FileNotFoundError):
+        SoiDataset(dataset.root / 'none').to_pandas()
+
+
+def test_partitions_are_rewritten_only_when_the_extract_changes(dataset, tmp_path):
+    src = tmp_path / 'extracts' / 'Form 990 Extract (2021).csv'
+    part = next((dataset.root / 'year=2021' / 'form=990').glob('part-*.parquet'))
+    mtime = part.stat().st_mtime_ns
+    write_partitions(src, dataset.root)
+    assert part.stat().st_mtime_ns == mtime
+    write_partitions(src, dataset.root, force=True)
+    assert part.stat().st_mtime_ns != mtime
@@ -0,0 +1,101 @@
+import pandas as pd
+import pytest
+import tec
+import xlsx_reader
+from benchmarks.synthetic import write_xlsx
+from config import Config
+from tec import latest_filings, zip_parts
+from xlsx_reader import CHUNK_BYTES, PENDING_PER_WORKER
+
+
+def test_latest_filings_keeps_the_latest_return_of_each_ein():
+    df = pd.DataFrame({'EIN': [1, 2, 1, 1, 3],
+                       'tax_pd': pd.array([202012, 202106, 202112, None, None], dtype='Int32'),
+                       'totcntrbs': [10, 20, 30, 40, 50]})
+    latest = latest_filings(df).sort_values('EIN')
+    assert latest['EIN'].tolist() == [1, 2, 3]
+    # a return without a tax period does not replace a dated one
+    assert latest['totcntrbs'].tolist() == [30, 20, 50]
+
+
+def test_latest_filings_without_duplicates_keeps_every_row():
+    df = pd.DataFrame({'EIN': [3, 1, 2], 'tax_pd': [202012, 202012, 202012]})
+    assert sorted(latest_filings(df)['EIN']) == [1, 2, 3]
+
+
+def test_zip_parts_are_zero_padded_strings():
+    df = pd.DataFrame({'EIN': [1, 2], 'STATE': ['MA', 'MA'],
+                       'ZIP5': pd.array([2134, 1002], dtype='UInt32'),
+                       'ZIP4': pd.array([12, None], dtype='UInt16')})
+    parts = zip_parts(df)
+    assert list(parts.columns) == ['EIN', 'STATE', 'ZIP_PART_1', 'ZIP_PART_2']
+    assert parts['ZIP_PART_1'].tolist() == ['02134', '01002']
+    assert parts['ZIP_PART_2'][0] == '0012' and pd.isna(parts['ZIP_PART_2'][1])
+
+
+@pytest.mark.parametrize('max_memory', [8 * 2**20, 64 * 2**20, 512 * 2**20])
+def test_xlsx_blocks_fit_the_memory_budget(max_memory, monkeypatch, tmp_path):
+    monkeypatch.setattr(tec, 'config', Config(root=tmp_path, max_memory=max_memory))
+    workers, chunk_bytes = tec.xlsx_blocks(8)
+    held = tec.XLSX_BLOCK_COST * chunk_bytes * (PENDING_PER_WORKER * workers + 1)
+    assert 1 <= workers <= 8
+    assert held <= max_memory or (workers == 1 and chunk_bytes == tec.MIN_XLSX_CHUNK_BYTES)
+    monkeypatch.setattr(tec, 'config', Config(root=tmp_path))
+    assert tec.xlsx_blocks(8) == (8, CHUNK_BYTES)
+
+
+def test_soi_cache_reads_the_xlsx_within_the_budget(monkeypatch, tmp_path):
+    src = write_xlsx(pd.DataFrame({'ein': [3, 1, 2], 'tax_pd': [202012, 202012, 202106],
+                                   'totcntrbgfts': [30, 10, 20]}),
+                     tmp_path / 'Form 990 Extract XLSX (2021).xlsx')
+    monkeypatch.setattr(tec, 'config', Config(root=tmp_path, max_memory=8 * 2**20))
+    calls = []
+    iter_xlsx = xlsx_reader.iter_xlsx
+
+    def spy(*args, **kwargs):
+        calls.append(kwargs)
+        return iter_xlsx(*args, **kwargs)
+
+    monkeypatch.setattr(xlsx_reader, 'iter_xlsx', spy)
+    cache = tec.build_soi_cache(src, tec.SOI_CACHE_COLUMNS['Form 990 Extract'])
+    assert (calls[0]['workers'], calls[0]['chunk_bytes']) == tec.xlsx_blocks()
+    assert pd.read_parquet(cache)['totcntrbgfts'].sum() == 60
+
+
+def test_nested_pools_split_the_budget(monkeypatch, tmp_path):
+    monkeypatch.setattr(tec, 'config', Config(root=tmp_path, cpus=8, max_memory=2**30))
+    year = tec.worker_config(3)
+    assert (year.cpus, year.max_memory) == (2, 2**30 // 3)
+    monkeypatch.setattr(tec, 'config', year)
+    conversion = tec.worker_config(2)
+    assert (conversion.cpus, conversion.max_memory) == (1, 2**30 // 6)
+    monkeypatch.setattr(tec, 'config', conversion)
+    assert tec.xlsx_blocks()[0] == 1
+
+
+def test_soi_cache_keeps_blank_tax_periods_missing(monkeypatch, tmp_path):
+    monkeypatch.setattr(tec, 'config', Config(root=tmp_path))
+    src = tmp_path / 'Form 990 Extract (2021).csv'
+    pd.DataFrame({'ein': [1, 1, 2, 2], 'tax_pd': ['202012', '', '', '202106'],
+                  'totcntrbgfts': [10, 20, 30, 40]}).to_csv(src, index=False)
+    cache = tec.build_soi_cache(src, tec.SOI_CACHE_COLUMNS['Form 990 Extract'])
+    df = pd.read_parquet(cache).sort_values('EIN', ignore_index=True)
+    # the dated return wins over the blank one, whatever their order
+    assert str(df['tax_pd'].dtype) == 'Int32'
+    assert df['tax_pd'].tolist() == [202012, 202106]
+    assert df['totcntrbgfts'].tolist() == [10, 40]
+
+
+def test_soi_cache_of_an_older_layout_is_rebuilt(monkeypatch, tmp_path):
+    monkeypatch.setattr(tec, 'config', Config(root=tmp_path))
+    src = tmp_path / 'Form 990 Extract (2021).csv'
+    pd.DataFrame({'ein': [1], 'tax_pd': [''], 'totcntrbgfts': [10]}).to_csv(src, index=False)
+    cache = src.with_suffix('.parquet')
+    # blank tax periods were written as 0 in an int32 column
+    pd.DataFrame({'EIN': pd.Series([1], dtype='uint32'), 'tax_pd': pd.Series([0], dtype='int32'),
+                  'totcntrbgfts': [10]}).to_parquet(cache, index=False)
+    tec.build_soi_cache(src, tec.SOI_CACHE_COLUMNS['Form 990 Extract'])
+    assert pd.read_parquet(cache)['tax_pd'].isna().all()
+    mtime = cache.stat().st_mtime_ns
+    tec.build_soi_cache(src, tec.SOI_CACHE_COLUMNS['Form 990 Extract'])
+    assert cache.stat().st_mtime_ns == mtime
@@ -0,0 +1,77 @@
+import json
+import asyncio
+import aiohttp
+import pytest
+from benchmarks.stub_server import StubServer
+from wgi_client import WgiClient, iter_orgs, resolve_eins
+
+ORGS = [{'organizationId': i, 'name': f'ORG {i}', 'ein': f'04{i:07d}'} for i in range(1, 26)]
+
+
+@pytest.fixture
+def data(tmp_path):
+    (tmp_path / 'wgi_orgs.json').write_text(json.dumps(ORGS))
+    return tmp_path
+
+
+def searches(server):
+    return [path for path in server.requests if 'base-search' in path]
+
+
+@pytest.mark.parametrize('options, pages', [
+    # 10 per page asked, the server sends 7: 4 pages up to the total
+    ({'page_cap': 7}, 4),
+    # no total, the listing ends on the empty page after the last
+    ({'send_total': False}, 4),
+    ({'page_cap': 7, 'send_total': False}, 5),
+    # the server always sends the first page
+    ({'ignore_page': True, 'send_total': False}, 2),
+])
+def test_iter_orgs_reads_every_page_once(data, options, pages):
+    with StubServer(data, **options) as server:
+        orgs = list(iter_orgs('MA', per_page=10, api_base=server.url('/wgi/platform-api/')))
+    expected = ORGS[:10] if options.get('ignore_page') else ORGS
+    assert orgs == expected
+    assert len(searches(server)) == pages
+
+
+
+def org_path(org_id):
+    return f'/wgi/platform-api/organization/{org_id}'
+
+
+def resolve(server, org_ids, cache_file):
+    return resolve_eins(org_ids, cache_file, api_base=server.url('/wgi/platform-api/'), backoff=0)
+
+
+def test_throttled_request_is_retried(data, tmp_path):
+    with StubServer(data, failures={org_path(1): [429, 503]}) as server:
+        eins = resolve(server, [1, 2], tmp_path / 'eins.sqlite')
+    assert eins == {1: '040000001', 2: '040000002'}
+    assert server.requests.count(org_path(1)) == 3
+
+
+def test_cached_eins_are_not_requested_again(data, tmp_path):
+    with StubServer(data) as server:
+        first = resolve(server, [1, 2], tmp_path / 'eins.sqlite')
+        count = len(server.requests)
+        second = resolve(server, ['1', '2'], tmp_path / 'eins.sqlite')
+    assert {str(org_id): ein for org_id, ein in first.items()} == second
+    assert len(server.requests) == count
+
+
+def test_permanent_errors_are_raised_and_not_cached(data, tmp_path):
+    async def get_org(api_base, org_id):
+        async with WgiClient(api_base=api_base, backoff=0) as client:
+            return await client.get_org(org_id)
+
+    with StubServer(data, failures={org_path(2): [403, 403]}) as server:
+        api_base = server.url('/wgi/platform-api/')
+        with pytest.raises(aiohttp.ClientResponseError) as error:
+            asyncio.run(get_org(api_base, 99))
+        assert error.value.status == 404
+        # organizations that failed are left out and asked for on the next run
+        assert resolve(server, [1, 2, 99], tmp_path / 'eins.sqlite') == {1: '040000001'}
+        assert resolve(server, [2, 99], tmp_path / 'eins.sqlite') == {}
+    assert server.requests.count(org_path(99)) == 3
+    assert server.requests.count(org_path(2)) == 2
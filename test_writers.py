@@ -0,0 +1,40 @@
+import importlib.util
+import pandas as pd
+import pytest
+from writers import FORMATS, get_format
+
+
+@pytest.fixture
+def report():
+    return pd.DataFrame({
+        'EIN': [42103580, 10000001],
+        'NAME': ['GIRLS INC', 'WOMENS FUND'],
+        'ZIP_PART_1': pd.array(['02108', '01103'], dtype='string'),
+        'ZIP_PART_2': pd.array(['0001', None], dtype='string'),
+        'totcntrbgfts': pd.array([1500, None], dtype='Int64'),
+        'totcntrbs': pd.array([None, 2**40], dtype='Int64'),
+    })
+
+
+@pytest.mark.parametrize('name', [
+    'csv',
+    'csv.gz',
+    pytest.param('csv.zst', marks=pytest.mark.skipif(importlib.util.find_spec('zstandard') is None,
+                                                     reason='zstandard is not installed')),
+    'parquet',
+])
+def test_round_trip(report, name, tmp_path):
+    report_format = get_format(name)
+    path = tmp_path / f'report{report_format.suffix}'
+    report_format.write(report, path)
+    read = report_format.read(path)
+    pd.testing.assert_frame_equal(read, report)
+    assert read['ZIP_PART_1'].tolist() == ['02108', '01103']
+    columns = report_format.read(path, columns=['ZIP_PART_1', 'totcntrbs'])
+    pd.testing.assert_frame_equal(columns, report[['ZIP_PART_1', 'totcntrbs']])
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError, match='Unknown report format'):
+        get_format('xlsx')
+    assert set(FORMATS) == {'csv', 'csv.gz', 'csv.zst', 'parquet'}
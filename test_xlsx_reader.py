@@ -0,0 +1,73 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.synthetic import write_xlsx
+import xlsx_reader
+from xlsx_reader import iter_xlsx, read_rows, read_xlsx
+
+KEY_LIST = Path(__file__).parent / 'input_files' / 'V2_April_22_WSO_GSO_MA.xlsx'
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 3000
+    df = pd.DataFrame({
+        'EIN': rng.integers(10**7, 10**9, n),
+        'NAME': [f'ORG {i} & CO <{i % 7}>' for i in range(n)],
+        'totcntrbs': rng.integers(-10**6, 10**9, n),
+        'ratio': rng.random(n).round(3),
+    })
+    return write_xlsx(df, tmp_path / 'sheet.xlsx'), df
+
+
+def test_read_xlsx(sheet):
+    path, df = sheet
+    read = read_xlsx(path, workers=1)
+    assert read['EIN'].tolist() == df['EIN'].tolist()
+    assert read['NAME'].tolist() == df['NAME'].tolist()
+    assert read['totcntrbs'].tolist() == df['totcntrbs'].tolist()
+    assert np.allclose(read['ratio'].to_numpy(dtype=float), df['ratio'])
+    assert list(read_xlsx(path, ['NAME', 'EIN'], workers=1).columns) == ['EIN', 'NAME']
+    with pytest.raises(ValueError, match='no column'):
+        read_xlsx(path, ['revenue'], workers=1)
+
+
+def test_multi_block_equals_single_process(sheet):
+    path, _ = sheet
+    single = pd.concat(iter_xlsx(path, workers=1), ignore_index=True)
+    blocks = list(iter_xlsx(path, workers=2, chunk_bytes=2**14))
+    assert len(blocks) > 1
+    pd.testing.assert_frame_equal(pd.concat(blocks, ignore_index=True), single)
+
+
+def test_read_rows(sheet):
+    path, df = sheet
+    rows = read_rows(path, 2)
+    assert rows[0] == ['EIN', 'NAME', 'totcntrbs', 'ratio']
+    assert rows[1][:2] == [str(df['EIN'][0]), df['NAME'][0]]
+
+
+@pytest.mark.skipif(not KEY_LIST.exists(), reason='no key list in input_files')
+def test_header_of_the_key_list():
+    header = read_rows(KEY_LIST, 1)[0]
+    assert header[:6] == ['wgiCat', 'EIN', 'Name', 'Subsector', 'Form', 'Year']
+
+
+def test_blocks_in_flight_are_bounded(sheet, monkeypatch):
+    path, _ = sheet
+    produced = []
+    row_blocks = xlsx_reader.row_blocks
+
+    def counting_blocks(*args, **kwargs):
+        for block in row_blocks(*args, **kwargs):
+            produced.append(block)
+            yield block
+
+    monkeypatch.setattr(xlsx_reader, 'row_blocks', counting_blocks)
+    in_flight = []
+    for consumed, _ in enumerate(iter_xlsx(path, workers=2, chunk_bytes=2**12), 1):
+        in_flight.append(len(produced) - consumed)
+    assert len(produced) > 10
+    assert max(in_flight) <= xlsx_reader.PENDING_PER_WORKER * 2
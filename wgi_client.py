@@ -0,0 +1,202 @@
+import json
+import math
+import time
+import random
+import sqlite3
+import asyncio
+import aiohttp
+import requests
+from tqdm import tqdm
+import snapshot
+
+
+WGI_API_BASE = 'https://wgi.communityplatform.us/platform-api/'
+# HTTP statuses worth retrying with backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# pages read by iter_orgs when the response has no total
+MAX_ORG_PAGES = 1000
+
+
+def iter_orgs(state, per_page=1000, api_base=WGI_API_BASE):
+    """Yield the organizations of a state from the base-search endpoint, one page at a time
+
+    Only one page is held in memory, so states with more organizations than
+    fit in a single response are returned in full. A page shorter than
+    `per_page` does not end the listing, the server may cap the page size:
+    pages are read until the `total` of the response is reached, or until an
+    empty page when the response has no total. The listing also ends on a page
+    that starts like the previous one (a server ignoring `page`), and after
+    ceil(total / size of the first page) pages, or MAX_ORG_PAGES without a total.
+    """
+    # https://wgi.communityplatform.us/platform-api/search/base-search?page=1&perPage=10000&orderBy=revenue&keywordType=all&resultType=all&states[]=MA
+    params = {'perPage': per_page, 'orderBy': 'revenue', 'keywordType': 'all',
+              'resultType': 'all', 'states[]': state}
+    with requests.Session() as session:
+        page, count, last_page, first = 1, 0, MAX_ORG_PAGES, None
+        while page <= last_page:
+            r = session.get(f'{api_base}search/base-search', params={'page': page, **params})
+            r.raise_for_status()
+            body = r.json()
+            orgs = body['data']
+            if not orgs or orgs[0] == first:
+                return
+            yield from orgs
+            count += len(orgs)
+            total = body.get('total')
+            if total is not None:
+                if count >= int(total):
+                    return
+                if page == 1:
+                    last_page = min(last_page, math.ceil(int(total) / len(orgs)))
+            first = orgs[0]
+            page += 1
+    print(f'Stopped listing the organizations of {state} after {last_page} pages, {count} read')
+
+
+class EinCache:
+    """organizationId -> EIN pairs resolved on earlier runs, stored in SQLite"""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS org_ein (organization_id TEXT PRIMARY KEY, ein TEXT)')
+
+    def get_many(self, org_ids):
+        org_ids = [str(org_id) for org_id in org_ids]
+        found = {}
+        # stay below SQLite's bound parameter limit
+        for i in range(0, len(org_ids), 500):
+            batch = org_ids[i:i + 500]
+            rows = self.conn.execute(
+                f'SELECT organization_id, ein FROM org_ein WHERE organization_id IN ({",".join("?" * len(batch))})',
+                batch)
+            found.update(rows)
+        return found
+
+    def put_many(self, pairs):
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO org_ein VALUES (?, ?)',
+                                  [(str(org_id), ein) for org_id, ein in pairs.items()])
+
+    def close(self):
+        self.conn.close()
+
+
+class RateLimiter:
+    """Space requests at least 1 / `rate` seconds apart"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = 0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class WgiClient:
+    """Async client for the WGI platform-api
+
+    All requests share one pooled session. At most `concurrency` requests are
+    in flight and at most `rate` are started per second. 429 and 5xx responses
+    and connection errors are retried `retries` times with exponential backoff
+    starting at `backoff` seconds.
+
+    `api_base` can point to a local stand-in of the platform-api.
+    """
+
+    def __init__(self, api_base=WGI_API_BASE, concurrency=20, rate=20, retries=5, backoff=0.5, timeout=60):
+        self.api_base = api_base
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.limiter = RateLimiter(self.rate)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def get_json(self, path, params=None):
+        url = f'{self.api_base}{path}'
+        if snapshot.mode == 'replay':
+            return json.loads(snapshot.replay_body('GET', url, params))
+        for attempt in range(self.retries + 1):
+            await self.limiter.wait()
+            try:
+                async with self.semaphore, self.session.get(url, params=params) as r:
+                    if r.status not in RETRY_STATUSES:
+                        r.raise_for_status()
+                        body = await r.read()
+                        if snapshot.mode == 'record':
+                            snapshot.record_body('GET', url, params, r.status, r.headers, body)
+                        return json.loads(body)
+                    retry_after = r.headers.get('Retry-After')
+                    error = aiohttp.ClientResponseError(r.request_info, r.history, status=r.status)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                retry_after, error = None, e
+            if attempt == self.retries:
+                raise error
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt
+            await asyncio.sleep(delay * random.uniform(1, 1.5))
+
+    async def get_org(self, org_id):
+        # https://wgi.communityplatform.us/platform-api/organization/1776515
+        return await self.get_json(f'organization/{org_id}')
+
+
+async def fetch_eins(org_ids, **client_options):
+    """Fetch the EIN of each organization, organizations that failed are left out"""
+    eins = {}
+    async with WgiClient(**client_options) as client:
+        async def fetch(org_id):
+            try:
+                eins[org_id] = (await client.get_org(org_id))['ein']
+            except (aiohttp.ClientError, asyncio.TimeoutError, snapshot.SnapshotMiss,
+                    ValueError, KeyError, TypeError) as e:
+                print(f'Could not fetch organization {org_id}: {e}')
+
+        tasks = [asyncio.ensure_future(fetch(org_id)) for org_id in org_ids]
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc='Downloading organization data'):
+            await task
+    return eins
+
+
+def resolve_eins(org_ids, cache_file, **client_options):
+    """Map organizationIds to EINs, calling the platform-api only for ids missing from the cache
+
+    Args:
+        org_ids (iterable): WGI organizationIds
+        cache_file (Path): SQLite cache of earlier resolutions
+        client_options: passed to WgiClient (api_base, concurrency, rate, retries, backoff)
+
+    Returns:
+        dict: organizationId -> EIN for every organization that could be resolved
+    """
+    org_ids = list(org_ids)
+    cache = EinCache(cache_file)
+    try:
+        # a recorded snapshot holds every organization, not only those missing from this cache
+        cached = {} if snapshot.mode == 'record' else cache.get_many(org_ids)
+        eins = {org_id: cached[str(org_id)] for org_id in org_ids if str(org_id) in cached}
+        missing = [org_id for org_id in org_ids if org_id not in eins]
+        print(f'EINs of {len(eins)} organizations found in {cache_file}, fetching {len(missing)}')
+        if missing:
+            fetched = asyncio.run(fetch_eins(missing, **client_options))
+            # organizations without an EIN are asked for again on the next run
+            cache.put_many({org_id: ein for org_id, ein in fetched.items() if ein})
+            eins.update(fetched)
+    finally:
+        cache.close()
+    return eins
@@ -0,0 +1,57 @@
+"""Output formats of the reports, selected with --format
+
+    csv        plain CSV, what analysts open in a spreadsheet (default)
+    csv.gz     gzip compressed CSV
+    csv.zst    zstd compressed CSV, written with the zstandard package of requirements.txt
+    parquet    columnar, zstd compressed, keeps the column types
+
+Reports are written without the pandas index.
+"""
+from dataclasses import dataclass
+
+
+# reports keep these contribution columns as nullable integers when read back from CSV
+INTEGER_COLUMNS = {'totcntrbgfts': 'Int64', 'totcntrbs': 'Int64'}
+# and these as strings, '02134' keeps its leading zero
+STRING_COLUMNS = {'ZIP_PART_1': 'string', 'ZIP_PART_2': 'string'}
+
+
+@dataclass(frozen=True)
+class ReportFormat:
+    name: str
+    suffix: str
+    compression: dict = None
+
+    def write(self, df, path):
+        if self.name == 'parquet':
+            df.to_parquet(path, index=False, compression='zstd')
+        else:
+            df.to_csv(path, index=False, compression=self.compression)
+
+    def read(self, path, columns=None):
+        import pandas as pd
+        if self.name == 'parquet':
+            return pd.read_parquet(path, columns=columns)
+        dtypes = {**INTEGER_COLUMNS, **STRING_COLUMNS}
+        return pd.read_csv(path, usecols=columns,
+                           dtype={c: t for c, t in dtypes.items() if columns is None or c in columns})
+
+
+FORMATS = {f.name: f for f in [
+    ReportFormat('csv', '.csv'),
+    ReportFormat('csv.gz', '.csv.gz', {'method': 'gzip', 'compresslevel': 6}),
+    ReportFormat('csv.zst', '.csv.zst', {'method': 'zstd'}),
+    ReportFormat('parquet', '.parquet'),
+]}
+
+
+def get_format(name):
+    """ReportFormat of a --format name, ValueError if unknown or if its compression is not installed"""
+    import importlib.util
+    try:
+        report_format = FORMATS[name]
+    except KeyError:
+        raise ValueError(f'Unknown report format {name}, use one of {", ".join(FORMATS)}')
+    if name == 'csv.zst' and importlib.util.find_spec('zstandard') is None:
+        raise ValueError('Report format csv.zst needs the zstandard package, pip install -r requirements.txt')
+    return report_format
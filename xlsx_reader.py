@@ -0,0 +1,347 @@
+"""Read xlsx sheets straight into DataFrames, in parallel and without an intermediate CSV
+
+An xlsx file is a zip holding the sheet as XML and a table of the strings it
+uses. The sheet is decompressed once and cut into blocks of whole <row>
+elements. Worker processes parse the blocks,
+keep only the requested columns, look up the shared strings and return typed
+columns. Blocks written the way Excel writes them (every cell starting with its
+reference) are scanned for the requested cells with a regular expression, any
+other block is iterparsed:
+
+    header = read_rows('Form 990 Extract XLSX (2021).xlsx', 1)[0]
+    df = read_xlsx('Form 990 Extract XLSX (2021).xlsx', columns=['ein', 'totcntrbgfts'])
+
+Numeric columns come back as int64 (Int64 with missing cells) or float64, the
+others as Python strings. Number formats are not applied, cells are read as
+stored. Only the first sheet is read.
+"""
+import io
+import os
+import re
+import zipfile
+import posixpath
+from collections import deque
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import unescape
+import numpy as np
+import pandas as pd
+from config import pool_context
+
+
+NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+# decompressed sheet XML handed to a worker at a time
+CHUNK_BYTES = 16 * 2**20
+# blocks submitted to each pool worker ahead of the one being yielded, see map_blocks
+PENDING_PER_WORKER = 2
+# cell types holding text, the other cells are numbers
+TEXT_TYPES = {'s', 'inlineStr', 'str', 'b'}
+ROW_NUMBER = re.compile(rb'<row r="(\d+)"')
+CELL_TYPE = re.compile(rb'\bt="(\w+)"')
+VALUE = re.compile(rb'<v>([^<]*)</v>')
+INLINE_TEXT = re.compile(rb'<t[^>]*>([^<]*)</t>')
+
+# column letters -> index, 'A' -> 0
+column_indexes = {}
+# tables of the workbook read by a pool worker, set once per worker process by init_worker
+worker_tables = None
+
+
+@dataclass(frozen=True)
+class Tables:
+    """Workbook parts the cells of a sheet refer to"""
+    # shared strings, cells of type s hold an index into it
+    strings: list
+
+
+def init_worker(tables):
+    global worker_tables
+    worker_tables = tables
+
+
+def in_worker(func, head, rows, kwargs):
+    """Run a block parser in a pool worker with the tables given to its initializer"""
+    return func(head, rows, worker_tables, **kwargs)
+
+
+def column_index(ref):
+    """Index of the column of a cell reference, 'AB12' -> 27"""
+    letters = ref.rstrip('0123456789')
+    if letters not in column_indexes:
+        index = 0
+        for letter in letters:
+            index = index * 26 + ord(letter) - 64
+        column_indexes[letters] = index - 1
+    return column_indexes[letters]
+
+
+def sheet_path(zf):
+    """Path in the zip of the first sheet of the workbook"""
+    try:
+        workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+        rel_id = workbook.find(f'{NS}sheets')[0].get(REL_ID)
+        for rel in ET.fromstring(zf.read('xl/_rels/workbook.xml.rels')):
+            if rel.get('Id') == rel_id:
+                target = rel.get('Target')
+                return target.lstrip('/') if target.startswith('/') else posixpath.normpath(f'xl/{target}')
+    except KeyError:
+        pass
+    return 'xl/worksheets/sheet1.xml'
+
+
+def read_shared_strings(zf):
+    if 'xl/sharedStrings.xml' not in zf.namelist():
+        return []
+    strings = []
+    with zf.open('xl/sharedStrings.xml') as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag == f'{NS}si':
+                strings.append(''.join(t.text or '' for t in elem.iter(f'{NS}t')))
+                elem.clear()
+    return strings
+
+
+def read_tables(zf):
+    return Tables(read_shared_strings(zf))
+
+
+def row_blocks(zf, path, chunk_bytes=CHUNK_BYTES):
+    """Yield the start tag of the worksheet and blocks of whole <row> elements of about `chunk_bytes`"""
+    head = None
+    buffer = b''
+    with zf.open(path) as f:
+        while True:
+            block = f.read(chunk_bytes)
+            buffer += block
+            if head is None:
+                start = buffer.find(b'<sheetData')
+                if start < 0:
+                    if not block:
+                        return
+                    continue
+                head = re.search(rb'<worksheet[^>]*>', buffer).group(0)
+                end = buffer.index(b'>', start) + 1
+                if buffer[end - 2:end] == b'/>':
+                    return
+                buffer = buffer[end:]
+            if not block:
+                rows = buffer[:buffer.find(b'</sheetData>')]
+                if rows.strip():
+                    yield head, rows
+                return
+            cut = buffer.rfind(b'</row>')
+            if cut >= 0:
+                cut += len(b'</row>')
+                yield head, buffer[:cut]
+                buffer = buffer[cut:]
+
+
+def cell_text(raw, cell_type, tables):
+    """Value of a cell from the text of its <v> or inline string, None when it is empty or an error
+
+    Shared strings are looked up in `tables`, numbers stay as written.
+    """
+    if raw is None or cell_type == 'e':
+        return None
+    if cell_type == 's':
+        return tables.strings[int(raw)]
+    return raw
+
+
+def typed(values, text):
+    """Column of a block: strings, or int64 / Int64 / float64 when every cell is a number"""
+    if text:
+        return np.array(values, dtype=object)
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype='float64')
+    finite = np.isfinite(numbers)
+    if np.all(numbers[finite] == np.round(numbers[finite])) and np.all(np.abs(numbers[finite]) < 2**53):
+        ints = np.where(finite, numbers, 0).astype('int64')
+        return ints if finite.all() else pd.arrays.IntegerArray(ints, ~finite)
+    return numbers
+
+
+def column_letters(index):
+    """Letters of a column index, 27 -> 'AB'"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def can_scan(rows):
+    """True when every row and cell of a block starts with its reference, as Excel writes them"""
+    return (b'<c>' not in rows and rows.count(b'<c ') == rows.count(b'<c r="')
+            and rows.count(b'<row ') == rows.count(b'<row r="'))
+
+
+def scan_cells(rows, columns, after_row, tables):
+    """Row numbers and cells of the `columns` of a block, found with a regular expression
+
+    Only the requested cells are extracted, the others are skipped without
+    being parsed, which is much faster than iterparse on wide sheets.
+    """
+    letters = {column_letters(col).encode(): col for col in columns}
+    pattern = re.compile(rb'<c r="(' + b'|'.join(letters) + rb')(\d+)"([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+    row_numbers = np.array(ROW_NUMBER.findall(rows), dtype='int64')
+    row_numbers = row_numbers[row_numbers > after_row]
+    cells = {}
+    for letter, row_number, attributes, inner in pattern.findall(rows):
+        row_number = int(row_number)
+        if row_number <= after_row:
+            continue
+        cell_type = CELL_TYPE.search(attributes)
+        cell_type = cell_type.group(1).decode() if cell_type else None
+        raw = None
+        if inner and cell_type == 'inlineStr':
+            raw = unescape(b''.join(INLINE_TEXT.findall(inner)).decode())
+        elif inner:
+            raw = VALUE.search(inner)
+            raw = unescape(raw.group(1).decode()) if raw else None
+        rows_of, values, text = cells.setdefault(letters[letter], ([], [], [False]))
+        rows_of.append(row_number)
+        values.append(cell_text(raw, cell_type, tables))
+        text[0] = text[0] or cell_type in TEXT_TYPES
+    cells = {col: (np.searchsorted(row_numbers, rows_of), values, text) for col, (rows_of, values, text) in cells.items()}
+    return row_numbers.tolist(), cells
+
+
+def iterparse_cells(head, rows, columns, after_row, tables):
+    """Row numbers and cells of the `columns` (all when None) of a block, any valid sheet XML"""
+    doc = head + b'<sheetData>' + rows + b'</sheetData></worksheet>'
+    row_numbers = []
+    cells = {}
+    row_number = 0
+    for _, row in ET.iterparse(io.BytesIO(doc)):
+        if row.tag != f'{NS}row':
+            continue
+        row_number = int(row.get('r') or row_number + 1)
+        if row_number > after_row:
+            position = len(row_numbers)
+            row_numbers.append(row_number)
+            col = -1
+            for cell in row:
+                ref = cell.get('r')
+                col = column_index(ref) if ref else col + 1
+                if columns is not None and col not in columns:
+                    continue
+                cell_type = cell.get('t')
+                if cell_type == 'inlineStr':
+                    raw = ''.join(t.text or '' for t in cell.iter(f'{NS}t'))
+                else:
+                    value = cell.find(f'{NS}v')
+                    raw = value.text if value is not None else None
+                positions, values, text = cells.setdefault(col, ([], [], [False]))
+                positions.append(position)
+                values.append(cell_text(raw, cell_type, tables))
+                text[0] = text[0] or cell_type in TEXT_TYPES
+        row.clear()
+    return row_numbers, cells
+
+
+def parse_rows(head, rows, tables, columns=None, after_row=0):
+    """Cells of a block of <row> elements as a DataFrame
+
+    Args:
+        head (bytes): start tag of the worksheet, declares the namespaces used in the rows
+        rows (bytes): whole <row> elements
+        tables (Tables): shared strings of the workbook
+        columns (dict): {column index: name} to keep, None for all columns named by their index
+        after_row (int): skip rows numbered up to this one (the header)
+    """
+    if columns is not None and can_scan(rows):
+        row_numbers, cells = scan_cells(rows, columns, after_row, tables)
+    else:
+        row_numbers, cells = iterparse_cells(head, rows, columns, after_row, tables)
+    names = columns if columns is not None else {col: col for col in sorted(cells)}
+    frame = {}
+    for col, name in names.items():
+        positions, values, text = cells.get(col, ([], [], [False]))
+        column = np.full(len(row_numbers), None, dtype=object)
+        column[np.asarray(positions, dtype='int64')] = values
+        frame[name] = typed(column, text[0])
+    return pd.DataFrame(frame, index=pd.Index(row_numbers, name='row'))
+
+
+def text_rows(head, rows, tables, after_row=0):
+    """(row number, {column index: text}) of every <row> of a block"""
+    row_numbers, cells = iterparse_cells(head, rows, None, after_row, tables)
+    values = [{} for _ in row_numbers]
+    for col, (positions, column_values, _) in cells.items():
+        for position, value in zip(positions, column_values):
+            values[position][col] = '' if value is None else value
+    return list(zip(row_numbers, values))
+
+
+def map_blocks(zf, sheet, tables, func, kwargs, workers=None, chunk_bytes=CHUNK_BYTES):
+    """Yield func(head, rows, tables, **kwargs) of each block of the sheet, in order
+
+    Sheets smaller than one block, or workers=1, are parsed in this process.
+    Otherwise the blocks go to a pool of its own, whose workers receive
+    `tables` once from the pool initializer. At most PENDING_PER_WORKER blocks
+    per worker are in flight, so memory grows with workers * chunk_bytes.
+    """
+    blocks = row_blocks(zf, sheet, chunk_bytes)
+    workers = workers or os.cpu_count()
+    if workers == 1 or zf.getinfo(sheet).file_size <= chunk_bytes:
+        for head, rows in blocks:
+            yield func(head, rows, tables, **kwargs)
+        return
+    # blocks are submitted ahead of the one being yielded
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(),
+                             initializer=init_worker, initargs=(tables,)) as pool:
+        pending = deque()
+        for head, rows in blocks:
+            pending.append(pool.submit(in_worker, func, head, rows, kwargs))
+            if len(pending) >= PENDING_PER_WORKER * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def read_rows(path, n):
+    """The first `n` rows of the first sheet as lists of strings, '' for empty cells"""
+    rows = []
+    with zipfile.ZipFile(path) as zf:
+        tables = read_tables(zf)
+        for head, block in row_blocks(zf, sheet_path(zf), chunk_bytes=2**16):
+            for _, values in text_rows(head, block, tables):
+                rows.append([values.get(col, '') for col in range(max(values, default=-1) + 1)])
+            if len(rows) >= n:
+                break
+    return rows[:n]
+
+
+def iter_xlsx(path, columns=None, skiprows=0, workers=None, chunk_bytes=CHUNK_BYTES):
+    """Yield the rows below the header of the first sheet of `path` as DataFrames, one per block, in order
+
+    Args:
+        path (Path): xlsx file
+        columns (list(str)): header names of the columns to read, all by default
+        skiprows (int): rows above the header row
+        workers (int): processes parsing the blocks, one per CPU by default. Sheets
+            smaller than one block are parsed in this process.
+        chunk_bytes (int): decompressed XML per block
+    """
+    with zipfile.ZipFile(path) as zf:
+        sheet = sheet_path(zf)
+        tables = read_tables(zf)
+        head, block = next(row_blocks(zf, sheet, chunk_bytes=2**16))
+        header_row, header = text_rows(head, block, tables)[skiprows]
+        wanted = {col: name for col, name in header.items() if name != '' and (columns is None or name in columns)}
+        missing = set(columns or []) - set(wanted.values())
+        if missing:
+            raise ValueError(f'{os.path.basename(path)} has no column {", ".join(sorted(missing))}')
+        yield from map_blocks(zf, sheet, tables, parse_rows, {'columns': wanted, 'after_row': header_row},
+                              workers, chunk_bytes)
+
+
+def read_xlsx(path, columns=None, skiprows=0, workers=None):
+    """The rows below the header of the first sheet of `path` as one DataFrame, see iter_xlsx"""
+    blocks = list(iter_xlsx(path, columns, skiprows, workers))
+    if not blocks:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(blocks, ignore_index=True)
@@ -1,4 +1,28 @@
 # essex | norfolk |	suffolk | Plymouth | Bristol
+# ZIP5 codes of the Greater Boston Area used by the index, see geography.py for regions and counties
 greater_boston_zipcodes = {
-    1810, 1431, 2019, 2101, 2018, 2031, 1545, 2630, 1812, 1432, 2021, 2102, 2020, 2048, 1583, 1830, 1434, 2025, 2103, 2040, 2334, 1601, 1831, 1450, 2026, 2104, 2041, 2356, 1602, 1832, 1460, 2027, 2105, 2043, 2357, 1603, 1833, 1463, 2030, 2106, 2044, 2375, 1604, 1834, 1464, 2032, 2107, 2045, 2702, 1605, 1835, 1469, 2035, 2108, 2047, 2703, 1606, 1840, 1474, 2038, 2109, 2050, 2712, 1607, 1841, 1701, 2052, 2110, 2051, 2714, 1608, 1842, 1702, 2053, 2111, 2055, 2715, 1609, 1843, 1718, 2054, 2112, 2059, 2717, 1610, 1844, 1719, 2056, 2113, 2060, 2718, 1613, 1845, 1720, 2062, 2114, 2061, 2719, 1614, 1860, 1721, 2067, 2115, 2065, 2720, 1615, 1885, 1730, 2070, 2116, 2066, 2721, 1653, 1899, 1731, 2071, 2117, 2301, 2722, 1654, 1901, 1741, 2072, 2118, 2302, 2723, 1655, 1902, 1742, 2081, 2119, 2303, 2724, 1903, 1746, 2090, 2120, 2304, 2725, 1904, 1748, 2093, 2121, 2305, 2726, 1905, 1749, 2169, 2122, 2324, 2740, 1906, 1752, 2170, 2123, 2325, 2741, 1907, 1754, 2171, 2124, 2327, 2742, 1908, 1760, 2184, 2125, 2330, 2743, 1910, 1770, 2185, 2126, 2331, 2744, 1913, 1773, 2186, 2127, 2332, 2745, 1915, 1775, 2187, 2128, 2333, 2746, 1921, 1776, 2188, 2129, 2337, 2747, 1922, 1778, 2189, 2130, 2338, 2748, 1923, 1801, 2190, 2131, 2339, 2760, 1929, 1803, 2191, 2132, 2340, 2761, 1930, 1821, 2266, 2133, 2341, 2763, 1931, 1824, 2269, 2134, 2344, 2764, 1936, 1826, 2322, 2135, 2345, 2766, 1937, 1827, 2343, 2136, 2346, 2767, 1938, 1850, 2368, 2137, 2347, 2768, 1940, 1851, 2445, 2142, 2348, 2769, 1944, 1852, 2446, 2150, 2349, 2771, 1945, 1854, 2447, 2151, 2350, 2777, 1949, 1862, 2457, 2152, 2351, 2779, 1950, 1863, 2467, 2163, 2355, 2780, 1951, 1864, 2481, 2171, 2358, 2783, 1952, 1867, 2482, 2196, 2359, 2790, 1960, 1876, 2492, 2199, 2360, 2791, 1961, 1879, 2494, 2201, 2361, 1965, 1880, 2762, 2203, 2362, 1966, 1886, 2204, 2364, 1969, 1887, 2205, 2366, 1970, 1890, 2206, 2367, 1971, 1940, 2207, 2370, 1982, 2138, 2208, 2379, 1983, 2139, 2209, 2381, 1984, 2140, 2210, 2382, 1985, 2141, 2211, 2538, 2565, 2142, 2212, 2558, 5501, 2143, 2215, 2571, 5544, 2144, 2216, 2576, 2145, 2217, 2738, 2148, 2222, 2739, 2149, 2228, 2770, 2155, 2241, 2176, 2283, 2180, 2284, 2420, 2293, 2421, 2295, 2451, 2297, 2452, 2298, 2453, 2467, 2458, 2459, 2460, 2461, 2462, 2464, 2465, 2466, 2467, 2468, 2472, 2474, 2476, 2478, 2493
+    1431, 1432, 1434, 1450, 1460, 1463, 1464, 1469, 1474, 1545, 1583, 1601, 1602, 1603, 1604, 1605,
+    1606, 1607, 1608, 1609, 1610, 1613, 1614, 1615, 1653, 1654, 1655, 1701, 1702, 1718, 1719, 1720,
+    1721, 1730, 1731, 1741, 1742, 1746, 1748, 1749, 1752, 1754, 1760, 1770, 1773, 1775, 1776, 1778,
+    1801, 1803, 1810, 1812, 1821, 1824, 1826, 1827, 1830, 1831, 1832, 1833, 1834, 1835, 1840, 1841,
+    1842, 1843, 1844, 1845, 1850, 1851, 1852, 1854, 1860, 1862, 1863, 1864, 1867, 1876, 1879, 1880,
+    1885, 1886, 1887, 1890, 1899, 1901, 1902, 1903, 1904, 1905, 1906, 1907, 1908, 1910, 1913, 1915,
+    1921, 1922, 1923, 1929, 1930, 1931, 1936, 1937, 1938, 1940, 1944, 1945, 1949, 1950, 1951, 1952,
+    1960, 1961, 1965, 1966, 1969, 1970, 1971, 1982, 1983, 1984, 1985, 2018, 2019, 2020, 2021, 2025,
+    2026, 2027, 2030, 2031, 2032, 2035, 2038, 2040, 2041, 2043, 2044, 2045, 2047, 2048, 2050, 2051,
+    2052, 2053, 2054, 2055, 2056, 2059, 2060, 2061, 2062, 2065, 2066, 2067, 2070, 2071, 2072, 2081,
+    2090, 2093, 2101, 2102, 2103, 2104, 2105, 2106, 2107, 2108, 2109, 2110, 2111, 2112, 2113, 2114,
+    2115, 2116, 2117, 2118, 2119, 2120, 2121, 2122, 2123, 2124, 2125, 2126, 2127, 2128, 2129, 2130,
+    2131, 2132, 2133, 2134, 2135, 2136, 2137, 2138, 2139, 2140, 2141, 2142, 2143, 2144, 2145, 2148,
+    2149, 2150, 2151, 2152, 2155, 2163, 2169, 2170, 2171, 2176, 2180, 2184, 2185, 2186, 2187, 2188,
+    2189, 2190, 2191, 2196, 2199, 2201, 2203, 2204, 2205, 2206, 2207, 2208, 2209, 2210, 2211, 2212,
+    2215, 2216, 2217, 2222, 2228, 2241, 2266, 2269, 2283, 2284, 2293, 2295, 2297, 2298, 2301, 2302,
+    2303, 2304, 2305, 2322, 2324, 2325, 2327, 2330, 2331, 2332, 2333, 2334, 2337, 2338, 2339, 2340,
+    2341, 2343, 2344, 2345, 2346, 2347, 2348, 2349, 2350, 2351, 2355, 2356, 2357, 2358, 2359, 2360,
+    2361, 2362, 2364, 2366, 2367, 2368, 2370, 2375, 2379, 2381, 2382, 2420, 2421, 2445, 2446, 2447,
+    2451, 2452, 2453, 2457, 2458, 2459, 2460, 2461, 2462, 2464, 2465, 2466, 2467, 2468, 2472, 2474,
+    2476, 2478, 2481, 2482, 2492, 2493, 2494, 2538, 2558, 2565, 2571, 2576, 2630, 2702, 2703, 2712,
+    2714, 2715, 2717, 2718, 2719, 2720, 2721, 2722, 2723, 2724, 2725, 2726, 2738, 2739, 2740, 2741,
+    2742, 2743, 2744, 2745, 2746, 2747, 2748, 2760, 2761, 2762, 2763, 2764, 2766, 2767, 2768, 2769,
+    2770, 2771, 2777, 2779, 2780, 2783, 2790, 2791, 5501, 5544
 }